@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Flyin' Iris — Card Atlas Builder
+
+Builds a couple's card atlas from the posters in a transcoder output tree
+and records it in the couple config, the way transcode.py, pipeline.py
+and transcode_queue.py do at the end of a run. transcode.sh and
+transcode.ps1 call it once every film is done; run it by hand to build
+the atlas for output transcoded before atlases existed.
+
+The atlas is the card thumbnail (the poster at 25% of the film) of every
+film in the collection grid, which is all but the featured one, laid out
+in one image, at each card width in AVIF, WebP and JPEG:
+{output}/thumbs/cards-{digest}-{width}.{avif,webp,jpg}. The config's
+"card_atlas" records its name, its grid and each film's tile, which
+generate.py turns into the collection grid's markup, so the grid's first
+render needs one image fetch instead of one per film. Films without a
+poster are left out and keep their own card thumbnails. The atlas files'
+checksums are recorded in the transcode journal, so upload.py verifies
+them like any other output.
+
+Usage:
+    python atlas.py -o ./output -c delivery/sample/amanda-boris.json
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import transcode
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build a couple's card atlas from its posters and record it in the couple config."
+    )
+    parser.add_argument(
+        "-o", "--output-dir", default="./output",
+        help="Transcoder output directory (default: ./output)"
+    )
+    parser.add_argument(
+        "-c", "--config", required=True,
+        help="Path to the couple config JSON (the atlas is recorded in it)"
+    )
+    parser.add_argument(
+        "--journal",
+        help=f"Transcode journal the atlas checksums are recorded in (default: <output-dir>/{transcode.JOURNAL_NAME})"
+    )
+    args = parser.parse_args()
+
+    output_dir = os.path.abspath(args.output_dir)
+    if not os.path.isdir(os.path.join(output_dir, transcode.THUMBS_DIR)):
+        print(f"Error: No {transcode.THUMBS_DIR}/ folder in {output_dir}", file=sys.stderr)
+        sys.exit(1)
+    try:
+        journal = transcode.Journal(args.journal or os.path.join(output_dir, transcode.JOURNAL_NAME))
+        atlas = transcode.write_card_atlas(output_dir, args.config, journal)
+    except FileNotFoundError:
+        print(f"Error: Config file not found: {args.config}", file=sys.stderr)
+        sys.exit(1)
+    except json.JSONDecodeError as e:
+        print(f"Error: Config file is not valid JSON: {e}", file=sys.stderr)
+        sys.exit(1)
+    except (transcode.TranscodeError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    if atlas is None:
+        print(f"No card atlas: no poster in {os.path.join(output_dir, transcode.THUMBS_DIR)} "
+              "for a film in the collection grid")
+        return
+    transcode.print_card_atlas(output_dir, atlas)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Flyin' Iris — Batch Generation Benchmark
+
+Generates synthetic couple configs from the sample config and times a full
+--configs-dir batch rebuild with different --jobs worker counts.
+
+Usage:
+    python bench_generate.py
+    python bench_generate.py --couples 500 --jobs 1 2 4 8
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import generate
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DELIVERY_DIR = os.path.dirname(SCRIPT_DIR)
+
+
+def write_synthetic_configs(sample, configs_dir, count):
+    """Write count variations of the sample config into configs_dir."""
+    for i in range(count):
+        config = json.loads(json.dumps(sample))
+        config["slug"] = f"couple-{i:04d}"
+        config["names"] = [f"Partner{i}A", f"Partner{i}B"]
+        for video in config["videos"]:
+            video["title"] = f"{video['title']} #{i}"
+        with open(os.path.join(configs_dir, f"couple-{i:04d}.json"), "w", encoding="utf-8") as f:
+            json.dump(config, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batch page generation across worker counts.")
+    parser.add_argument(
+        "--config", default=os.path.join(DELIVERY_DIR, "sample", "amanda-boris.json"),
+        help="Sample config the synthetic couples are based on"
+    )
+    parser.add_argument(
+        "--couples", type=int, default=500,
+        help="Number of synthetic couple configs (default: 500)"
+    )
+    parser.add_argument(
+        "--jobs", type=int, nargs="+", default=[1, 2, 4, 8],
+        help="Worker counts to compare (default: 1 2 4 8)"
+    )
+    args = parser.parse_args()
+
+    sample = generate.load_config(args.config)
+    templates = generate.load_templates(
+        os.path.join(DELIVERY_DIR, "templates", "couple-page.html"),
+        os.path.join(DELIVERY_DIR, "templates", "manifest.json"),
+        os.path.join(DELIVERY_DIR, "templates", "sw.js"),
+    )
+
+    work_dir = tempfile.mkdtemp(prefix="fi-bench-")
+    try:
+        configs_dir = os.path.join(work_dir, "configs")
+        os.makedirs(configs_dir)
+        write_synthetic_configs(sample, configs_dir, args.couples)
+        config_paths = generate.find_configs(configs_dir)
+
+        print(f"{args.couples} synthetic couples, {os.cpu_count()} CPU core(s)\n")
+        baseline = None
+        for jobs in args.jobs:
+            output_dir = os.path.join(work_dir, f"films-{jobs}")
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                generate.generate_batch(config_paths, templates, output_dir,
+                                        "https://video.flyiniris.com", jobs=jobs)
+            elapsed = time.perf_counter() - started
+            baseline = baseline or elapsed
+            print(f"  --jobs {jobs:<3} {elapsed:7.2f}s  {args.couples / elapsed:8.0f} couples/s  "
+                  f"{baseline / elapsed:5.2f}x")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
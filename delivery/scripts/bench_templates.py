@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Flyin' Iris — Template Render Benchmark
+
+Compares the old per-token str.replace() loop against the compiled
+single-pass renderer in generate.py, using the real couple-page.html
+template and a sample config.
+
+Usage:
+    python bench_templates.py
+    python bench_templates.py --config ../sample/amanda-boris.json --number 2000
+"""
+
+import argparse
+import os
+import timeit
+
+import generate
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DELIVERY_DIR = os.path.dirname(SCRIPT_DIR)
+
+
+def replace_loop(content, tokens):
+    """The original renderer: one full str.replace() per token."""
+    for token, value in tokens.items():
+        content = content.replace(token, value)
+    return content
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark couple page template rendering.")
+    parser.add_argument(
+        "--config", default=os.path.join(DELIVERY_DIR, "sample", "amanda-boris.json"),
+        help="Couple config JSON to render (default: sample/amanda-boris.json)"
+    )
+    parser.add_argument(
+        "--template", default=os.path.join(DELIVERY_DIR, "templates", "couple-page.html"),
+        help="Template to render (default: templates/couple-page.html)"
+    )
+    parser.add_argument(
+        "--number", type=int, default=1000,
+        help="Renders per timing run (default: 1000)"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5,
+        help="Timing runs; the best is reported (default: 5)"
+    )
+    args = parser.parse_args()
+
+    config = generate.load_config(args.config)
+    content = generate.read_file(args.template, "template")
+    tokens = generate.build_tokens(config, "https://video.flyiniris.com")
+    compiled = generate.compile_template(content)
+
+    if replace_loop(content, tokens) != generate.render_template(compiled, tokens):
+        print("Warning: renderers disagree on output for this template/config")
+
+    cases = [
+        ("str.replace loop", lambda: replace_loop(content, tokens)),
+        ("compile + render", lambda: generate.render_template(generate.compile_template(content), tokens)),
+        ("render (precompiled)", lambda: generate.render_template(compiled, tokens)),
+    ]
+
+    print(f"Template: {args.template} ({len(content):,} chars, {len(compiled.slots)} placeholders)")
+    print(f"Best of {args.repeat} x {args.number} renders\n")
+    baseline = None
+    for label, fn in cases:
+        best = min(timeit.repeat(fn, number=args.number, repeat=args.repeat))
+        per_call_us = best / args.number * 1e6
+        baseline = baseline or per_call_us
+        print(f"  {label:<22} {per_call_us:9.1f} us/render  {baseline / per_call_us:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
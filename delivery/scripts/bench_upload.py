@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Flyin' Iris — Upload Benchmark
+
+Uploads a synthetic couple (HLS segments plus one large original) to an
+in-process s3stub.py server with simulated latency and failures, and
+compares throughput and retries across connection counts. Every run checks
+that the stored objects match the local files byte for byte.
+
+Usage:
+    python bench_upload.py
+    python bench_upload.py --segments 2000 --latency-ms 40 --fail-rate 0.02 --workers 1 8 32
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from s3client import S3Client
+from s3stub import StubS3Server
+from upload import MiB, Uploader, collect_items
+
+
+def write_synthetic_tree(root, segments, segment_kb, original_mb):
+    """Write output/ (HLS + thumbs) and originals/ under root; return their paths."""
+    output_dir = os.path.join(root, "output")
+    original_dir = os.path.join(root, "originals")
+    per_rung = max(1, segments // 3)
+    for rung in ("1080p", "720p", "480p"):
+        rung_dir = os.path.join(output_dir, "highlight", rung)
+        os.makedirs(rung_dir)
+        for i in range(per_rung):
+            with open(os.path.join(rung_dir, f"segment{i:03d}.ts"), "wb") as f:
+                f.write(os.urandom(segment_kb * 1024))
+        with open(os.path.join(rung_dir, "playlist.m3u8"), "w") as f:
+            f.write("#EXTM3U\n#EXT-X-ENDLIST\n")
+    os.makedirs(os.path.join(output_dir, "thumbs"))
+    with open(os.path.join(output_dir, "thumbs", "highlight.jpg"), "wb") as f:
+        f.write(os.urandom(200 * 1024))
+    os.makedirs(original_dir)
+    with open(os.path.join(original_dir, "highlight.mp4"), "wb") as f:
+        for _ in range(original_mb):
+            f.write(os.urandom(MiB))
+    return output_dir, original_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark upload.py against a local S3 stub.")
+    parser.add_argument("--segments", type=int, default=600, help="HLS segments in total (default: 600)")
+    parser.add_argument("--segment-kb", type=int, default=256, help="Segment size in KiB (default: 256)")
+    parser.add_argument("--original-mb", type=int, default=128, help="Original MP4 size in MiB (default: 128)")
+    parser.add_argument("--latency-ms", type=float, default=20, help="Stub latency per request (default: 20)")
+    parser.add_argument("--fail-rate", type=float, default=0.02, help="Stub 503 rate (default: 0.02)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16],
+                        help="Connection counts to compare (default: 1 4 16)")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="fi-upload-bench-")
+    try:
+        output_dir, original_dir = write_synthetic_tree(
+            work_dir, args.segments, args.segment_kb, args.original_mb)
+        items = collect_items("bench", output_dir, original_dir, {})
+        total = sum(item.size for item in items)
+        print(f"{len(items)} files, {total / 1e6:.0f} MB; stub latency {args.latency_ms:.0f} ms, "
+              f"fail rate {args.fail_rate:.0%}\n")
+
+        for workers in args.workers:
+            server = StubS3Server(latency=args.latency_ms / 1000, fail_rate=args.fail_rate, seed=workers).start()
+            try:
+                client = S3Client(server.endpoint, "bench", "bench", "fi-films")
+                uploader = Uploader(client, workers=workers, retries=8, part_size=8 * MiB,
+                                    multipart_threshold=32 * MiB, backoff=0.05, progress_interval=None)
+                started = time.perf_counter()
+                _, _, failures = uploader.upload_all(items)
+                elapsed = time.perf_counter() - started
+
+                mismatched = 0
+                for item in items:
+                    stored = server.store.objects.get(("fi-films", item.key))
+                    with open(item.path, "rb") as f:
+                        if stored is None or stored[0] != f.read():
+                            mismatched += 1
+                print(f"  --workers {workers:<3} {elapsed:7.2f}s  {total / elapsed / 1e6:8.1f} MB/s  "
+                      f"{uploader.progress.retries:4d} retries  {len(failures)} failed  "
+                      f"{mismatched} mismatched  ({server.store.requests} requests)")
+            finally:
+                server.stop()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Flyin' Iris — Source Fingerprinter
+
+Content-hashes source MP4s (export folders, originals archives) and caches
+the results in a local SQLite index keyed by path, size and mtime, so a
+repeat scan only hashes files that are new or have changed.
+
+It also caches the results of slow per-source probes (the transcoder's
+complexity probe) by content hash, so they survive renames and moves.
+
+Two modes:
+    full  SHA-256 of the whole file, read through a memory map.
+    fast  SHA-256 of the file size plus the head, the tail and evenly
+          strided chunks in between. Reads a few MB per file regardless of
+          its size; good for spotting duplicates and changed files, not a
+          substitute for the full hash when content must be exact.
+
+Usage:
+    python fingerprint.py ./exports/amanda-boris
+    python fingerprint.py /archive/originals --fast --workers 8
+    python fingerprint.py ./exports/amanda-boris --db ./fingerprints.sqlite3
+"""
+
+import argparse
+import concurrent.futures
+import fnmatch
+import hashlib
+import json
+import mmap
+import os
+import sqlite3
+import sys
+import time
+
+# Slice size fed to hashlib from the memory map; large slices keep the
+# per-call overhead negligible while hashlib releases the GIL.
+MMAP_SLICE = 16 * 1024 * 1024
+
+# Fast mode: bytes read from the head, the tail and each strided sample.
+SAMPLE_CHUNK = 1024 * 1024
+SAMPLE_COUNT = 16
+
+
+def cache_dir():
+    """Return the user cache directory ($XDG_CACHE_HOME/flyiniris or ~/.cache/flyiniris)."""
+    cache = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache, "flyiniris")
+
+
+def default_db_path():
+    """Return the fingerprint index path ($FI_FINGERPRINT_DB or a user cache)."""
+    env = os.environ.get("FI_FINGERPRINT_DB")
+    if env:
+        return env
+    return os.path.join(cache_dir(), "fingerprints.sqlite3")
+
+
+def hash_full(path):
+    """Return the SHA-256 hex digest of the whole file, read via mmap."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return h.hexdigest()  # mmap cannot map an empty file
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                for offset in range(0, size, MMAP_SLICE):
+                    h.update(view[offset:offset + MMAP_SLICE])
+            finally:
+                view.release()
+    return h.hexdigest()
+
+
+def sample_offsets(size, chunk=SAMPLE_CHUNK, count=SAMPLE_COUNT):
+    """Return the offsets fast mode reads: head, strided samples, tail."""
+    if size <= chunk * (count + 2):
+        return [0]  # small enough that fast mode just reads it all
+    stride = (size - chunk) // (count + 1)
+    return [0] + [stride * i for i in range(1, count + 1)] + [size - chunk]
+
+
+def hash_sampled(path, chunk=SAMPLE_CHUNK, count=SAMPLE_COUNT):
+    """Return a fast fingerprint from the file size and sampled chunks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        h.update(f"{size}:".encode("ascii"))
+        offsets = sample_offsets(size, chunk, count)
+        if offsets == [0]:
+            return hash_full(path) if size else h.hexdigest()
+        for offset in offsets:
+            f.seek(offset)
+            h.update(f.read(chunk))
+    return h.hexdigest()
+
+
+HASHERS = {"full": hash_full, "fast": hash_sampled}
+
+
+class FingerprintIndex:
+    """SQLite cache of fingerprints keyed by (path, mode).
+
+    A cached digest is reused only while the file's size and mtime are
+    unchanged. The connection is used from the calling thread only; hashing
+    runs on worker threads and results are written back here.
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or default_db_path()
+        if self.db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprints ("
+            " path TEXT NOT NULL, mode TEXT NOT NULL, size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL, digest TEXT NOT NULL, hashed_at REAL NOT NULL,"
+            " PRIMARY KEY (path, mode))"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS probes ("
+            " digest TEXT NOT NULL, name TEXT NOT NULL, value TEXT NOT NULL, probed_at REAL NOT NULL,"
+            " PRIMARY KEY (digest, name))"
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def lookup(self, path, mode, stat=None):
+        """Return the cached digest for path if size and mtime still match."""
+        stat = stat or os.stat(path)
+        row = self.conn.execute(
+            "SELECT digest FROM fingerprints WHERE path = ? AND mode = ? AND size = ? AND mtime_ns = ?",
+            (os.path.abspath(path), mode, stat.st_size, stat.st_mtime_ns),
+        ).fetchone()
+        return row[0] if row else None
+
+    def store(self, path, mode, stat, digest):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?, ?, ?)",
+            (os.path.abspath(path), mode, stat.st_size, stat.st_mtime_ns, digest, time.time()),
+        )
+
+    def cached_probe(self, digest, name):
+        """Return the stored result of probe `name` for a file's full digest, or None."""
+        row = self.conn.execute("SELECT value FROM probes WHERE digest = ? AND name = ?",
+                                (digest, name)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def store_probe(self, digest, name, value):
+        self.conn.execute("INSERT OR REPLACE INTO probes VALUES (?, ?, ?, ?)",
+                          (digest, name, json.dumps(value), time.time()))
+        self.conn.commit()
+
+    def fingerprint(self, path, mode="full"):
+        """Return the digest for one file, hashing it only on a cache miss."""
+        return self.scan([path], mode)[0][path]
+
+    def scan(self, paths, mode="full", workers=4):
+        """Fingerprint many files, hashing cache misses on a thread pool.
+
+        Returns (digests, hashed) where digests maps each path to its digest
+        and hashed lists the paths that were actually read this time.
+        """
+        hasher = HASHERS[mode]
+        digests = {}
+        misses = []
+        for path in paths:
+            stat = os.stat(path)
+            cached = self.lookup(path, mode, stat)
+            if cached:
+                digests[path] = cached
+            else:
+                misses.append((path, stat))
+
+        if misses:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+                for (path, stat), digest in zip(misses, pool.map(lambda m: hasher(m[0]), misses)):
+                    digests[path] = digest
+                    # Only cache if the file did not change while being hashed
+                    if os.stat(path).st_mtime_ns == stat.st_mtime_ns:
+                        self.store(path, mode, stat, digest)
+            self.conn.commit()
+        return digests, [path for path, _ in misses]
+
+
+def find_files(roots, pattern="*.mp4"):
+    """Return sorted files under each root (recursively) matching pattern."""
+    found = []
+    for root in roots:
+        if os.path.isfile(root):
+            found.append(root)
+            continue
+        for dirpath, _, filenames in os.walk(root):
+            found.extend(os.path.join(dirpath, name)
+                         for name in filenames if fnmatch.fnmatch(name.lower(), pattern.lower()))
+    return sorted(found)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Fingerprint source MP4s and cache the results in a local SQLite index."
+    )
+    parser.add_argument(
+        "paths", nargs="+",
+        help="Directories (scanned recursively) or files to fingerprint"
+    )
+    parser.add_argument(
+        "--fast", action="store_true",
+        help="Sample head, tail and strided chunks instead of hashing whole files"
+    )
+    parser.add_argument(
+        "--pattern", default="*.mp4",
+        help="Filename pattern to include (default: *.mp4)"
+    )
+    parser.add_argument(
+        "--db",
+        help=f"SQLite index path (default: {default_db_path()})"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=4,
+        help="Files hashed concurrently (default: 4)"
+    )
+    args = parser.parse_args()
+
+    for path in args.paths:
+        if not os.path.exists(path):
+            print(f"Error: Path not found: {path}", file=sys.stderr)
+            sys.exit(1)
+
+    files = find_files(args.paths, args.pattern)
+    if not files:
+        print(f"Error: No files matching '{args.pattern}' found", file=sys.stderr)
+        sys.exit(1)
+
+    mode = "fast" if args.fast else "full"
+    started = time.perf_counter()
+    with FingerprintIndex(args.db) as index:
+        digests, hashed = index.scan(files, mode, args.workers)
+    elapsed = time.perf_counter() - started
+
+    hashed_set = set(hashed)
+    total_bytes = 0
+    for path in files:
+        size = os.path.getsize(path)
+        total_bytes += size
+        source = "hashed" if path in hashed_set else "cached"
+        print(f"  {digests[path][:16]}  {size / 1e9:8.2f} GB  {source:<6}  {path}")
+
+    read_bytes = sum(os.path.getsize(path) for path in hashed) if mode == "full" else 0
+    rate = f", {read_bytes / elapsed / 1e9:.2f} GB/s" if read_bytes and elapsed else ""
+    print(f"\n{len(files)} file(s), {total_bytes / 1e9:.2f} GB ({mode} mode): "
+          f"{len(hashed)} hashed, {len(files) - len(hashed)} cached in {elapsed:.2f}s{rate}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,28 +3,83 @@
 Flyin' Iris — Page Generator
 
 Generates a couple's film delivery page from a template and config JSON.
-Replaces {{TOKEN}} placeholders with actual values and writes the output
-to films/{slug}/index.html.
+Templates are compiled once into literal and {{TOKEN}} segments, rendered
+with a single join per couple, and written to films/{slug}/index.html.
 
 Usage:
     python generate.py --config couple.json --template couple-page.html
     python generate.py --config couple.json --template couple-page.html --preview
+    python generate.py --configs-dir delivery/sample --template couple-page.html
+    python generate.py --configs-dir delivery/sample --template couple-page.html --incremental
+    python generate.py --configs-dir delivery/sample --template couple-page.html --jobs 8
+    python generate.py --config couple.json --template couple-page.html --thumbs-dir ./output/thumbs
+    python generate.py --configs-dir configs --template couple-page.html --thumbs-dir ./output/{slug}/thumbs
 """
 
 import argparse
+import collections
+import concurrent.futures
+import glob
+import hashlib
+import html
 import json
 import os
 import re
-import shutil
 import sys
+import time
 import webbrowser
 
+import fingerprint
+
+
+# Matches {{TOKEN}} placeholders in templates.
+PLACEHOLDER_RE = re.compile(r"\{\{[A-Z0-9_]+\}\}")
+
+# Placeholders produced by build_tokens(); keep the two in sync.
+TOKEN_NAMES = frozenset({
+    "{{COUPLE_NAMES}}", "{{NAME_1}}", "{{NAME_2}}", "{{DATE_LONG}}",
+    "{{DATE_SHORT}}", "{{SLUG}}", "{{WORKER_BASE}}", "{{VIDEOS_JSON}}",
+    "{{YEAR}}", "{{COLLECTION_CARDS}}",
+})
+
+# Card thumbnail widths and formats the transcoders write, per film to
+# thumbs/{video_id}/card-{width}.{ext} and per couple to the card atlas
+# thumbs/{atlas name}-{width}.{ext} (transcode.CARD_WIDTHS and
+# CARD_FORMATS; keep them in sync). Sources are listed smallest format
+# first; the JPEG <img> is the fallback.
+CARD_WIDTHS = (320, 480, 640, 960)
+CARD_SOURCE_TYPES = (("avif", "image/avif"), ("webp", "image/webp"))
+CARD_FALLBACK_WIDTH = 640
+
+# Rendered width of a card in the collection grid: one column on phones,
+# two from 640px and three from 1024px, inside the 1200px container with
+# 24px padding and gaps.
+CARD_SLOT_WIDTHS = (
+    ("(min-width: 1200px)", "368px"),
+    ("(min-width: 1024px)", "(100vw - 96px) / 3"),
+    ("(min-width: 640px)", "(100vw - 72px) / 2"),
+    (None, "100vw - 48px"),
+)
+
+# parts interleaves literal text with placeholder strings; slots lists the
+# (index, placeholder) pairs in parts that are filled in at render time.
+CompiledTemplate = collections.namedtuple("CompiledTemplate", ["parts", "slots"])
+
+# --incremental builds keep their manifest in the user cache, one per
+# output directory, so it is never deployed along with the pages.
+BUILD_MANIFEST_DIR = "build-manifests"
+
+
+def parse_config(path):
+    """Parse the couple config JSON at path, raising on I/O or JSON errors."""
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
 
 def load_config(path):
     """Load and return the couple config JSON from the given path."""
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return parse_config(path)
     except FileNotFoundError:
         print(f"Error: Config file not found: {path}", file=sys.stderr)
         sys.exit(1)
@@ -80,6 +135,16 @@ def validate_config(config):
                 if field not in video:
                     errors.append(f"videos[{i}] missing required field: '{field}'")
 
+    # card_atlas (optional; written by the transcoders)
+    if "card_atlas" in config:
+        atlas = config["card_atlas"]
+        if (not isinstance(atlas, dict) or not isinstance(atlas.get("name"), str)
+                or not isinstance(atlas.get("columns"), int) or not isinstance(atlas.get("rows"), int)
+                or not isinstance(atlas.get("offsets"), dict)
+                or not isinstance(atlas.get("formats", []), list)):
+            errors.append("'card_atlas' must be an object with 'name', 'columns', 'rows' and 'offsets' "
+                          "(re-run the transcoder or atlas.py to rebuild it)")
+
     return errors
 
 
@@ -98,6 +163,101 @@ def extract_year(config):
     return ""
 
 
+def collection_videos(videos):
+    """Return the videos of the collection grid: all but the featured one, by order.
+
+    The featured video is the first with "featured" set, else the first
+    one, as the page's script picks it.
+    """
+    featured = next((v for v in videos if v.get("featured")), videos[0])
+    return sorted((v for v in videos if v is not featured), key=lambda v: v["order"])
+
+
+def card_sizes(columns=1):
+    """Return the sizes attribute of an image drawn columns cards wide."""
+    sizes = []
+    for media, width in CARD_SLOT_WIDTHS:
+        if columns > 1:
+            width = f"{columns} * ({width})"
+        size = width if re.fullmatch(r"\d+px", width) else f"calc({width})"
+        sizes.append(f"{media} {size}" if media else size)
+    return ", ".join(sizes)
+
+
+def card_srcset(prefix, ext, columns=1):
+    """Return the srcset of an image drawn columns cards wide, one candidate per card width."""
+    return ", ".join(f"{prefix}-{width}.{ext} {columns * width}w" for width in CARD_WIDTHS)
+
+
+def card_picture(video, worker_base, slug, atlas=None):
+    """Return the lazily loaded <picture> of a film card's thumbnail, from the card atlas if the film is in it."""
+    e = html.escape
+    thumbs = f"{worker_base}/couples/{slug}/thumbs"
+    offset = atlas["offsets"].get(video["id"]) if atlas else None
+    formats = None
+    if offset is None:
+        prefix, columns, rows, style = f"{thumbs}/{video['id']}/card", 1, 1, ""
+    else:
+        # The whole atlas, drawn grid-sized and shifted to the film's tile (the card clips the rest)
+        prefix, columns, rows = f"{thumbs}/{atlas['name']}", atlas["columns"], atlas["rows"]
+        formats = atlas.get("formats")  # an ffmpeg without libaom or libwebp writes fewer
+        style = (f' style="width: {columns * 100}%; height: {rows * 100}%; '
+                 f'left: {-offset[0] * 100}%; top: {-offset[1] * 100}%"')
+    sizes = card_sizes(columns)
+    sources = "".join(
+        f'<source type="{mime}" srcset="{e(card_srcset(prefix, ext, columns))}" sizes="{sizes}">'
+        for ext, mime in CARD_SOURCE_TYPES if formats is None or ext in formats
+    )
+    return (
+        f'<picture>{sources}<img src="{e(prefix)}-{CARD_FALLBACK_WIDTH}.jpg" '
+        f'srcset="{e(card_srcset(prefix, "jpg", columns))}" sizes="{sizes}" '
+        f'width="{columns * CARD_FALLBACK_WIDTH}" height="{rows * CARD_FALLBACK_WIDTH * 9 // 16}"{style} '
+        f'loading="lazy" decoding="async" alt=""></picture>'
+    )
+
+
+def render_card(video, worker_base, slug, atlas=None, placeholder=None):
+    """Return the collection grid markup of one film card, over its placeholder (a data: URI) if any."""
+    e = html.escape
+    style = f' style="background-image: url({e(placeholder)})"' if placeholder else ""
+    return (
+        f'<div class="film-card reveal" data-video-id="{e(video["id"])}" data-video-title="{e(video["title"])}">\n'
+        f'  <div class="film-card-thumb"{style}>\n'
+        f'    {card_picture(video, worker_base, slug, atlas)}\n'
+        f'    <span class="film-card-badge">{e(video["duration"])}</span>\n'
+        f'    <span class="film-card-tag">{e(video["category"])}</span>\n'
+        f'    <div class="film-card-play">\n'
+        f'      <svg viewBox="0 0 24 24"><polygon points="5 3 19 12 5 21 5 3"></polygon></svg>\n'
+        f'    </div>\n'
+        f'  </div>\n'
+        f'  <div class="film-card-body">\n'
+        f'    <p class="film-card-title">{e(video["title"])}</p>\n'
+        f'  </div>\n'
+        f'</div>'
+    )
+
+
+def render_collection(config, worker_base):
+    """Return the collection grid's card markup for a couple."""
+    atlas = config.get("card_atlas")
+    card_placeholders = config.get("card_placeholders", {})
+    cards = [render_card(video, worker_base, config["slug"], atlas, card_placeholders.get(video["id"]))
+             for video in collection_videos(config["videos"])]
+    return "\n".join(cards).replace("\n", "\n        ")
+
+
+def page_videos(config):
+    """Return the videos for the page's VIDEOS_JSON.
+
+    Films in the card atlas carry their tile there as atlas_offset
+    ([column, row]), the same offsets the card markup uses; the film modal
+    shows that tile until the poster loads.
+    """
+    offsets = config.get("card_atlas", {}).get("offsets", {})
+    return [dict(video, atlas_offset=offsets[video["id"]]) if video.get("id") in offsets else video
+            for video in config["videos"]]
+
+
 def build_tokens(config, worker_base):
     """Build the token replacement dictionary from config and args."""
     return {
@@ -108,16 +268,65 @@ def build_tokens(config, worker_base):
         "{{DATE_SHORT}}": config["date_short"],
         "{{SLUG}}": config["slug"],
         "{{WORKER_BASE}}": worker_base,
-        "{{VIDEOS_JSON}}": json.dumps(config["videos"]),
+        "{{VIDEOS_JSON}}": json.dumps(page_videos(config)),
         "{{YEAR}}": extract_year(config),
+        "{{COLLECTION_CARDS}}": render_collection(config, worker_base),
     }
 
 
-def replace_tokens(content, tokens):
-    """Replace all {{TOKEN}} placeholders in the content string."""
-    for token, value in tokens.items():
-        content = content.replace(token, value)
-    return content
+def add_card_placeholders(configs, thumbs_dir, fingerprint_db=None):
+    """Set each config's "card_placeholders" from the posters in thumbs_dir ("{slug}" is the couple's)."""
+    import placeholders  # only builds with --thumbs-dir need it
+
+    with fingerprint.FingerprintIndex(fingerprint_db) as index:
+        for config in configs:
+            couple_thumbs = thumbs_dir.replace("{slug}", config["slug"])
+            if not os.path.isdir(couple_thumbs):
+                print(f"Warning: Thumbs directory not found: {couple_thumbs}; "
+                      f"{config['slug']} gets no card placeholders", file=sys.stderr)
+                continue
+            found = placeholders.card_placeholders([video["id"] for video in config["videos"]],
+                                                   couple_thumbs, index)
+            if found:
+                config["card_placeholders"] = found
+
+
+def compile_template(content):
+    """Split a template once into literal text and placeholder segments."""
+    parts = []
+    slots = []
+    pos = 0
+    for match in PLACEHOLDER_RE.finditer(content):
+        parts.append(content[pos:match.start()])
+        slots.append((len(parts), match.group(0)))
+        parts.append(match.group(0))
+        pos = match.end()
+    parts.append(content[pos:])
+    return CompiledTemplate(tuple(parts), tuple(slots))
+
+
+def render_template(compiled, tokens):
+    """Render a compiled template in a single pass.
+
+    Substituted values are never rescanned, so a value that itself contains
+    {{...}} is emitted verbatim. Placeholders missing from tokens are left
+    as-is.
+    """
+    parts = list(compiled.parts)
+    for index, token in compiled.slots:
+        if token in tokens:
+            parts[index] = tokens[token]
+    return "".join(parts)
+
+
+def check_placeholders(compiled, token_names=TOKEN_NAMES):
+    """Return (unknown, unused) placeholder lists for a compiled template.
+
+    unknown are placeholders in the template with no token to fill them;
+    unused are tokens that never appear in the template.
+    """
+    used = {token for _, token in compiled.slots}
+    return sorted(used - token_names), sorted(token_names - used)
 
 
 def read_file(path, description="file"):
@@ -144,14 +353,281 @@ def write_file(path, content, description="file"):
         sys.exit(1)
 
 
+def load_templates(template_path, manifest_path=None, sw_path=None):
+    """Read and compile the page, manifest and service worker templates once.
+
+    Returns a dict keyed by output filename. Optional templates that were
+    not requested are omitted, so callers can iterate it directly. sw.js
+    carries no tokens and is kept as a plain string.
+    """
+    templates = {"index.html": compile_template(read_file(template_path, "template"))}
+    if manifest_path:
+        templates["manifest.json"] = compile_template(
+            read_file(manifest_path, "manifest template"))
+    if sw_path:
+        templates["sw.js"] = read_file(sw_path, "service worker")
+    return templates
+
+
+def report_placeholders(templates, show_unused=False):
+    """Print unknown placeholders, and optionally tokens a template never uses.
+
+    Returns the number of unknown placeholders found across all templates.
+    """
+    unknown_count = 0
+    for name, compiled in templates.items():
+        if not isinstance(compiled, CompiledTemplate):
+            continue
+        unknown, unused = check_placeholders(compiled)
+        unknown_count += len(unknown)
+        if unknown:
+            print(f"Warning: {name} has unknown placeholder(s): {', '.join(unknown)}",
+                  file=sys.stderr)
+        if show_unused and unused:
+            print(f"  {name} never uses token(s): {', '.join(unused)}")
+    return unknown_count
+
+
+def render_pages(config, templates, worker_base):
+    """Render every output file for one couple.
+
+    Returns a dict of {output filename: content}.
+    """
+    tokens = build_tokens(config, worker_base)
+    pages = {}
+    for name, compiled in templates.items():
+        if isinstance(compiled, CompiledTemplate):
+            pages[name] = render_template(compiled, tokens)
+        else:
+            pages[name] = compiled
+    return pages
+
+
+def write_pages(out_dir, pages):
+    """Write rendered pages into out_dir and return the written paths."""
+    written = []
+    for name, content in pages.items():
+        path = os.path.join(out_dir, name)
+        write_file(path, content, name)
+        written.append(path)
+    return written
+
+
+def file_matches(path, content):
+    """Return True if the file at path already holds exactly content."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read() == content
+    except (OSError, UnicodeDecodeError):
+        return False
+
+
+def inputs_digest(templates, worker_base):
+    """Hash everything shared by all couples that affects the output, this script included."""
+    h = hashlib.sha256()
+    with open(os.path.abspath(__file__), "rb") as f:
+        h.update(f.read())
+    for name in sorted(templates):
+        compiled = templates[name]
+        content = "".join(compiled.parts) if isinstance(compiled, CompiledTemplate) else compiled
+        h.update(f"\0{name}\0{content}".encode("utf-8"))
+    h.update(f"\0worker_base\0{worker_base}".encode("utf-8"))
+    return h.hexdigest()
+
+
+def couple_digest(base_digest, config):
+    """Combine the shared inputs digest with one couple's config."""
+    # Key order is kept as-is: VIDEOS_JSON serializes it, so it changes the output
+    payload = json.dumps(config, ensure_ascii=False)
+    return hashlib.sha256(f"{base_digest}\0{payload}".encode("utf-8")).hexdigest()
+
+
+def default_build_manifest_path(output_dir):
+    """Return the cached build manifest path for output_dir."""
+    key = hashlib.sha256(os.path.abspath(output_dir).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(fingerprint.cache_dir(), BUILD_MANIFEST_DIR, f"{key}.json")
+
+
+def load_build_manifest(path):
+    """Return the {slug: entry} map from a build manifest, or {} if absent."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            couples = json.load(f).get("couples", {})
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError, AttributeError) as e:
+        print(f"Warning: Ignoring unreadable build manifest {path}: {e}", file=sys.stderr)
+        return {}
+    return couples if isinstance(couples, dict) else {}
+
+
+def save_build_manifest(path, couples):
+    """Write the build manifest with couples sorted by slug."""
+    content = json.dumps({"version": 1, "couples": couples}, indent=2, sort_keys=True) + "\n"
+    if not file_matches(path, content):
+        write_file(path, content, "build manifest")
+
+
+def build_couple(config, templates, output_dir, worker_base,
+                 base_digest=None, build_manifest=None):
+    """Render and write one couple's pages.
+
+    When build_manifest is given (incremental mode), a couple whose inputs
+    digest matches its manifest entry is skipped without rendering, and
+    rendered files that are byte-identical on disk are not rewritten, so
+    their mtimes stay put. The manifest entry is updated in place.
+
+    Returns (status, written paths, total files) where status is one of
+    "written", "rebuilt", "unchanged" or "skipped".
+    """
+    slug = config["slug"]
+    out_dir = os.path.join(output_dir, slug)
+    if build_manifest is None:
+        pages = render_pages(config, templates, worker_base)
+        return "written", write_pages(out_dir, pages), len(pages)
+
+    digest = couple_digest(base_digest, config)
+    entry = build_manifest.get(slug)
+    if (isinstance(entry, dict) and entry.get("digest") == digest
+            and all(os.path.isfile(os.path.join(out_dir, name)) for name in entry.get("files", []))):
+        return "skipped", [], len(templates)
+
+    pages = render_pages(config, templates, worker_base)
+    changed = {name: content for name, content in pages.items()
+               if not file_matches(os.path.join(out_dir, name), content)}
+    written = write_pages(out_dir, changed)
+    build_manifest[slug] = {"digest": digest, "files": sorted(pages)}
+    return ("rebuilt" if written else "unchanged"), written, len(pages)
+
+
+def find_configs(configs_dir, pattern="*.json"):
+    """Return the sorted couple config paths in configs_dir matching pattern."""
+    return sorted(glob.glob(os.path.join(configs_dir, pattern)))
+
+
+# Per-process batch state, set once by init_batch_worker() so the compiled
+# templates are shipped to each pool worker once rather than with every task.
+_batch_state = None
+
+
+def init_batch_worker(templates, output_dir, worker_base, base_digest):
+    """Install the shared batch state in this (worker) process."""
+    global _batch_state
+    _batch_state = (templates, output_dir, worker_base, base_digest)
+
+
+def run_batch_task(task):
+    """Build one couple from a (config, manifest entry) task.
+
+    The manifest entry is None when incremental mode is off. Returns
+    (status, written paths, total files, new manifest entry, elapsed ms).
+    """
+    started = time.perf_counter()
+    config, entry = task
+    templates, output_dir, worker_base, base_digest = _batch_state
+    slug = config["slug"]
+    build_manifest = None
+    if base_digest is not None:
+        build_manifest = {slug: entry} if entry is not None else {}
+    status, written, total = build_couple(
+        config, templates, output_dir, worker_base, base_digest, build_manifest)
+    new_entry = build_manifest.get(slug) if build_manifest is not None else None
+    return status, written, total, new_entry, (time.perf_counter() - started) * 1000
+
+
+def prepare_batch(config_paths):
+    """Parse and validate every config in order.
+
+    Returns a list of (filename, config, error) tuples where exactly one of
+    config and error is set. Duplicate slugs are errors on the later file.
+    """
+    items = []
+    seen_slugs = {}
+    for path in config_paths:
+        name = os.path.basename(path)
+        try:
+            config = parse_config(path)
+        except (OSError, json.JSONDecodeError) as e:
+            items.append((name, None, str(e)))
+            continue
+
+        errors = validate_config(config) if isinstance(config, dict) else ["config must be a JSON object"]
+        if not errors and config["slug"] in seen_slugs:
+            errors = [f"duplicate slug '{config['slug']}' (also in {seen_slugs[config['slug']]})"]
+        if errors:
+            items.append((name, None, "; ".join(errors)))
+            continue
+        seen_slugs[config["slug"]] = name
+        items.append((name, config, None))
+    return items
+
+
+def generate_batch(config_paths, templates, output_dir, worker_base,
+                   base_digest=None, build_manifest=None, jobs=1, thumbs_dir=None, fingerprint_db=None):
+    """Render and write pages for every config, printing one row per couple.
+
+    Invalid configs are reported and skipped rather than aborting the run,
+    so one bad file does not block a nightly rebuild. With jobs > 1 the
+    renders run in a process pool; rows are still printed in config order.
+    With thumbs_dir, the cards get placeholders (see add_card_placeholders).
+    Returns a Counter of build statuses, with invalid configs counted under
+    "failed".
+    """
+    items = prepare_batch(config_paths)
+    if thumbs_dir:
+        add_card_placeholders([config for _, config, error in items if error is None], thumbs_dir, fingerprint_db)
+    tasks = [(config, build_manifest.get(config["slug"]) if build_manifest is not None else None)
+             for _, config, error in items if error is None]
+    state = (templates, output_dir, worker_base, base_digest)
+
+    counts = collections.Counter()
+    print(f"  {'Status':<10} {'Couple':<32} {'Videos':>6}  {'Files':>5}  {'Time':>10}")
+
+    executor = None
+    if jobs > 1 and len(tasks) > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=min(jobs, len(tasks)), initializer=init_batch_worker, initargs=state)
+        chunksize = max(1, len(tasks) // (jobs * 4))
+        results = executor.map(run_batch_task, tasks, chunksize=chunksize)
+    else:
+        init_batch_worker(*state)
+        results = map(run_batch_task, tasks)
+
+    try:
+        for name, config, error in items:
+            if error is not None:
+                print(f"  {'FAIL':<10} {name}: {error}", file=sys.stderr)
+                counts["failed"] += 1
+                continue
+            status, written, total, entry, elapsed_ms = next(results)
+            counts[status] += 1
+            if entry is not None:
+                build_manifest[config["slug"]] = entry
+            print(f"  {status:<10} {config['slug']:<32} {len(config['videos']):>6}  "
+                  f"{len(written):>2}/{total:<2}  {elapsed_ms:7.1f} ms")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return counts
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Generate a couple's film delivery page from a template and config JSON."
     )
-    parser.add_argument(
-        "--config", required=True,
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument(
+        "--config",
         help="Path to the couple config JSON file"
     )
+    source.add_argument(
+        "--configs-dir",
+        help="Directory of couple config JSON files to generate in one run"
+    )
+    parser.add_argument(
+        "--glob", default="*.json",
+        help="Filename pattern for configs in --configs-dir (default: *.json)"
+    )
     parser.add_argument(
         "--template", required=True,
         help="Path to the couple-page.html template"
@@ -176,9 +652,52 @@ def main():
         "--preview", action="store_true",
         help="Open the generated page in the default browser"
     )
+    parser.add_argument(
+        "--check-template", action="store_true",
+        help="Report unknown and unused placeholders in the templates, then exit"
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=1,
+        help="Worker processes for --configs-dir (default: 1, 0 = one per CPU core)"
+    )
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="Skip couples whose inputs are unchanged and never rewrite identical files"
+    )
+    parser.add_argument(
+        "--build-manifest",
+        help="Build manifest path for --incremental (default: one per output directory "
+             f"in {os.path.join(fingerprint.cache_dir(), BUILD_MANIFEST_DIR)})"
+    )
+    parser.add_argument(
+        "--thumbs-dir",
+        help="Transcoder thumbs/ folder to inline blurred card placeholders from; "
+             "{slug} is replaced by each couple's slug (optional)"
+    )
+    parser.add_argument(
+        "--fingerprint-db",
+        help=f"Fingerprint index the placeholders are cached in (default: {fingerprint.default_db_path()})"
+    )
 
     args = parser.parse_args()
 
+    if args.check_template:
+        templates = load_templates(args.template, args.manifest, args.sw)
+        unknown = report_placeholders(templates, show_unused=True)
+        print(f"Checked {len(templates)} template(s): {unknown} unknown placeholder(s)")
+        sys.exit(1 if unknown else 0)
+
+    if not args.config and not args.configs_dir:
+        parser.error("one of the arguments --config --configs-dir is required")
+
+    if args.configs_dir:
+        if args.preview:
+            parser.error("--preview cannot be used with --configs-dir")
+        if args.jobs < 0:
+            parser.error("--jobs must be 0 or a positive number")
+        run_batch(args)
+        return
+
     # Load and validate config
     config = load_config(args.config)
     errors = validate_config(config)
@@ -187,44 +706,32 @@ def main():
         for error in errors:
             print(f"  - {error}", file=sys.stderr)
         sys.exit(1)
+    if args.thumbs_dir:
+        add_card_placeholders([config], args.thumbs_dir, args.fingerprint_db)
 
-    # Build token replacements
-    tokens = build_tokens(config, args.worker_base)
     slug = config["slug"]
     couple_names = " & ".join(config["names"])
     out_dir = os.path.join(args.output_dir, slug)
 
-    # Process template → index.html
-    template_content = read_file(args.template, "template")
-    html_content = replace_tokens(template_content, tokens)
+    # Render index.html (+ manifest.json, sw.js if provided)
+    templates = load_templates(args.template, args.manifest, args.sw)
+    report_placeholders(templates)
+    base_digest, build_manifest, manifest_path = start_incremental(args, templates)
+    status, written, _ = build_couple(
+        config, templates, args.output_dir, args.worker_base, base_digest, build_manifest)
+    for path in written:
+        print(f"  Wrote {path}")
+    if build_manifest is not None:
+        save_build_manifest(manifest_path, build_manifest)
     index_path = os.path.join(out_dir, "index.html")
-    write_file(index_path, html_content, "index.html")
-    print(f"  Wrote {index_path}")
-
-    # Process manifest.json (if provided)
-    if args.manifest:
-        manifest_content = read_file(args.manifest, "manifest template")
-        manifest_output = replace_tokens(manifest_content, tokens)
-        manifest_path = os.path.join(out_dir, "manifest.json")
-        write_file(manifest_path, manifest_output, "manifest.json")
-        print(f"  Wrote {manifest_path}")
-
-    # Copy sw.js (if provided)
-    if args.sw:
-        sw_dest = os.path.join(out_dir, "sw.js")
-        try:
-            os.makedirs(out_dir, exist_ok=True)
-            shutil.copy2(args.sw, sw_dest)
-            print(f"  Wrote {sw_dest}")
-        except FileNotFoundError:
-            print(f"Error: Service worker not found: {args.sw}", file=sys.stderr)
-            sys.exit(1)
-        except OSError as e:
-            print(f"Error copying service worker: {e}", file=sys.stderr)
-            sys.exit(1)
 
     # Summary
-    print(f"\nGenerated page for {couple_names} at {os.path.join(args.output_dir, slug, 'index.html')}")
+    if status == "skipped":
+        print(f"Skipped {couple_names}: inputs unchanged since last build ({index_path})")
+    elif status == "unchanged":
+        print(f"\nPage for {couple_names} is already up to date at {index_path}")
+    else:
+        print(f"\nGenerated page for {couple_names} at {index_path}")
 
     # Preview in browser
     if args.preview:
@@ -234,5 +741,45 @@ def main():
         webbrowser.open(url)
 
 
+def run_batch(args):
+    """Generate pages for every config in --configs-dir in a single run."""
+    started = time.perf_counter()
+    config_paths = find_configs(args.configs_dir, args.glob)
+    if not config_paths:
+        print(f"Error: No configs matching '{args.glob}' in {args.configs_dir}", file=sys.stderr)
+        sys.exit(1)
+
+    templates = load_templates(args.template, args.manifest, args.sw)
+    report_placeholders(templates)
+    base_digest, build_manifest, manifest_path = start_incremental(args, templates)
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    print(f"Generating {len(config_paths)} couple page(s) into {args.output_dir}"
+          f"{f' with {jobs} workers' if jobs > 1 else ''}\n")
+    counts = generate_batch(config_paths, templates, args.output_dir, args.worker_base,
+                            base_digest, build_manifest, jobs, args.thumbs_dir, args.fingerprint_db)
+    if build_manifest is not None:
+        save_build_manifest(manifest_path, build_manifest)
+
+    elapsed = time.perf_counter() - started
+    failed = counts.pop("failed", 0)
+    built = sum(counts.values())
+    breakdown = ", ".join(f"{n} {status}" for status, n in sorted(counts.items()))
+    print(f"\nGenerated {built} page(s) ({breakdown or 'none'}), {failed} failed in {elapsed:.2f}s")
+    if failed:
+        sys.exit(1)
+
+
+def start_incremental(args, templates):
+    """Return (inputs digest, build manifest, manifest path) for --incremental.
+
+    All three are None when incremental mode is off.
+    """
+    if not args.incremental:
+        return None, None, None
+    manifest_path = args.build_manifest or default_build_manifest_path(args.output_dir)
+    return (inputs_digest(templates, args.worker_base),
+            load_build_manifest(manifest_path), manifest_path)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+"""
+Flyin' Iris — HLS Output Checker
+
+Checks transcoder output before it is uploaded. Every film's master.m3u8
+and the media playlists it references are parsed, and the start of every
+segment (not the whole file) is read for its first timestamp and whether
+it opens on a keyframe.
+
+Errors (the check fails):
+    - missing playlists, segments or byte ranges; empty segments
+    - media playlists without EXT-X-ENDLIST
+    - segments longer than EXT-X-TARGETDURATION
+    - video segments that do not start on a keyframe
+    - rungs whose segments do not start at the same times, so players
+      cannot switch between them seamlessly
+
+Warnings:
+    - a BANDWIDTH below the measured peak, or no CODECS (run playlists.py)
+    - short segments before the last one
+    - segments whose bitrate is more than OUTLIER_FACTOR times above or
+      below their rendition's median
+    - a missing thumbnail
+
+Several output directories (one per couple) can be checked at once; the
+films are checked in parallel on a process pool. --json writes a report
+with every rendition's measurements, the issues and the totals per
+couple, and the exit status is 1 if there were errors (with --strict,
+warnings too). upload.py runs the same check and refuses to upload an
+output directory with errors.
+
+Usage:
+    python hls_check.py ./output
+    python hls_check.py /studio/output/* --jobs 8 --json report.json
+    python hls_check.py ./output --strict --json -
+"""
+
+import argparse
+import concurrent.futures
+import json
+import os
+import statistics
+import sys
+import time
+
+import transcode
+
+
+# Bytes read from the start of each segment: enough for the PAT/PMT and
+# the first video PES header and NAL units (TS), or the moof (fMP4).
+SEGMENT_HEAD_BYTES = 64 * 1024
+# Rungs count as aligned if their segments start within this many seconds.
+ALIGN_TOLERANCE = 0.01
+# Segments under this fraction of the target duration are flagged when
+# they are not the last; bitrates this many times off the median are outliers.
+SHORT_SEGMENT_FRACTION = 0.5
+OUTLIER_FACTOR = 3.0
+# Issues of one kind reported per rendition before they are summarised.
+ISSUE_LIMIT = 5
+
+REPORT_VERSION = 1
+
+
+def issue(severity, message, rendition=None, segment=None):
+    return {"severity": severity, "rendition": rendition, "segment": segment, "message": message}
+
+
+def read_playlist_tags(path):
+    """Return (EXT-X-TARGETDURATION or None, has EXT-X-ENDLIST) of a media playlist."""
+    target, ended = None, False
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("#EXT-X-TARGETDURATION:"):
+                target = int(line[len("#EXT-X-TARGETDURATION:"):])
+            elif line == "#EXT-X-ENDLIST":
+                ended = True
+    return target, ended
+
+
+def ts_segment_start(head):
+    """Return (start seconds, starts on a keyframe) of a TS segment, or (None, None) without video."""
+    for stream_type, units in transcode.ts_streams(head).values():
+        if transcode.TS_STREAM_TYPES[stream_type] != "h264" or not units:
+            continue
+        pts, data = units[0]
+        at = data.find(b"\x00\x00\x01")
+        keyframe = False
+        while at != -1 and at + 3 < len(data):
+            if data[at + 3] & 0x1f == 5:  # IDR slice
+                keyframe = True
+                break
+            at = data.find(b"\x00\x00\x01", at + 3)
+        return (pts / 90000 if pts is not None else None), keyframe
+    return None, None
+
+
+def fmp4_video_track(init):
+    """Return (track ID, timescale) of the video track in an fMP4 init segment, or None."""
+    for track_id, handler, timescale, _ in transcode.init_tracks(init):
+        if handler == "vide":
+            return track_id, timescale
+    return None
+
+
+def fmp4_segment_start(head, video):
+    """Return (start seconds, starts on a keyframe) of an fMP4 segment's video track.
+
+    The start is the track fragment's decode time (tfdt), which is the same
+    across rungs encoded with the same GOP structure; the keyframe flag is
+    the first sample's sync flag from trun, or the tfhd default.
+    """
+    track_id, timescale = video
+    moof = transcode.mp4_box(head, ("moof",))
+    if moof is None:
+        return None, None
+    for kind, traf_start, traf_end in transcode.mp4_boxes(head, *moof):
+        tfhd = transcode.mp4_box(head, ("tfhd",), traf_start, traf_end) if kind == "traf" else None
+        if not tfhd or int.from_bytes(head[tfhd[0] + 4:tfhd[0] + 8], "big") != track_id:
+            continue
+        start = None
+        tfdt = transcode.mp4_box(head, ("tfdt",), traf_start, traf_end)
+        if tfdt:
+            size = 8 if head[tfdt[0]] == 1 else 4
+            start = int.from_bytes(head[tfdt[0] + 4:tfdt[0] + 4 + size], "big") / timescale
+        # tfhd optional fields before default_sample_flags: base_data_offset
+        # (0x1), sample_description_index (0x2), default duration (0x8) and
+        # size (0x10).
+        tfhd_flags = int.from_bytes(head[tfhd[0] + 1:tfhd[0] + 4], "big")
+        flags = None
+        if tfhd_flags & 0x20:
+            at = tfhd[0] + 8 + sum(size for bit, size in ((0x1, 8), (0x2, 4), (0x8, 4), (0x10, 4))
+                                   if tfhd_flags & bit)
+            flags = int.from_bytes(head[at:at + 4], "big")
+        trun = transcode.mp4_box(head, ("trun",), traf_start, traf_end)
+        if trun:
+            trun_flags = int.from_bytes(head[trun[0] + 1:trun[0] + 4], "big")
+            at = trun[0] + 8 + (4 if trun_flags & 0x1 else 0)
+            if trun_flags & 0x4:  # first_sample_flags
+                flags = int.from_bytes(head[at:at + 4], "big")
+            elif trun_flags & 0x400:  # per-sample flags, after duration and size
+                at += 4 + (4 if trun_flags & 0x100 else 0) + (4 if trun_flags & 0x200 else 0)
+                flags = int.from_bytes(head[at:at + 4], "big")
+        # sample_is_non_sync_sample is bit 16 of the sample flags.
+        return start, (None if flags is None else not flags & 0x10000)
+    return None, None
+
+
+def check_rendition(video_out_dir, uri, issues):
+    """Check one media playlist. Returns (rendition report, [segment starts]) or (None, None).
+
+    Segment starts are None for renditions without video.
+    """
+    name = os.path.dirname(uri) or uri
+    path = os.path.join(video_out_dir, uri)
+    if not os.path.isfile(path):
+        issues.append(issue("error", f"{uri} is missing", name))
+        return None, None
+    target, ended = read_playlist_tags(path)
+    entries, init = transcode.read_media_playlist(path)
+    if not ended:
+        issues.append(issue("error", "playlist has no EXT-X-ENDLIST", name))
+    if not entries:
+        issues.append(issue("error", "playlist lists no segments", name))
+        return None, None
+    if target is None:
+        issues.append(issue("error", "playlist has no EXT-X-TARGETDURATION", name))
+
+    base = os.path.dirname(path)
+    video = None
+    files = {}  # segment file -> size
+    if init:
+        init_path = os.path.join(base, init[0])
+        try:
+            video = fmp4_video_track(transcode.read_byterange(init_path, init[1]))
+        except (OSError, transcode.TranscodeError) as e:
+            issues.append(issue("error", f"init segment unreadable: {e}", name))
+            return None, None
+    counts = {"long": 0, "short": 0, "keyframe": 0}
+    sizes, durations, starts = [], [], []
+    has_video = False
+    for index, (duration, segment_uri, byterange) in enumerate(entries):
+        segment_path = os.path.join(base, segment_uri)
+        if segment_uri not in files:
+            files[segment_uri] = os.path.getsize(segment_path) if os.path.isfile(segment_path) else None
+        file_size = files[segment_uri]
+        if file_size is None:
+            issues.append(issue("error", f"{segment_uri} is missing", name, index))
+            continue
+        length, offset = byterange or (file_size, 0)
+        if offset + length > file_size:
+            issues.append(issue("error", f"byte range {length}@{offset} runs past the end of {segment_uri}",
+                                name, index))
+            continue
+        if length == 0:
+            issues.append(issue("error", "segment is empty", name, index))
+            continue
+        sizes.append(length)
+        durations.append(duration)
+        last = index == len(entries) - 1
+        if target is not None and round(duration) > target:
+            counts["long"] += 1
+            if counts["long"] <= ISSUE_LIMIT:
+                issues.append(issue("error", f"{duration:.3f}s is over EXT-X-TARGETDURATION {target}s",
+                                    name, index))
+        elif target is not None and not last and duration < target * SHORT_SEGMENT_FRACTION:
+            counts["short"] += 1
+            if counts["short"] <= ISSUE_LIMIT:
+                issues.append(issue("warning", f"{duration:.3f}s segment before the end of the film",
+                                    name, index))
+        head = transcode.read_byterange(segment_path, (min(length, SEGMENT_HEAD_BYTES), offset))
+        if init:
+            start, keyframe = fmp4_segment_start(head, video) if video else (None, None)
+        else:
+            start, keyframe = ts_segment_start(head)
+        if keyframe is not None:
+            has_video = True
+        if keyframe is False:
+            counts["keyframe"] += 1
+            if counts["keyframe"] <= ISSUE_LIMIT:
+                issues.append(issue("error", "segment does not start on a keyframe", name, index))
+        starts.append(start)
+    for kind, severity, what in (("long", "error", "over the target duration"),
+                                 ("short", "warning", "short"),
+                                 ("keyframe", "error", "not starting on a keyframe")):
+        if counts[kind] > ISSUE_LIMIT:
+            issues.append(issue(severity, f"{counts[kind] - ISSUE_LIMIT} more segment(s) {what}", name))
+    if not sizes:
+        return None, None
+
+    rates = [size * 8 / max(duration, 1e-3) for size, duration in zip(sizes, durations)]
+    # The last segment is usually short and is left out of the median.
+    median = statistics.median(rates[:-1] if len(rates) > 2 else rates)
+    outliers = [index for index, rate in enumerate(rates[:-1])
+                if rate > median * OUTLIER_FACTOR or rate < median / OUTLIER_FACTOR]
+    for index in outliers[:ISSUE_LIMIT]:
+        issues.append(issue("warning", f"bitrate {rates[index] / 1000:.0f}k is an outlier "
+                                       f"(median {median / 1000:.0f}k, {sizes[index]} bytes)", name, index))
+    if len(outliers) > ISSUE_LIMIT:
+        issues.append(issue("warning", f"{len(outliers) - ISSUE_LIMIT} more bitrate outlier(s)", name))
+
+    peak, average = transcode.segment_bitrates(sizes, durations)
+    rendition = {
+        "name": name,
+        "playlist": uri,
+        "segments": len(entries),
+        "duration": round(sum(durations), 3),
+        "target_duration": target,
+        "max_segment_duration": round(max(durations), 3),
+        "bytes": sum(sizes),
+        "peak_bitrate": round(peak),
+        "average_bitrate": round(average),
+        "median_bitrate": round(median),
+        "outliers": len(outliers),
+    }
+    return rendition, (starts if has_video else None)
+
+
+def check_alignment(starts_by_rung, issues):
+    """Flag rungs whose segments do not start at the same times as the first rung's."""
+    rungs = [(name, starts) for name, starts in starts_by_rung.items() if starts is not None]
+    if len(rungs) < 2:
+        return
+    reference_name, reference = rungs[0]
+    for name, starts in rungs[1:]:
+        if len(starts) != len(reference):
+            issues.append(issue("error", f"{len(starts)} segments but {reference_name} has "
+                                         f"{len(reference)}; rungs are not aligned", name))
+            continue
+        for index, (start, expected) in enumerate(zip(starts, reference)):
+            if start is None or expected is None:
+                continue
+            if abs(start - expected) > ALIGN_TOLERANCE:
+                issues.append(issue("error", f"starts at {start:.3f}s but {reference_name} at "
+                                             f"{expected:.3f}s; rungs are not keyframe-aligned", name, index))
+                break
+
+
+def check_film(output_dir, video_id):
+    """Check one film's HLS output. Returns its report dict."""
+    started = time.perf_counter()
+    video_out_dir = os.path.join(output_dir, video_id)
+    issues = []
+    renditions = []
+    film = {"video_id": video_id, "renditions": renditions, "issues": issues}
+    master_path = os.path.join(video_out_dir, "master.m3u8")
+    try:
+        if not os.path.isfile(master_path):
+            issues.append(issue("error", "master.m3u8 is missing"))
+            return film
+        variants, media = transcode.read_master_playlist(master_path)
+        if not variants:
+            issues.append(issue("error", "master.m3u8 lists no variants"))
+
+        measured = {}  # playlist URI -> rendition report
+        starts_by_rung = {}
+        for attributes in media:
+            if "URI" in attributes and attributes["URI"] not in measured:
+                rendition, _ = check_rendition(video_out_dir, attributes["URI"], issues)
+                measured[attributes["URI"]] = rendition
+        for attributes, uri in variants:
+            rendition, starts = check_rendition(video_out_dir, uri, issues)
+            measured[uri] = rendition
+            if rendition:
+                starts_by_rung[rendition["name"]] = starts
+        check_alignment(starts_by_rung, issues)
+
+        # BANDWIDTH must cover the peak of the variant plus its audio group.
+        groups = {}
+        for attributes in media:
+            rendition = measured.get(attributes.get("URI"))
+            if attributes.get("TYPE") == "AUDIO" and rendition:
+                group = attributes.get("GROUP-ID")
+                groups[group] = max(groups.get(group, 0), rendition["peak_bitrate"])
+        for attributes, uri in variants:
+            rendition = measured.get(uri)
+            if not rendition:
+                continue
+            renditions.append(rendition)
+            if "BANDWIDTH" not in attributes:
+                issues.append(issue("error", "EXT-X-STREAM-INF has no BANDWIDTH", rendition["name"]))
+                continue
+            declared = int(attributes["BANDWIDTH"])
+            peak = rendition["peak_bitrate"] + groups.get(attributes.get("AUDIO"), 0)
+            rendition["declared_bandwidth"] = declared
+            if declared < peak:
+                issues.append(issue("warning", f"BANDWIDTH {declared} is below the measured peak {peak}; "
+                                               f"run playlists.py", rendition["name"]))
+        renditions.extend(rendition for attributes in media
+                          for rendition in [measured.get(attributes.get("URI"))] if rendition)
+        if variants and not any("CODECS" in attributes for attributes, _ in variants):
+            issues.append(issue("warning", "master.m3u8 has no CODECS (nominal values); run playlists.py"))
+    except (OSError, ValueError, IndexError, transcode.TranscodeError) as e:
+        issues.append(issue("error", f"could not be read: {e}"))
+
+    if not os.path.isfile(os.path.join(output_dir, "thumbs", f"{video_id}.jpg")):
+        issues.append(issue("warning", f"thumbs/{video_id}.jpg is missing"))
+    files = total = 0
+    for dirpath, dirnames, filenames in os.walk(video_out_dir):
+        dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+        for name in filenames:
+            if not name.startswith(".") and not name.endswith(".log"):
+                files += 1
+                total += os.path.getsize(os.path.join(dirpath, name))
+    film["files"] = files
+    film["bytes"] = total
+    film["duration"] = max((rendition["duration"] for rendition in renditions), default=0)
+    film["segments"] = sum(rendition["segments"] for rendition in renditions)
+    film["check_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return film
+
+
+def find_films(output_dir):
+    """Return the film folders of an output directory (everything but thumbs/ and dotfiles)."""
+    return sorted(name for name in os.listdir(output_dir)
+                  if not name.startswith(".") and name != "thumbs"
+                  and os.path.isdir(os.path.join(output_dir, name)))
+
+
+def run_check(task):
+    return check_film(*task)
+
+
+def check_outputs(output_dirs, jobs=0):
+    """Check every film in the given output directories. Returns the report dict.
+
+    Films run on a process pool of jobs workers (default: CPU count).
+    """
+    tasks = [(output_dir, video_id) for output_dir in output_dirs for video_id in find_films(output_dir)]
+    jobs = min(jobs or os.cpu_count() or 1, len(tasks))
+    if jobs > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            films = list(executor.map(run_check, tasks))
+    else:
+        films = [run_check(task) for task in tasks]
+
+    couples = []
+    errors = warnings = 0
+    for output_dir in output_dirs:
+        couple_films = [film for (film_dir, _), film in zip(tasks, films) if film_dir == output_dir]
+        counts = {severity: sum(1 for film in couple_films for found in film["issues"]
+                                if found["severity"] == severity) for severity in ("error", "warning")}
+        errors += counts["error"]
+        warnings += counts["warning"]
+        couples.append({
+            "output_dir": os.path.abspath(output_dir),
+            "films": couple_films,
+            "totals": {
+                "films": len(couple_films),
+                "duration": round(sum(film["duration"] for film in couple_films), 3),
+                "segments": sum(film["segments"] for film in couple_films),
+                "files": sum(film["files"] for film in couple_films),
+                "bytes": sum(film["bytes"] for film in couple_films),
+                "errors": counts["error"],
+                "warnings": counts["warning"],
+            },
+        })
+    return {"version": REPORT_VERSION, "ok": errors == 0, "errors": errors, "warnings": warnings,
+            "couples": couples}
+
+
+def format_issue(video_id, found):
+    where = video_id
+    if found["rendition"]:
+        where += f"/{found['rendition']}"
+    if found["segment"] is not None:
+        where += f" #{found['segment']}"
+    return f"    {found['severity'].upper():<8} {where}: {found['message']}"
+
+
+def print_report(report, file=sys.stdout):
+    """Print a report's per-film summary and issues."""
+    for couple in report["couples"]:
+        totals = couple["totals"]
+        print(f"\n  {couple['output_dir']}", file=file)
+        for film in couple["films"]:
+            errors = sum(1 for found in film["issues"] if found["severity"] == "error")
+            status = "FAILED" if errors else "ok"
+            print(f"  {status:<7} {film['video_id']:<28} {transcode.format_duration(film['duration']):>7}  "
+                  f"{film['segments']:>5} segments  {film['bytes'] / 1e6:8.1f} MB", file=file)
+            for found in film["issues"]:
+                print(format_issue(film["video_id"], found), file=file)
+        print(f"  {totals['films']} film(s), {transcode.format_duration(totals['duration'])}, "
+              f"{totals['files']} file(s), {totals['bytes'] / 1e9:.2f} GB: "
+              f"{totals['errors']} error(s), {totals['warnings']} warning(s)", file=file)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check transcoded HLS output (playlists, segment durations, keyframe alignment) before upload."
+    )
+    parser.add_argument(
+        "output_dirs", nargs="+",
+        help="Transcoder output directories, one per couple"
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=0,
+        help="Films checked in parallel (default: CPU count)"
+    )
+    parser.add_argument(
+        "--json",
+        help="Write the machine-readable report to this path ('-' for stdout)"
+    )
+    parser.add_argument(
+        "--strict", action="store_true",
+        help="Fail on warnings as well as errors"
+    )
+    args = parser.parse_args()
+
+    for path in args.output_dirs:
+        if not os.path.isdir(path):
+            print(f"Error: Output directory not found: {path}", file=sys.stderr)
+            sys.exit(1)
+
+    started = time.perf_counter()
+    report = check_outputs(args.output_dirs, args.jobs)
+    elapsed = time.perf_counter() - started
+    report["ok"] = report["errors"] == 0 and not (args.strict and report["warnings"])
+
+    # Keep stdout clean for the JSON report when it goes there.
+    out = sys.stderr if args.json == "-" else sys.stdout
+    print("\n=== Flyin' Iris HLS Check ===", file=out)
+    print_report(report, out)
+    films = sum(couple["totals"]["films"] for couple in report["couples"])
+    print(f"\nChecked {films} film(s) in {elapsed:.2f}s: {report['errors']} error(s), "
+          f"{report['warnings']} warning(s)", file=out)
+    if args.json == "-":
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    elif args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    if not report["ok"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
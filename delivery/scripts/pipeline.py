@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+"""
+Flyin' Iris — Transcode & Upload Pipeline
+
+Runs transcode.py and upload.py as one pipeline, so the uplink works while
+ffmpeg is still encoding instead of sitting idle until every film is done.
+
+    - Originals start uploading immediately.
+    - Each running encode's rung and audio folders are polled for finished
+      segments (segment N is complete once ffmpeg has opened segment N+1),
+      which are queued to the upload pool straight away. Single-file
+      (--single-file) streams are still being written until the encode
+      ends, so they go up with the rest of the film.
+    - When a film finishes, its last segments are sent and every file is
+      checked against the checksums the transcoder recorded (a segment
+      rewritten by a retried encode is sent again) and the film is checked
+      with hls_check.py. Only then do the rung playlists go up, and
+      master.m3u8 last, so a half-shipped or broken film is never playable.
+    - A final pass uploads whatever the stream did not cover (thumbnails,
+      the couple's card atlas, films skipped via the transcode journal)
+      and deletes stale objects, exactly like upload.py.
+
+Wall-clock time per couple approaches max(transcode, upload) rather than
+their sum. Takes the arguments of both scripts; credentials come from
+R2_ENDPOINT, R2_ACCESS_KEY_ID and R2_SECRET_ACCESS_KEY as for upload.py.
+
+Usage:
+    python pipeline.py -i ./exports/amanda-boris -c delivery/sample/amanda-boris.json -s amanda-boris
+    python pipeline.py -i ./exports/amanda-boris -c config.json -s amanda-boris -r ./exports/amanda-boris
+"""
+
+import argparse
+import concurrent.futures
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+import fingerprint
+import hls_check
+import transcode
+import upload
+import upload_manifest
+from s3client import S3Client, S3Error
+
+SEGMENT_RE = re.compile(r"^segment(\d+)\.(?:ts|m4s)$")
+
+
+class SegmentWatcher:
+    """Finds finished segments in the rung folders of running HLS encodes.
+
+    ffmpeg writes the VOD playlists only at the end, but it closes each
+    segment before opening the next, so every segment below the highest
+    numbered one in a rung folder is complete.
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.lock = threading.Lock()
+        self.active = {}
+
+    def watch(self, job):
+        if job.kind == "hls":
+            with self.lock:
+                self.active[job.video_id] = [rung.name for rung in job.ladder or transcode.LADDER]
+
+    def unwatch(self, video_id):
+        with self.lock:
+            self.active.pop(video_id, None)
+
+    def poll(self):
+        """Return the relative paths of all finished segments seen right now."""
+        with self.lock:
+            active = sorted(self.active.items())
+        finished = []
+        for video_id, rungs in active:
+            for folder in rungs + [transcode.AUDIO_DIR]:
+                try:
+                    names = os.listdir(os.path.join(self.output_dir, video_id, folder))
+                except FileNotFoundError:
+                    continue
+                numbered = sorted((int(m.group(1)), name) for name in names
+                                  for m in [SEGMENT_RE.match(name)] if m)
+                finished.extend(f"{video_id}/{folder}/{name}" for _, name in numbered[:-1])
+        return finished
+
+
+class Pipeline:
+    """Streams files to R2 as the transcoder produces them.
+
+    submit() queues one file on the upload pool unless it is already in
+    the bucket (per the upload manifest) or was already queued this run.
+    Films are finalized on their own small pool, since that waits for the
+    film's segment uploads before sending its playlists.
+    """
+
+    def __init__(self, uploader, manifest, slug, output_dir, workers):
+        self.uploader = uploader
+        self.manifest = manifest
+        self.prefix = f"couples/{slug}"
+        self.output_dir = output_dir
+        self.lock = threading.Lock()
+        self.queued = {}  # key -> future resolving to the SHA-256 that was sent
+        self.failures = {}  # key -> error
+        self.uploaded = []
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        self.part_pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        self.finalizers = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+        self.finalized = []
+
+    def hls_item(self, rel, sha256=None):
+        path = os.path.join(self.output_dir, rel)
+        return upload.UploadItem(path, f"{self.prefix}/hls/{rel}", os.path.getsize(path), sha256, "hls")
+
+    def _send(self, item):
+        try:
+            sha256 = self.uploader.upload(item, self.part_pool)
+        except (S3Error, upload.UploadError, OSError) as e:
+            with self.lock:
+                self.failures[item.key] = str(e)
+            raise
+        self.manifest.record(item.key, item.size, sha256)
+        with self.lock:
+            self.failures.pop(item.key, None)
+            self.uploaded.append(item)
+        return sha256
+
+    def submit(self, item):
+        """Queue item unless it is already in the bucket or queued this run.
+
+        An item with a recorded checksum waits for an earlier upload of the
+        same key and is sent again if that failed or sent other content.
+        Returns the upload's future, or None if nothing needs sending.
+        """
+        while True:
+            with self.lock:
+                queued = self.queued.get(item.key)
+            if queued is not None:
+                if item.sha256 is None:
+                    return queued
+                concurrent.futures.wait([queued])
+                if queued.exception() is None and queued.result() == item.sha256:
+                    return queued
+                send = item
+            else:
+                send, unchanged = upload_manifest.check_item(item, self.manifest)
+                if unchanged:
+                    return None
+            # Checking and waiting happen outside the lock, so queue the
+            # upload only if no other thread queued this key meanwhile
+            with self.lock:
+                if self.queued.get(item.key) is queued:
+                    future = self.queued[item.key] = self.pool.submit(self._send, send)
+                    return future
+
+    def submit_segments(self, rel_paths):
+        for rel in rel_paths:
+            self.submit(self.hls_item(rel))
+
+    def job_finished(self, job, checksums):
+        """transcode_all on_finished hook: finalize a film or send a thumbnail."""
+        if job.kind == "hls":
+            self.finalized.append(self.finalizers.submit(self.finalize_film, job.video_id, checksums))
+        elif job.kind == "thumb":
+            for rel, (size, sha256) in checksums.items():
+                path = os.path.join(self.output_dir, rel)
+                self.submit(upload.UploadItem(path, f"{self.prefix}/{rel}", size, sha256, "thumbs"))
+
+    def finalize_film(self, video_id, checksums):
+        """Send a finished film's remaining files, playlists last.
+
+        Every file is resubmitted with its recorded checksum, so anything
+        that was streamed with different content (a segment rewritten by a
+        retried encode) is sent again before any playlist goes up. A film
+        that fails hls_check.py gets no playlists at all.
+        """
+        errors = [found for found in hls_check.check_film(self.output_dir, video_id)["issues"]
+                  if found["severity"] == "error"]
+        if errors:
+            raise upload.UploadError(f"{video_id}: failed the HLS check ({len(errors)} error(s), first: "
+                                     f"{hls_check.format_issue(video_id, errors[0]).strip()}); "
+                                     f"playlists withheld")
+        items = [self.hls_item(rel, sha256) for rel, (size, sha256) in sorted(checksums.items())]
+        for phase in upload.upload_phases(items):
+            futures = [f for f in (self.submit(item) for item in phase) if f is not None]
+            done, _ = concurrent.futures.wait(futures)
+            if any(future.exception() for future in done):
+                raise upload.UploadError(f"{video_id}: not all files uploaded; playlists withheld")
+        return video_id
+
+    def wait(self):
+        """Wait for every queued upload and film; return finalize errors."""
+        errors = []
+        for future in concurrent.futures.as_completed(self.finalized):
+            try:
+                future.result()
+            except upload.UploadError as e:
+                errors.append(str(e))
+        with self.lock:
+            futures = list(self.queued.values())
+        concurrent.futures.wait(futures)
+        return errors
+
+    def close(self):
+        self.finalizers.shutdown()
+        self.pool.shutdown()
+        self.part_pool.shutdown()
+
+
+def poll_segments(watcher, pipeline, stop, interval):
+    """Feed finished segments to the pipeline until stop is set."""
+    while not stop.wait(interval):
+        pipeline.submit_segments(watcher.poll())
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Transcode a couple's films and upload them to R2 as segments are produced."
+    )
+    parser.add_argument(
+        "-i", "--input-dir", required=True,
+        help="Directory containing source MP4 files"
+    )
+    parser.add_argument(
+        "-c", "--config", required=True,
+        help="Path to the couple config JSON (durations are written back)"
+    )
+    parser.add_argument(
+        "-s", "--slug", required=True,
+        help="Couple slug (e.g., amanda-boris)"
+    )
+    parser.add_argument(
+        "-o", "--output-dir", default="./output",
+        help="Output directory for HLS files (default: ./output)"
+    )
+    parser.add_argument(
+        "-r", "--original-dir",
+        help="Directory containing the original MP4s to upload (usually the input dir)"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=0,
+        help="Concurrent ffmpeg jobs (default: sized to CPU cores and free memory)"
+    )
+    parser.add_argument(
+        "--upload-workers", type=int, default=16,
+        help="Concurrent uploads / pooled connections (default: 16)"
+    )
+    parser.add_argument(
+        "--retries", type=int, default=2,
+        help="Retries per failed ffmpeg job (default: 2)"
+    )
+    parser.add_argument(
+        "--endpoint",
+        help="S3 endpoint URL (default: $R2_ENDPOINT)"
+    )
+    parser.add_argument(
+        "--bucket", default="fi-films",
+        help="Bucket name (default: fi-films)"
+    )
+    parser.add_argument(
+        "--force", action="store_true",
+        help="Ignore the transcode journal and transcode everything again"
+    )
+    parser.add_argument(
+        "--fingerprint-db",
+        help=f"Source fingerprint index (default: {fingerprint.default_db_path()})"
+    )
+    parser.add_argument(
+        "--poll-interval", type=float, default=1.0,
+        help="Seconds between scans for finished segments (default: 1)"
+    )
+    parser.add_argument(
+        "--chunk-seconds", type=float, default=0,
+        help="Encode long films in parallel chunks as transcode.py does (default: off); "
+             "a chunked film's segments go up once it is stitched"
+    )
+    parser.add_argument(
+        "--fixed-ladder", action="store_true",
+        help="Encode every film at the profile's fixed ladder (standard: 5000k/2500k/1000k) "
+             "instead of a per-title one"
+    )
+    transcode.add_packaging_arguments(parser)
+    args = parser.parse_args()
+
+    transcode.check_tools()
+    for label, path in (("Input", args.input_dir), ("Original", args.original_dir)):
+        if path and not os.path.isdir(path):
+            print(f"Error: {label} directory not found: {path}", file=sys.stderr)
+            sys.exit(1)
+    try:
+        with open(args.config, "r", encoding="utf-8") as f:
+            json.load(f)
+    except FileNotFoundError:
+        print(f"Error: Config file not found: {args.config}", file=sys.stderr)
+        sys.exit(1)
+    except json.JSONDecodeError as e:
+        print(f"Error: Config file is not valid JSON: {e}", file=sys.stderr)
+        sys.exit(1)
+    sources = transcode.discover_sources(args.input_dir)
+    if not sources:
+        print(f"Error: No MP4 files found in {args.input_dir}", file=sys.stderr)
+        sys.exit(1)
+    try:
+        client = S3Client.from_env(args.endpoint, args.bucket)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    workers = args.workers or transcode.default_workers()
+    output_dir = os.path.abspath(args.output_dir)
+    prefix = f"couples/{args.slug}"
+    print("\n=== Flyin' Iris Transcode & Upload Pipeline ===")
+    print(f"Input:   {os.path.abspath(args.input_dir)}")
+    print(f"Output:  {output_dir}")
+    print(f"Remote:  {args.bucket}/{prefix}/ via {client.scheme}://{client.host}")
+    print(f"Found {len(sources)} MP4 file(s), running {workers} encode(s) and "
+          f"{args.upload_workers} upload(s) at a time\n")
+
+    os.makedirs(output_dir, exist_ok=True)
+    journal = transcode.Journal(os.path.join(output_dir, transcode.JOURNAL_NAME))
+    if args.force:
+        journal.entries = {}
+    manifest = upload_manifest.UploadManifest(
+        os.path.join(output_dir, upload_manifest.MANIFEST_NAME),
+        f"{client.scheme}://{client.host}/{args.bucket}/{prefix}",
+    )
+    uploader = upload.Uploader(client, args.upload_workers)
+    uploader.progress = upload.Progress(0, 0, interval=None)  # retry counter only
+    pipeline = Pipeline(uploader, manifest, args.slug, output_dir, args.upload_workers)
+    watcher = SegmentWatcher(output_dir)
+
+    started = time.perf_counter()
+    stop = threading.Event()
+    poller = threading.Thread(target=poll_segments, args=(watcher, pipeline, stop, args.poll_interval),
+                              daemon=True)
+    try:
+        with fingerprint.FingerprintIndex(args.fingerprint_db) as index:
+            if args.original_dir:
+                for item in upload.collect_items(args.slug, output_dir, args.original_dir, {}, index):
+                    if item.category == "originals":
+                        pipeline.submit(item)
+            poller.start()
+
+            def finished(job, checksums):
+                watcher.unwatch(job.video_id)
+                pipeline.job_finished(job, checksums)
+
+            durations, failures, skipped = transcode.transcode_all(
+                sources, output_dir, workers, args.retries, journal=journal, index=index,
+                on_start=watcher.watch, on_finished=finished, chunk_seconds=args.chunk_seconds,
+                fixed_ladder=args.fixed_ladder, packaging=transcode.packaging_from_args(args),
+                profile=transcode.profile_from_args(args))
+            transcode_done = time.perf_counter()
+            streamed = len(pipeline.uploaded)
+            stop.set()
+            poller.join()
+            for video_id in failures:
+                watcher.unwatch(video_id)
+
+            finalize_errors = pipeline.wait()
+            atlas = transcode.refresh_card_atlas(output_dir, args.config, journal)
+
+            # Sweep: films skipped via the journal, anything the stream missed
+            # (and the card atlas), then stale objects, in the same order
+            # upload.py uses.
+            items = [item for item in upload.collect_items(args.slug, output_dir, args.original_dir,
+                                                           journal.checksums(), index)
+                     if not any(item.key.startswith(f"{prefix}/hls/{video_id}/") for video_id in failures)]
+        categories = {"hls", "thumbs"} | ({"originals"} if args.original_dir else set())
+        plan = upload_manifest.plan_delta(items, manifest, categories)
+        deletes = [key for key in plan.deletes
+                   if not any(key.startswith(f"{prefix}/hls/{video_id}/") for video_id in failures)]
+        for phase in upload.upload_phases(plan.puts):
+            if pipeline.failures or finalize_errors:
+                break  # never publish playlists over missing segments
+            concurrent.futures.wait([f for f in (pipeline.submit(item) for item in phase) if f is not None])
+        deleted, delete_failures = [], {}
+        if not (pipeline.failures or finalize_errors):
+            deleted, delete_failures = uploader.delete_all(deletes)
+            for key in deleted:
+                manifest.forget(key)
+    finally:
+        stop.set()
+        pipeline.close()
+        manifest.save()
+    elapsed = time.perf_counter() - started
+    unmatched = transcode.update_config_durations(args.config, durations)
+
+    print("\n=== Pipeline Complete ===")
+    for video_id in sorted(durations):
+        note = "  (no matching config entry)" if video_id in unmatched else ""
+        print(f"  done    {video_id:<28} {durations[video_id]:>6}{note}")
+    for video_id in sorted(failures):
+        print(f"  FAILED  {video_id:<28} {failures[video_id]}", file=sys.stderr)
+    uploaded_bytes = sum(item.size for item in pipeline.uploaded)
+    uploaded_keys = {item.key for item in pipeline.uploaded}
+    unchanged = sum(1 for item in items if item.key not in uploaded_keys)
+    print(f"\nTranscode: {transcode_done - started:.1f}s ({skipped} job(s) skipped via the journal)")
+    print(f"Upload:    {len(pipeline.uploaded)} file(s), {uploaded_bytes / 1e9:.2f} GB "
+          f"({streamed} while transcoding), {unchanged} unchanged, {len(deleted)} deleted, "
+          f"{uploader.progress.retries} retried request(s)")
+    print(f"Total:     {elapsed:.1f}s, {elapsed - (transcode_done - started):.1f}s after the last encode")
+    print(f"Config updated: {args.config}")
+    transcode.print_ladder_report(journal, durations)
+    transcode.print_audio_report(journal, durations)
+    transcode.print_derivative_report(journal, durations)
+    transcode.print_card_atlas(output_dir, atlas)
+
+    errors = len(pipeline.failures) + len(delete_failures) + len(finalize_errors)
+    for key, error in sorted(pipeline.failures.items()):
+        print(f"  FAILED  {key}: {error}", file=sys.stderr)
+    for key, error in sorted(delete_failures.items()):
+        print(f"  FAILED  DELETE {key}: {error}", file=sys.stderr)
+    for error in finalize_errors:
+        print(f"  WITHHELD {error}", file=sys.stderr)
+    if failures or errors:
+        print(f"\nPipeline completed with {len(failures)} transcode and {errors} upload error(s).",
+              file=sys.stderr)
+        sys.exit(1)
+    print("\nAll films transcoded and uploaded.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Flyin' Iris — Card Placeholders
+
+Computes the blurred placeholder each film card shows until its thumbnail
+arrives: the film's poster (thumbs/{video_id}.jpg) shrunk to a 32x18 WebP
+of about 200 bytes, as a data: URI. generate.py inlines it into the card
+markup as the card's background (see --thumbs-dir), so it costs no
+request, and the browser's smooth upscaling turns the 32x18 pixels into a
+soft preview of the frame instead of an empty box.
+
+Placeholders are cached in the fingerprint index (see fingerprint.py) by
+the poster's content hash and the placeholder settings, so a rebuild only
+runs ffmpeg for posters that are new or were re-cut.
+
+Usage:
+    python placeholders.py ./output/thumbs
+    python placeholders.py ./output/thumbs --video-id highlight --video-id teaser
+"""
+
+import argparse
+import base64
+import hashlib
+import os
+import subprocess
+import sys
+
+import fingerprint
+
+PLACEHOLDER_SIZE = (32, 18)
+PLACEHOLDER_CODEC = ["-c:v", "libwebp", "-quality", "30"]
+
+# The card atlas images share thumbs/ with the posters
+# (transcode.CARD_ATLAS_PREFIX; keep it in sync).
+CARD_ATLAS_PREFIX = "cards"
+
+
+def probe_name():
+    """Return the fingerprint index probe name, which changes with the settings."""
+    settings = f"{PLACEHOLDER_SIZE}{PLACEHOLDER_CODEC}".encode("utf-8")
+    return f"placeholder:{hashlib.sha256(settings).hexdigest()[:12]}"
+
+
+def build_placeholder_command(path):
+    """Build the ffmpeg argv that writes path's placeholder WebP to stdout."""
+    width, height = PLACEHOLDER_SIZE
+    return ["ffmpeg", "-nostdin", "-v", "error", "-i", path,
+            "-vf", f"scale={width}:{height}:flags=area", "-frames:v", "1",
+            *PLACEHOLDER_CODEC, "-f", "webp", "pipe:1"]
+
+
+def compute_placeholder(path):
+    """Return the placeholder of the image at path as a data: URI."""
+    try:
+        result = subprocess.run(build_placeholder_command(path), capture_output=True, check=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        stderr = getattr(e, "stderr", b"") or b""
+        raise ValueError(f"could not make a placeholder of {path}: "
+                         f"{stderr.decode('utf-8', 'replace').strip() or e}") from e
+    return "data:image/webp;base64," + base64.b64encode(result.stdout).decode("ascii")
+
+
+def card_placeholders(video_ids, thumbs_dir, index):
+    """Return {video_id: data URI} for the video IDs with a poster in thumbs_dir.
+
+    Placeholders are looked up in (and added to) the fingerprint index.
+    Films without a poster are left out; a poster ffmpeg cannot read is
+    reported as a warning and left out too.
+    """
+    name = probe_name()
+    placeholders = {}
+    for video_id in video_ids:
+        path = os.path.join(thumbs_dir, f"{video_id}.jpg")
+        if not os.path.isfile(path):
+            continue
+        digest = index.fingerprint(path)
+        placeholder = index.cached_probe(digest, name)
+        if placeholder is None:
+            try:
+                placeholder = compute_placeholder(path)
+            except ValueError as e:
+                print(f"Warning: {e}", file=sys.stderr)
+                continue
+            index.store_probe(digest, name, placeholder)
+        placeholders[video_id] = placeholder
+    return placeholders
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compute (and cache) the blurred card placeholders of a folder of posters."
+    )
+    parser.add_argument("thumbs_dir", help="The transcoder output's thumbs/ folder")
+    parser.add_argument(
+        "--video-id", action="append",
+        help="Only this film's placeholder (repeatable; default: every poster)"
+    )
+    parser.add_argument(
+        "--fingerprint-db",
+        help=f"Fingerprint index the placeholders are cached in (default: {fingerprint.default_db_path()})"
+    )
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.thumbs_dir):
+        print(f"Error: Thumbs directory not found: {args.thumbs_dir}", file=sys.stderr)
+        sys.exit(1)
+    video_ids = args.video_id or sorted(name[:-4] for name in os.listdir(args.thumbs_dir)
+                                        if name.endswith(".jpg")
+                                        and not name.startswith(f"{CARD_ATLAS_PREFIX}-"))
+    with fingerprint.FingerprintIndex(args.fingerprint_db) as index:
+        placeholders = card_placeholders(video_ids, args.thumbs_dir, index)
+    for video_id in video_ids:
+        placeholder = placeholders.get(video_id)
+        if placeholder is None:
+            print(f"  {video_id:<28} no placeholder")
+            continue
+        size = len(base64.b64decode(placeholder.partition(",")[2]))
+        print(f"  {video_id:<28} {size:>4} bytes ({len(placeholder)} characters inline)")
+
+
+if __name__ == "__main__":
+    main()
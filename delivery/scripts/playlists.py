@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Flyin' Iris — Master Playlist Builder
+
+Rewrites each film's master.m3u8 from its finished HLS output, with the
+BANDWIDTH (peak segment bitrate), AVERAGE-BANDWIDTH, CODECS and FRAME-RATE
+of every rung measured from the segments instead of the nominal values
+transcode.sh / transcode.ps1 write. transcode.py already writes measured
+master playlists; this re-runs the measurement over existing output trees
+(including ones already uploaded) without re-encoding anything.
+
+The rungs, their names and resolutions come from the existing master
+playlist; a shared audio rendition in {video_id}/audio/ is picked up and
+added to every rung's BANDWIDTH and CODECS. Rewritten playlists get their
+checksums updated in the transcode journal, so the next upload.py run
+PUTs just the changed master.m3u8 files.
+
+Usage:
+    python playlists.py -o ./output
+    python playlists.py -o ./output --video-id first-dance --video-id vows
+    python playlists.py -o ./output --dry-run
+"""
+
+import argparse
+import os
+import sys
+
+import transcode
+
+
+def read_master_ladder(path):
+    """Return the Rungs listed in a master playlist written by the transcoders.
+
+    Each EXT-X-STREAM-INF must point at {rung}/playlist.m3u8; the rung
+    keeps its RESOLUTION and (nominal) BANDWIDTH. video_bitrate is not
+    recorded in the playlist and is None.
+    """
+    ladder = []
+    for attributes, uri in transcode.read_master_playlist(path)[0]:
+        name = uri.split("/", 1)[0]
+        if uri != f"{name}/playlist.m3u8" or "RESOLUTION" not in attributes:
+            raise ValueError(f"unexpected variant {uri} in {path}")
+        width, height = (int(value) for value in attributes["RESOLUTION"].split("x"))
+        ladder.append(transcode.Rung(name, width, height, None, int(attributes.get("BANDWIDTH", 0))))
+    return ladder
+
+
+def find_films(output_dir):
+    """Return the video IDs under output_dir that have a master playlist."""
+    return sorted(name for name in os.listdir(output_dir)
+                  if not name.startswith(".")
+                  and os.path.isfile(os.path.join(output_dir, name, "master.m3u8")))
+
+
+def format_stats(name, stats):
+    """Return one report line for a rendition's RenditionStats."""
+    codecs = ",".join(stats.codecs) if stats.codecs else "unknown codecs"
+    line = f"    {name:<8} peak {stats.peak / 1000:>6.0f}k  avg {stats.average / 1000:>6.0f}k  {codecs}"
+    if stats.frame_rate:
+        line += f"  {stats.frame_rate:.3f} fps"
+    if stats.channels:
+        line += f"  {stats.channels} ch"
+    return line
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rewrite master.m3u8 files with bandwidth, codecs and frame rate measured from the segments."
+    )
+    parser.add_argument(
+        "-o", "--output-dir", default="./output",
+        help="Transcoder output directory (default: ./output)"
+    )
+    parser.add_argument(
+        "--video-id", action="append",
+        help="Only rewrite this film's master playlist (repeatable; default: every film)"
+    )
+    parser.add_argument(
+        "--journal",
+        help=f"Transcode journal whose checksums are updated (default: <output-dir>/{transcode.JOURNAL_NAME})"
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true",
+        help="Print the measured master playlists without writing them"
+    )
+    args = parser.parse_args()
+
+    output_dir = os.path.abspath(args.output_dir)
+    if not os.path.isdir(output_dir):
+        print(f"Error: Output directory not found: {output_dir}", file=sys.stderr)
+        sys.exit(1)
+    films = find_films(output_dir)
+    if args.video_id:
+        missing = sorted(set(args.video_id) - set(films))
+        if missing:
+            print(f"Error: No master.m3u8 for: {', '.join(missing)}", file=sys.stderr)
+            sys.exit(1)
+        films = [video_id for video_id in films if video_id in args.video_id]
+    if not films:
+        print(f"Error: No master playlists found in {output_dir}", file=sys.stderr)
+        sys.exit(1)
+
+    print("\n=== Flyin' Iris Master Playlists ===")
+    rewritten = []
+    failures = 0
+    for video_id in films:
+        video_out_dir = os.path.join(output_dir, video_id)
+        try:
+            ladder = read_master_ladder(os.path.join(video_out_dir, "master.m3u8"))
+            if args.dry_run:
+                stats = transcode.measure_renditions(video_out_dir, ladder)
+            else:
+                stats = transcode.write_master_playlist(video_out_dir, ladder)
+                rewritten.append(f"{video_id}/master.m3u8")
+        except (transcode.TranscodeError, OSError, ValueError) as e:
+            print(f"  FAILED  {video_id}: {e}", file=sys.stderr)
+            failures += 1
+            continue
+        print(f"  {video_id}")
+        for name in [rung.name for rung in ladder] + [transcode.AUDIO_DIR]:
+            if name in stats:
+                print(format_stats(name, stats[name]))
+        if args.dry_run:
+            print()
+            print(transcode.master_playlist(ladder, transcode.AUDIO_DIR in stats, stats))
+
+    if rewritten:
+        journal_path = args.journal or os.path.join(output_dir, transcode.JOURNAL_NAME)
+        updated = 0
+        if os.path.isfile(journal_path):
+            journal = transcode.Journal(journal_path)
+            updated = journal.update_checksums(transcode.record_checksums(output_dir, rewritten))
+        print(f"\nRewrote {len(rewritten)} master playlist(s); "
+              f"{updated} recorded checksum(s) updated in the journal")
+    if failures:
+        print(f"Failed:  {failures} film(s)", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Flyin' Iris — Encoding Profiles
+
+Lists the encoding profiles declared in profiles.json and builds the exact
+ffmpeg command line a profile gives for one source, so transcode.sh and
+transcode.ps1 encode with the same ladder, codec, preset, keyframe and
+packaging settings as transcode.py instead of keeping their own copy.
+
+A profile sets the rungs (name, box, fixed-ladder bitrate, per-title kbps
+range), the video and audio codecs, the x264 preset, the keyframe and
+segment lengths in seconds, scene-cut keyframes and the packaging
+(segment format, single file, shared audio). A profile can extend another
+and override a few keys, which is how A/B encodes are set up: add or pick
+a profile and pass its name (`--profile veryfast` to transcode.py,
+pipeline.py and transcode_queue.py submit; `-p` / `-Profile` to the shell
+scripts). The default profile is the registry's "default".
+
+The command is planned for the source like transcode.py plans it: GOP and
+segment lengths in whole frames at the source's frame rate, and a shared
+audio rendition only if the source has audio. The shell scripts use the
+profile's fixed ladder (no complexity probe), without the rungs above the
+source's resolution, so a 720p source is not upscaled to 1080p.
+
+`derivatives` prints the film's derivative pass the same way: the one
+ffmpeg decode that writes its poster, card thumbnails, sprite sheets and
+preview frames (see transcode.build_derivatives_command), with the card
+thumbnails in the formats this machine's ffmpeg can encode. It does not
+depend on the profile. With --mkdir it also writes the film's
+thumbnails.vtt, which only depends on the plan.
+
+Usage:
+    python profiles.py list
+    python profiles.py show veryfast
+    python profiles.py command -p cmaf ./exports/first-dance.mp4 ./output/first-dance
+    python profiles.py command --format sh --mkdir first-dance.mp4 ./output/first-dance
+    python profiles.py master first-dance.mp4 > ./output/first-dance/master.m3u8
+    python profiles.py derivatives --format sh --mkdir first-dance.mp4 ./output
+"""
+
+import argparse
+import json
+import os
+import shlex
+import sys
+
+import transcode
+
+# How `command` prints the argv: one argument per line (for reading), a
+# shell-quoted line (for eval in transcode.sh) or a JSON array (for
+# ConvertFrom-Json in transcode.ps1).
+FORMATS = ("lines", "sh", "json")
+
+
+def describe(profile):
+    """Return a profile as the JSON-ready dict `show` prints (extends resolved)."""
+    return {
+        "name": profile.name,
+        "description": profile.description,
+        "settings": {key: getattr(profile, key) for key in transcode.PROFILE_SETTINGS},
+        "ladder": [dict(rung._asdict(), kbps_range=list(profile.rung_limits_kbps[rung.name]))
+                   for rung in profile.ladder],
+        "packaging": profile.packaging._asdict(),
+    }
+
+
+def source_ladder(profile, src):
+    """Return a profile's fixed ladder without the rungs that would upscale src."""
+    return transcode.fit_ladder(*transcode.probe_video_size(src), profile.ladder)
+
+
+def film_command(profile, src, video_out_dir):
+    """Return the ffmpeg argv that encodes src into video_out_dir with a profile's fixed ladder.
+
+    Also returns the folders that argv writes into, which must exist
+    before ffmpeg runs.
+    """
+    ladder = source_ladder(profile, src)
+    encoding = transcode.plan_encoding(transcode.probe_frame_rate(src), profile)
+    has_audio = transcode.probe_audio_start(src) is not None
+    argv = transcode.build_hls_command(src, video_out_dir, encoding, ladder=ladder,
+                                       packaging=profile.packaging, has_audio=has_audio)
+    folders = [os.path.join(video_out_dir, rung.name) for rung in ladder]
+    if profile.packaging.shared_audio and has_audio:
+        folders.append(os.path.join(video_out_dir, transcode.AUDIO_DIR))
+    return argv, folders
+
+
+def derivatives_command(src, output_dir):
+    """Return the derivative-pass argv for src, the folder it writes into and its plan."""
+    video_id = os.path.splitext(os.path.basename(src))[0]
+    plan = transcode.plan_derivatives(transcode.probe_duration(src))
+    argv = transcode.build_derivatives_command(src, output_dir, video_id, plan, transcode.card_formats())
+    return argv, [os.path.join(output_dir, transcode.THUMBS_DIR, video_id)], plan
+
+
+def format_argv(argv, fmt):
+    if fmt == "sh":
+        return shlex.join(argv)
+    if fmt == "json":
+        return json.dumps(argv)
+    return "\n".join(argv)
+
+
+def print_argv(argv, folders, args):
+    """Print an argv in the --format asked for, creating its folders first if --mkdir."""
+    if args.mkdir:
+        for folder in folders:
+            os.makedirs(folder, exist_ok=True)
+    print(format_argv(argv, args.format))
+
+
+def add_format_arguments(parser, mkdir_help):
+    """Add the --format and --mkdir options of the argv-printing commands."""
+    parser.add_argument("--format", choices=FORMATS, default="lines",
+                        help="One argument per line, one shell-quoted line or a JSON array (default: lines)")
+    parser.add_argument("--mkdir", action="store_true", help=mkdir_help)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="List encoding profiles and build the ffmpeg command a profile gives for a source."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="List the profiles")
+    show_parser = commands.add_parser("show", help="Print a profile's settings, ladder and packaging as JSON")
+    show_parser.add_argument("profile", nargs="?", default=transcode.DEFAULT_PROFILE_NAME,
+                             help=f"Profile name (default: {transcode.DEFAULT_PROFILE_NAME})")
+    derivatives_parser = commands.add_parser(
+        "derivatives", help="Print the ffmpeg argv of one source's derivative pass (poster, sprites, previews)")
+    derivatives_parser.add_argument("src", help="Source MP4")
+    derivatives_parser.add_argument("output_dir", help="Output directory (stills go to its thumbs/ folder)")
+    add_format_arguments(derivatives_parser, "Create the thumbs/{video_id} folder the command writes into, "
+                                             "with the thumbnails.vtt track over its sprite sheets")
+    for name, help_text in (("command", "Print the ffmpeg argv that encodes one source"),
+                            ("master", "Print the nominal master.m3u8 for one source")):
+        sub = commands.add_parser(name, help=help_text)
+        sub.add_argument("-p", "--profile", default=transcode.DEFAULT_PROFILE_NAME,
+                         help=f"Profile name (default: {transcode.DEFAULT_PROFILE_NAME})")
+        sub.add_argument("src", help="Source MP4")
+        if name == "command":
+            sub.add_argument("video_out_dir", help="The film's output folder ({output}/{video_id})")
+            add_format_arguments(sub, "Create the rung (and audio) folders the command writes into")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        width = max(len(name) for name in transcode.PROFILES)
+        for name, profile in sorted(transcode.PROFILES.items()):
+            marker = "*" if name == transcode.DEFAULT_PROFILE_NAME else " "
+            print(f"{marker} {name:<{width}}  {profile.description}")
+        return
+
+    if args.command == "derivatives":
+        if not os.path.isfile(args.src):
+            print(f"Error: Source not found: {args.src}", file=sys.stderr)
+            sys.exit(1)
+        try:
+            argv, folders, plan = derivatives_command(args.src, args.output_dir)
+        except transcode.TranscodeError as e:
+            print(f"Error: {args.src}: {e}", file=sys.stderr)
+            sys.exit(1)
+        print_argv(argv, folders, args)
+        if args.mkdir:
+            video_id = os.path.basename(folders[0])
+            transcode.write_thumbnails_vtt(args.output_dir, video_id, plan)
+        return
+
+    profile = transcode.PROFILES.get(args.profile)
+    if profile is None:
+        print(f"Error: Unknown profile '{args.profile}' (known: {', '.join(sorted(transcode.PROFILES))})",
+              file=sys.stderr)
+        sys.exit(1)
+    if args.command == "show":
+        print(json.dumps(describe(profile), indent=2))
+        return
+
+    if not os.path.isfile(args.src):
+        print(f"Error: Source not found: {args.src}", file=sys.stderr)
+        sys.exit(1)
+    try:
+        if args.command == "master":
+            has_audio = transcode.probe_audio_start(args.src) is not None
+            sys.stdout.write(transcode.master_playlist(source_ladder(profile, args.src),
+                                                       profile.packaging.shared_audio and has_audio))
+            return
+        argv, folders = film_command(profile, args.src, args.video_out_dir)
+    except transcode.TranscodeError as e:
+        print(f"Error: {args.src}: {e}", file=sys.stderr)
+        sys.exit(1)
+    print_argv(argv, folders, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Flyin' Iris — Minimal S3 Client
+
+A small S3-compatible client (Cloudflare R2, or the local s3stub.py) built on
+the standard library: AWS Signature V4, path-style addressing, and one
+keep-alive HTTP connection per thread so a thread pool gets a pooled set of
+connections for free.
+
+Only the calls the delivery scripts need are implemented: single PUTs,
+multipart uploads, HEAD, DELETE and ListObjectsV2.
+"""
+
+import datetime
+import hashlib
+import hmac
+import http.client
+import os
+import threading
+import urllib.parse
+import xml.etree.ElementTree as ET
+
+EMPTY_SHA256 = hashlib.sha256(b"").hexdigest()
+S3_NS = "{http://s3.amazonaws.com/doc/2006-03-01/}"
+
+
+class S3Error(Exception):
+    """An S3 request failed. status is None for connection-level errors."""
+
+    def __init__(self, message, status=None, code=None):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+
+    @property
+    def retryable(self):
+        """Connection errors, throttling and server errors are worth retrying."""
+        return self.status is None or self.status == 429 or self.status >= 500
+
+
+def _quote(value, safe="-_.~"):
+    return urllib.parse.quote(value, safe=safe)
+
+
+def _hmac(key, msg):
+    return hmac.new(key, msg.encode("utf-8"), hashlib.sha256).digest()
+
+
+def sign_v4(method, host, path, query, headers, payload_hash,
+            access_key, secret_key, region="auto", service="s3", now=None):
+    """Return the headers (incl. Authorization) for a SigV4-signed request."""
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+    datestamp = now.strftime("%Y%m%d")
+
+    signed = {k.lower(): str(v).strip() for k, v in headers.items()}
+    signed["host"] = host
+    signed["x-amz-date"] = amz_date
+    signed["x-amz-content-sha256"] = payload_hash
+    names = sorted(signed)
+    canonical_headers = "".join(f"{name}:{signed[name]}\n" for name in names)
+    signed_headers = ";".join(names)
+    canonical_query = "&".join(f"{_quote(k)}={_quote(v)}" for k, v in sorted(query.items()))
+    canonical_request = "\n".join([
+        method, _quote(path, safe="/-_.~"), canonical_query,
+        canonical_headers, signed_headers, payload_hash,
+    ])
+
+    scope = f"{datestamp}/{region}/{service}/aws4_request"
+    string_to_sign = "\n".join([
+        "AWS4-HMAC-SHA256", amz_date, scope,
+        hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
+    ])
+    key = _hmac(("AWS4" + secret_key).encode("utf-8"), datestamp)
+    for part in (region, service, "aws4_request"):
+        key = _hmac(key, part)
+    signature = hmac.new(key, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+
+    signed["authorization"] = (f"AWS4-HMAC-SHA256 Credential={access_key}/{scope}, "
+                               f"SignedHeaders={signed_headers}, Signature={signature}")
+    return signed
+
+
+class S3Client:
+    """Path-style S3 client with one persistent connection per thread."""
+
+    def __init__(self, endpoint, access_key, secret_key, bucket, region="auto", timeout=120):
+        parsed = urllib.parse.urlparse(endpoint)
+        if parsed.scheme not in ("http", "https") or not parsed.netloc:
+            raise ValueError(f"endpoint must be an http(s) URL: {endpoint}")
+        self.scheme = parsed.scheme
+        self.host = parsed.netloc
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.bucket = bucket
+        self.region = region
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @classmethod
+    def from_env(cls, endpoint=None, bucket="fi-films"):
+        """Build a client from R2_* (or AWS_*) environment variables."""
+        env = os.environ
+        endpoint = endpoint or env.get("R2_ENDPOINT") or env.get("AWS_ENDPOINT_URL")
+        access_key = env.get("R2_ACCESS_KEY_ID") or env.get("AWS_ACCESS_KEY_ID")
+        secret_key = env.get("R2_SECRET_ACCESS_KEY") or env.get("AWS_SECRET_ACCESS_KEY")
+        missing = [name for name, value in (("R2_ENDPOINT", endpoint), ("R2_ACCESS_KEY_ID", access_key),
+                                            ("R2_SECRET_ACCESS_KEY", secret_key)) if not value]
+        if missing:
+            raise ValueError(f"missing credentials: set {', '.join(missing)}")
+        return cls(endpoint, access_key, secret_key, bucket)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn_cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+            conn = conn_cls(self.host, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def _reset_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+        self._local.conn = None
+
+    def request(self, method, key="", query=None, body=b"", headers=None, payload_hash=None):
+        """Send one signed request and return (status, headers, body).
+
+        payload_hash defaults to the SHA-256 of body; passing a checksum
+        recorded earlier makes the server reject a body that no longer
+        matches it. Raises S3Error for non-2xx responses.
+        """
+        query = query or {}
+        path = f"/{self.bucket}/{key}" if key else f"/{self.bucket}"
+        payload_hash = payload_hash or (hashlib.sha256(body).hexdigest() if body else EMPTY_SHA256)
+        signed = sign_v4(method, self.host, path, query, headers or {}, payload_hash,
+                         self.access_key, self.secret_key, self.region)
+        url = _quote(path, safe="/-_.~")
+        if query:
+            url += "?" + "&".join(f"{_quote(k)}={_quote(v)}" for k, v in sorted(query.items()))
+        signed["content-length"] = str(len(body))
+
+        try:
+            conn = self._connection()
+            conn.request(method, url, body=body, headers=signed)
+            response = conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            self._reset_connection()
+            raise S3Error(f"{method} {key}: {e}") from e
+
+        if response.status >= 300:
+            code, message = _error_details(data)
+            raise S3Error(f"{method} {key}: {response.status} {code or response.reason} {message}".strip(),
+                          response.status, code)
+        return response.status, {k.lower(): v for k, v in response.getheaders()}, data
+
+    def put_object(self, key, body, sha256=None, content_type=None):
+        """Upload body in one request and return its ETag."""
+        headers = {"content-type": content_type} if content_type else {}
+        _, headers, _ = self.request("PUT", key, body=body, headers=headers, payload_hash=sha256)
+        return headers.get("etag", "").strip('"')
+
+    def create_multipart_upload(self, key, content_type=None):
+        headers = {"content-type": content_type} if content_type else {}
+        _, _, data = self.request("POST", key, query={"uploads": ""}, headers=headers)
+        root = ET.fromstring(data)
+        return root.findtext(f"{S3_NS}UploadId") or root.findtext("UploadId")
+
+    def upload_part(self, key, upload_id, part_number, body, sha256=None):
+        _, headers, _ = self.request("PUT", key, query={"partNumber": str(part_number), "uploadId": upload_id},
+                                     body=body, payload_hash=sha256)
+        return headers.get("etag", "").strip('"')
+
+    def complete_multipart_upload(self, key, upload_id, parts):
+        """Complete an upload from [(part_number, etag)] and return the ETag."""
+        body = "<CompleteMultipartUpload>" + "".join(
+            f'<Part><PartNumber>{n}</PartNumber><ETag>"{etag}"</ETag></Part>' for n, etag in sorted(parts)
+        ) + "</CompleteMultipartUpload>"
+        _, _, data = self.request("POST", key, query={"uploadId": upload_id}, body=body.encode("utf-8"))
+        root = ET.fromstring(data)
+        return (root.findtext(f"{S3_NS}ETag") or root.findtext("ETag") or "").strip('"')
+
+    def abort_multipart_upload(self, key, upload_id):
+        self.request("DELETE", key, query={"uploadId": upload_id})
+
+    def delete_object(self, key):
+        self.request("DELETE", key)
+
+    def head_object(self, key):
+        """Return {"size", "etag"} for key, or None if it does not exist."""
+        try:
+            _, headers, _ = self.request("HEAD", key)
+        except S3Error as e:
+            if e.status == 404:
+                return None
+            raise
+        return {"size": int(headers.get("content-length", 0)), "etag": headers.get("etag", "").strip('"')}
+
+    def list_objects(self, prefix=""):
+        """Yield {"key", "size", "etag"} for every object under prefix."""
+        token = None
+        while True:
+            query = {"list-type": "2", "prefix": prefix}
+            if token:
+                query["continuation-token"] = token
+            _, _, data = self.request("GET", query=query)
+            root = ET.fromstring(data)
+            for item in root.iter(f"{S3_NS}Contents"):
+                yield {
+                    "key": item.findtext(f"{S3_NS}Key"),
+                    "size": int(item.findtext(f"{S3_NS}Size") or 0),
+                    "etag": (item.findtext(f"{S3_NS}ETag") or "").strip('"'),
+                }
+            if root.findtext(f"{S3_NS}IsTruncated") != "true":
+                return
+            token = root.findtext(f"{S3_NS}NextContinuationToken")
+
+
+def _error_details(data):
+    """Extract (code, message) from an S3 XML error body, if any."""
+    try:
+        root = ET.fromstring(data)
+    except ET.ParseError:
+        return None, ""
+    return root.findtext("Code"), root.findtext("Message") or ""
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Flyin' Iris — Local S3 Stand-in
+
+An in-memory S3-compatible server for exercising upload.py offline. It
+implements the subset of the API the uploader uses (PUT/HEAD/GET/DELETE
+objects, multipart uploads, ListObjectsV2), checks x-amz-content-sha256
+against each request body like S3/R2 do, and can inject latency and random
+503s so throughput and retry behaviour can be benchmarked. Signatures are
+not verified.
+
+Usage:
+    python s3stub.py --port 9000
+    python s3stub.py --port 9000 --latency-ms 30 --fail-rate 0.05
+"""
+
+import argparse
+import hashlib
+import http.server
+import random
+import threading
+import time
+import urllib.parse
+import uuid
+from xml.sax.saxutils import escape
+
+XMLNS = "http://s3.amazonaws.com/doc/2006-03-01/"
+
+
+class StubStore:
+    """Objects and in-progress multipart uploads, shared by all handlers."""
+
+    def __init__(self, latency=0.0, fail_rate=0.0, seed=None):
+        self.lock = threading.Lock()
+        self.objects = {}  # (bucket, key) -> (bytes, etag)
+        self.uploads = {}  # upload_id -> {"bucket", "key", "parts": {n: (bytes, md5)}}
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.failures_injected = 0
+
+    def should_fail(self):
+        with self.lock:
+            self.requests += 1
+            if self.fail_rate and self.random.random() < self.fail_rate:
+                self.failures_injected += 1
+                return True
+        return False
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so clients can pool connections
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def store(self):
+        return self.server.store
+
+    # --- plumbing ---
+
+    def _parse(self):
+        parsed = urllib.parse.urlparse(self.path)
+        path = urllib.parse.unquote(parsed.path).lstrip("/")
+        bucket, _, key = path.partition("/")
+        query = {k: v[0] for k, v in urllib.parse.parse_qs(parsed.query, keep_blank_values=True).items()}
+        return bucket, key, query
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send(self, status, body=b"", headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if self.command != "HEAD" or "Content-Length" not in (headers or {}):
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _error(self, status, code, message=""):
+        body = (f'<?xml version="1.0" encoding="UTF-8"?><Error><Code>{code}</Code>'
+                f"<Message>{escape(message)}</Message></Error>").encode("utf-8")
+        self._send(status, body, {"Content-Type": "application/xml"})
+
+    def _xml(self, body):
+        self._send(200, ('<?xml version="1.0" encoding="UTF-8"?>' + body).encode("utf-8"),
+                   {"Content-Type": "application/xml"})
+
+    def _preamble(self):
+        """Read the body, apply latency/failure injection and checksum checks.
+
+        Returns the body, or None if an error response was already sent.
+        """
+        body = self._body()
+        if self.store.latency:
+            time.sleep(self.store.latency)
+        if self.store.should_fail():
+            self._error(503, "SlowDown", "injected failure")
+            return None
+        claimed = self.headers.get("x-amz-content-sha256")
+        if claimed and claimed != "UNSIGNED-PAYLOAD" and claimed != hashlib.sha256(body).hexdigest():
+            self._error(400, "XAmzContentSHA256Mismatch",
+                        "The provided 'x-amz-content-sha256' header does not match what was computed.")
+            return None
+        return body
+
+    # --- verbs ---
+
+    def do_PUT(self):
+        body = self._preamble()
+        if body is None:
+            return
+        bucket, key, query = self._parse()
+        md5 = hashlib.md5(body).hexdigest()
+        with self.store.lock:
+            if "uploadId" in query:
+                upload = self.store.uploads.get(query["uploadId"])
+                if upload is None:
+                    return self._error(404, "NoSuchUpload")
+                upload["parts"][int(query["partNumber"])] = (body, md5)
+            else:
+                self.store.objects[(bucket, key)] = (body, md5)
+        self._send(200, headers={"ETag": f'"{md5}"'})
+
+    def do_POST(self):
+        body = self._preamble()
+        if body is None:
+            return
+        bucket, key, query = self._parse()
+        if "uploads" in query:
+            upload_id = uuid.uuid4().hex
+            with self.store.lock:
+                self.store.uploads[upload_id] = {"bucket": bucket, "key": key, "parts": {}}
+            return self._xml(f'<InitiateMultipartUploadResult xmlns="{XMLNS}"><Bucket>{escape(bucket)}</Bucket>'
+                             f"<Key>{escape(key)}</Key><UploadId>{upload_id}</UploadId>"
+                             "</InitiateMultipartUploadResult>")
+        if "uploadId" in query:
+            with self.store.lock:
+                upload = self.store.uploads.pop(query["uploadId"], None)
+                if upload is None:
+                    return self._error(404, "NoSuchUpload")
+                numbers = sorted(upload["parts"])
+                data = b"".join(upload["parts"][n][0] for n in numbers)
+                digest = hashlib.md5(b"".join(bytes.fromhex(upload["parts"][n][1]) for n in numbers))
+                etag = f"{digest.hexdigest()}-{len(numbers)}"
+                self.store.objects[(bucket, key)] = (data, etag)
+            return self._xml(f'<CompleteMultipartUploadResult xmlns="{XMLNS}"><Key>{escape(key)}</Key>'
+                             f'<ETag>"{etag}"</ETag></CompleteMultipartUploadResult>')
+        self._error(400, "InvalidRequest")
+
+    def do_GET(self):
+        if self._preamble() is None:
+            return
+        bucket, key, query = self._parse()
+        if not key and query.get("list-type") == "2":
+            return self._list(bucket, query)
+        with self.store.lock:
+            obj = self.store.objects.get((bucket, key))
+        if obj is None:
+            return self._error(404, "NoSuchKey")
+        self._send(200, obj[0], {"ETag": f'"{obj[1]}"'})
+
+    def do_HEAD(self):
+        if self._preamble() is None:
+            return
+        bucket, key, _ = self._parse()
+        with self.store.lock:
+            obj = self.store.objects.get((bucket, key))
+        if obj is None:
+            return self._send(404)
+        self._send(200, headers={"ETag": f'"{obj[1]}"', "Content-Length": str(len(obj[0]))})
+
+    def do_DELETE(self):
+        if self._preamble() is None:
+            return
+        bucket, key, query = self._parse()
+        with self.store.lock:
+            if "uploadId" in query:
+                self.store.uploads.pop(query["uploadId"], None)
+            else:
+                self.store.objects.pop((bucket, key), None)
+        self._send(204)
+
+    def _list(self, bucket, query):
+        prefix = query.get("prefix", "")
+        start = query.get("continuation-token", "")
+        max_keys = int(query.get("max-keys", 1000))
+        with self.store.lock:
+            keys = sorted(k for (b, k) in self.store.objects if b == bucket and k.startswith(prefix) and k > start)
+            page = keys[:max_keys]
+            items = [(k, self.store.objects[(bucket, k)]) for k in page]
+        truncated = len(keys) > max_keys
+        contents = "".join(f"<Contents><Key>{escape(k)}</Key><Size>{len(data)}</Size>"
+                           f'<ETag>"{etag}"</ETag></Contents>' for k, (data, etag) in items)
+        token = f"<NextContinuationToken>{escape(page[-1])}</NextContinuationToken>" if truncated else ""
+        self._xml(f'<ListBucketResult xmlns="{XMLNS}"><Name>{escape(bucket)}</Name>'
+                  f"<Prefix>{escape(prefix)}</Prefix><KeyCount>{len(items)}</KeyCount>"
+                  f"<IsTruncated>{'true' if truncated else 'false'}</IsTruncated>{token}{contents}"
+                  "</ListBucketResult>")
+
+
+class StubS3Server(http.server.ThreadingHTTPServer):
+    """Threaded stub server; start() runs it on a background thread."""
+
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, fail_rate=0.0, seed=None):
+        super().__init__((host, port), StubHandler)
+        self.store = StubStore(latency, fail_rate, seed)
+        self._thread = None
+
+    @property
+    def endpoint(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run an in-memory S3-compatible stub server.")
+    parser.add_argument("--host", default="127.0.0.1", help="Bind address (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=9000, help="Port (default: 9000)")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Added latency per request")
+    parser.add_argument("--fail-rate", type=float, default=0, help="Fraction of requests answered with 503")
+    args = parser.parse_args()
+
+    server = StubS3Server(args.host, args.port, args.latency_ms / 1000, args.fail_rate)
+    print(f"S3 stub listening on {server.endpoint} (any credentials accepted)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        store = server.store
+        print(f"\n{store.requests} request(s), {store.failures_injected} injected failure(s), "
+              f"{len(store.objects)} object(s) stored")
+
+
+if __name__ == "__main__":
+    main()
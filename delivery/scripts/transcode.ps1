@@ -3,9 +3,12 @@
     Transcodes MP4 video files into multi-bitrate HLS streams for the Flyin' Iris delivery platform.
 
 .DESCRIPTION
-    For each MP4 in InputDir, creates 3 HLS quality variants (1080p, 720p, 480p),
-    generates a master playlist, extracts a thumbnail, and updates the couple config
-    JSON with detected durations.
+    For each MP4 in InputDir, creates the HLS quality variants of an encoding profile
+    (default: 1080p, 720p, 480p, none above the source's resolution), generates a
+    master playlist, cuts the poster, card thumbnails, sprite sheets and preview frames
+    from one decode, and updates the couple config JSON with detected durations. The ffmpeg command comes from
+    the profile registry (profiles.json, through profiles.py), the same one transcode.py
+    encodes with, so Python is required.
 
 .PARAMETER InputDir
     Directory containing source MP4 files.
@@ -16,6 +19,10 @@
 .PARAMETER OutputDir
     Output directory for HLS files (default: ./output).
 
+.PARAMETER Profile
+    Encoding profile from profiles.json (default: the registry's default; list them
+    with: python profiles.py list).
+
 .EXAMPLE
     .\transcode.ps1 -InputDir "C:\Videos\amanda-boris" -ConfigFile ".\sample\amanda-boris.json"
 #>
@@ -27,7 +34,9 @@ param(
     [Parameter(Mandatory=$true)]
     [string]$ConfigFile,
 
-    [string]$OutputDir = "./output"
+    [string]$OutputDir = "./output",
+
+    [string]$Profile = ""
 )
 
 $ErrorActionPreference = "Stop"
@@ -44,6 +53,31 @@ if (-not (Get-Command "ffprobe" -ErrorAction SilentlyContinue)) {
     exit 1
 }
 
+# The AVIF and WebP card thumbnails need these encoders; without one the
+# cards are written in the other formats (profiles.py leaves it out)
+$ffmpegEncoders = & ffmpeg -hide_banner -encoders 2>$null
+foreach ($encoder in "libaom-av1", "libwebp") {
+    if (-not ($ffmpegEncoders | Select-String -SimpleMatch " $encoder ")) {
+        Write-Warning "ffmpeg lacks the $encoder encoder; the card thumbnails are written without it."
+    }
+}
+
+$python = Get-Command "python3", "python" -ErrorAction SilentlyContinue | Select-Object -First 1
+if (-not $python) {
+    Write-Error "ERROR: Python not found in PATH. It builds the ffmpeg commands from profiles.json."
+    exit 1
+}
+$profilesScript = Join-Path $PSScriptRoot "profiles.py"
+$profileArgs = @()
+if ($Profile) {
+    $profileArgs = @("-p", $Profile)
+}
+& $python.Source $profilesScript show @($Profile | Where-Object { $_ }) | Out-Null
+if ($LASTEXITCODE -ne 0) {
+    Write-Error "ERROR: Could not load profile '$(if ($Profile) { $Profile } else { "default" })' from profiles.json"
+    exit 1
+}
+
 if (-not (Test-Path $InputDir -PathType Container)) {
     Write-Error "ERROR: Input directory not found: $InputDir"
     exit 1
@@ -82,6 +116,7 @@ Write-Host "=== Flyin' Iris HLS Transcoder ===" -ForegroundColor Cyan
 Write-Host "Input:  $InputDir"
 Write-Host "Output: $OutputDir"
 Write-Host "Config: $ConfigFile"
+Write-Host "Profile: $(if ($Profile) { $Profile } else { "default" })"
 Write-Host "Found $($mp4Files.Count) MP4 file(s)"
 Write-Host ""
 
@@ -114,45 +149,25 @@ foreach ($mp4 in $mp4Files) {
     $totalSeconds = [int][math]::Floor($durationSec % 60)
     $durationFormatted = "{0}:{1:D2}" -f $totalMinutes, $totalSeconds
 
-    # --- Create output directories ---
-    foreach ($quality in @("1080p", "720p", "480p")) {
-        New-Item -ItemType Directory -Path (Join-Path $videoOutDir $quality) -Force | Out-Null
-    }
-
-    # --- Transcode to HLS (single-pass, 3 qualities) ---
-    $segDir1080 = (Join-Path (Join-Path $videoOutDir "1080p") "segment%03d.ts")
-    $playlist1080 = (Join-Path (Join-Path $videoOutDir "1080p") "playlist.m3u8")
-    $segDir720 = (Join-Path (Join-Path $videoOutDir "720p") "segment%03d.ts")
-    $playlist720 = (Join-Path (Join-Path $videoOutDir "720p") "playlist.m3u8")
-    $segDir480 = (Join-Path (Join-Path $videoOutDir "480p") "segment%03d.ts")
-    $playlist480 = (Join-Path (Join-Path $videoOutDir "480p") "playlist.m3u8")
-
+    # --- Transcode to HLS (single decode, every rung the source fills) ---
+    # profiles.py plans the command for this source: the profile's ladder
+    # without the rungs above the source's resolution, codec flags and
+    # packaging, with keyframes and segments in whole frames at the
+    # source's frame rate.
     $ffmpegLog = Join-Path $videoOutDir "ffmpeg.log"
-    $filterComplex = "[0:v]split=3[v1][v2][v3];[v1]scale=1920:1080:force_original_aspect_ratio=decrease,pad=1920:1080:(ow-iw)/2:(oh-ih)/2[v1out];[v2]scale=1280:720:force_original_aspect_ratio=decrease,pad=1280:720:(ow-iw)/2:(oh-ih)/2[v2out];[v3]scale=854:480:force_original_aspect_ratio=decrease,pad=854:480:(ow-iw)/2:(oh-ih)/2[v3out]"
+    $ffmpegJson = & $python.Source $profilesScript command @profileArgs --format json --mkdir $inputPath $videoOutDir
+    if ($LASTEXITCODE -ne 0) {
+        Write-Host " FAILED (could not plan the encode)" -ForegroundColor Red
+        $failCount++
+        continue
+    }
+    $ffmpegArgv = ($ffmpegJson | Out-String) | ConvertFrom-Json
 
     # Build argument string for Start-Process (handles spaces in paths)
-    $ffmpegArgStr = "-nostdin -i `"$inputPath`" -filter_complex `"$filterComplex`" " +
-        "-map `"[v1out]`" -map 0:a? " +
-        "-c:v:0 libx264 -b:v:0 5000k -c:a:0 aac -b:a:0 128k " +
-        "-preset medium -g 48 -keyint_min 48 " +
-        "-hls_time 4 -hls_segment_type mpegts " +
-        "-hls_segment_filename `"$segDir1080`" " +
-        "-hls_playlist_type vod `"$playlist1080`" " +
-        "-map `"[v2out]`" -map 0:a? " +
-        "-c:v:1 libx264 -b:v:1 2500k -c:a:1 aac -b:a:1 128k " +
-        "-preset medium -g 48 -keyint_min 48 " +
-        "-hls_time 4 -hls_segment_type mpegts " +
-        "-hls_segment_filename `"$segDir720`" " +
-        "-hls_playlist_type vod `"$playlist720`" " +
-        "-map `"[v3out]`" -map 0:a? " +
-        "-c:v:2 libx264 -b:v:2 1000k -c:a:2 aac -b:a:2 128k " +
-        "-preset medium -g 48 -keyint_min 48 " +
-        "-hls_time 4 -hls_segment_type mpegts " +
-        "-hls_segment_filename `"$segDir480`" " +
-        "-hls_playlist_type vod `"$playlist480`" " +
-        "-y"
-
-    $ffmpegProcess = Start-Process -FilePath "ffmpeg" -ArgumentList $ffmpegArgStr -NoNewWindow -Wait -PassThru -RedirectStandardError $ffmpegLog
+    $ffmpegArgStr = ($ffmpegArgv | Select-Object -Skip 1 | ForEach-Object { "`"$_`"" }) -join " "
+    $ffmpegOut = Join-Path $videoOutDir "ffmpeg.progress"
+
+    $ffmpegProcess = Start-Process -FilePath $ffmpegArgv[0] -ArgumentList $ffmpegArgStr -NoNewWindow -Wait -PassThru -RedirectStandardError $ffmpegLog -RedirectStandardOutput $ffmpegOut
     if ($ffmpegProcess.ExitCode -ne 0) {
         Write-Host " FAILED (ffmpeg exit code $($ffmpegProcess.ExitCode))" -ForegroundColor Red
         Write-Host "  Check log: $ffmpegLog" -ForegroundColor DarkGray
@@ -160,30 +175,31 @@ foreach ($mp4 in $mp4Files) {
         continue
     }
 
-    # --- Generate master.m3u8 ---
-    $masterPlaylist = @"
-#EXTM3U
-#EXT-X-VERSION:3
-#EXT-X-STREAM-INF:BANDWIDTH=5128000,RESOLUTION=1920x1080,NAME="1080p"
-1080p/playlist.m3u8
-#EXT-X-STREAM-INF:BANDWIDTH=2628000,RESOLUTION=1280x720,NAME="720p"
-720p/playlist.m3u8
-#EXT-X-STREAM-INF:BANDWIDTH=1128000,RESOLUTION=854x480,NAME="480p"
-480p/playlist.m3u8
-"@
+    # --- Generate master.m3u8 (nominal; measured at the end) ---
+    $masterPlaylist = ((& $python.Source $profilesScript master @profileArgs $inputPath) -join "`n") + "`n"
     $masterPath = Join-Path $videoOutDir "master.m3u8"
     [System.IO.File]::WriteAllText($masterPath, $masterPlaylist, [System.Text.UTF8Encoding]::new($false))
 
-    # --- Generate thumbnail (frame at 25% duration) ---
-    $thumbTime = $durationSec * 0.25
-    $thumbPath = Join-Path (Join-Path $OutputDir "thumbs") "$videoId.jpg"
+    # --- Derivatives (poster, card thumbs, sprite sheets, preview frames) ---
+    # One decode of the source feeds every still through one filter graph,
+    # instead of one seek-and-decode per still.
     $thumbLog = Join-Path $videoOutDir "thumb.log"
-    $thumbArgStr = "-nostdin -ss $thumbTime -i `"$inputPath`" -frames:v 1 " +
-        "-vf `"scale=1280:720:force_original_aspect_ratio=decrease,pad=1280:720:(ow-iw)/2:(oh-ih)/2`" " +
-        "-q:v 2 `"$thumbPath`" -y"
-    $thumbProcess = Start-Process -FilePath "ffmpeg" -ArgumentList $thumbArgStr -NoNewWindow -Wait -PassThru -RedirectStandardError $thumbLog
-    if ($thumbProcess.ExitCode -ne 0) {
-        Write-Host " (thumbnail failed)" -ForegroundColor DarkYellow -NoNewline
+    $thumbOut = Join-Path $videoOutDir "thumb.progress"
+    $derivativesNote = ""
+    $derivativesTimer = [System.Diagnostics.Stopwatch]::StartNew()
+    $derivativesJson = & $python.Source $profilesScript derivatives --format json --mkdir $inputPath $OutputDir
+    if ($LASTEXITCODE -ne 0) {
+        Write-Host " (thumbnails failed)" -ForegroundColor DarkYellow -NoNewline
+    } else {
+        $derivativesArgv = ($derivativesJson | Out-String) | ConvertFrom-Json
+        $derivativesArgStr = ($derivativesArgv | Select-Object -Skip 1 | ForEach-Object { "`"$_`"" }) -join " "
+        $thumbProcess = Start-Process -FilePath $derivativesArgv[0] -ArgumentList $derivativesArgStr -NoNewWindow -Wait -PassThru -RedirectStandardError $thumbLog -RedirectStandardOutput $thumbOut
+        if ($thumbProcess.ExitCode -ne 0) {
+            Write-Host " (thumbnails failed, see $thumbLog)" -ForegroundColor DarkYellow -NoNewline
+        } else {
+            $derivativesNote = ", stills in {0:N1}s" -f $derivativesTimer.Elapsed.TotalSeconds
+            Remove-Item -Path $thumbLog -ErrorAction SilentlyContinue
+        }
     }
 
     # --- Update config JSON duration ---
@@ -200,17 +216,34 @@ foreach ($mp4 in $mp4Files) {
         Write-Host " (no matching config entry)" -ForegroundColor DarkYellow -NoNewline
     }
 
-    Write-Host " done ($durationFormatted)" -ForegroundColor Green
+    Write-Host " done ($durationFormatted$derivativesNote)" -ForegroundColor Green
 
     # Clean up log files on success
     Remove-Item -Path $ffmpegLog -ErrorAction SilentlyContinue
-    Remove-Item -Path $thumbLog -ErrorAction SilentlyContinue
+    Remove-Item -Path $ffmpegOut -ErrorAction SilentlyContinue
+    Remove-Item -Path $thumbOut -ErrorAction SilentlyContinue
 }
 
 # --- Write updated config JSON ---
 $updatedJson = $config | ConvertTo-Json -Depth 10
 [System.IO.File]::WriteAllText($ConfigFile, $updatedJson, [System.Text.UTF8Encoding]::new($false))
 
+# --- Measure master playlists ---
+# The master.m3u8 files above have nominal bandwidths and no CODECS;
+# playlists.py rewrites them with values measured from the segments.
+& $python.Source (Join-Path $PSScriptRoot "playlists.py") -o $OutputDir | Out-Null
+if ($LASTEXITCODE -ne 0) {
+    Write-Host "WARNING: Could not measure master playlists; they keep nominal bandwidths." -ForegroundColor DarkYellow
+}
+
+# --- Card atlas ---
+# Every film's card thumbnail in one image for the collection grid,
+# recorded in the config for generate.py
+& $python.Source (Join-Path $PSScriptRoot "atlas.py") -o $OutputDir -c $ConfigFile | Out-Null
+if ($LASTEXITCODE -ne 0) {
+    Write-Host "WARNING: Could not build the card atlas; the page loads each film's card thumbnail." -ForegroundColor DarkYellow
+}
+
 # --- Summary ---
 Write-Host ""
 Write-Host "=== Transcode Complete ===" -ForegroundColor Cyan
@@ -0,0 +1,2482 @@
+#!/usr/bin/env python3
+"""
+Flyin' Iris — HLS Transcoder
+
+Transcodes a folder of MP4s into multi-bitrate HLS streams, like
+transcode.sh / transcode.ps1, but runs the ffmpeg jobs for several films
+at once on a bounded worker pool. For each MP4 it writes the 1080p/720p/480p
+variants, master.m3u8 (with bandwidths and codecs measured from the
+segments) and its stills (poster, card thumbnails, scrubbing sprite sheets
+and preview frames, all from one decode of the source), streams ffmpeg
+progress, retries failed jobs, and updates the couple config JSON with
+detected durations and the couple's card atlas (every collection card's
+thumbnail in one image, see write_card_atlas).
+
+Every film is encoded with one profile (--profile, from profiles.json) at
+its own frame rate: keyframes every 2 seconds and 4-second segments (with
+the standard profile), both rounded to whole frames, so every segment has
+the same length and starts on the same frame in every rung (4.004 s at
+29.97 fps).
+
+Films at least twice --chunk-seconds long can be encoded in chunks: the
+source is split at segment boundaries, the chunks run as separate jobs on
+the pool (so one long film uses every core), and their segments are
+stitched back into one continuous playlist per rung. The audio track is
+encoded once and sliced on AAC frame boundaries, and every chunk's
+timestamps are offset to its position in the film, so the joins have no
+gaps, overlaps or discontinuities.
+
+By default the audio is not muxed into the rungs: it is encoded once per
+film into an audio-only rendition that master.m3u8 references through an
+EXT-X-MEDIA audio group, so it is stored, uploaded and downloaded once
+instead of once per rung (--muxed-audio restores the transcode.sh layout).
+
+Finished jobs are checkpointed in {output}/.transcode-journal.json, keyed by
+the source's content hash and the encoding profile, so a rerun after a
+crash (or after adding one film) only transcodes the new work. Source
+hashes are cached in the fingerprint index (see fingerprint.py).
+
+Output layout (what upload.sh and the video Worker expect):
+    {output}/{video_id}/master.m3u8
+    {output}/{video_id}/{1080p,720p,480p}/playlist.m3u8 + segmentNNN.ts
+    {output}/{video_id}/audio/playlist.m3u8 + segmentNNN.ts (shared audio)
+    {output}/thumbs/{video_id}.jpg (poster)
+    {output}/thumbs/{video_id}/card-{width}.{avif,webp,jpg}, sprite-NNN.jpg, preview-NN.jpg
+    {output}/thumbs/{video_id}/thumbnails.vtt (scrubbing track over the sprites)
+    {output}/thumbs/cards-{digest}-{width}.{avif,webp,jpg} (the couple's card atlas)
+
+Usage:
+    python transcode.py --input-dir ./exports/amanda-boris --config amanda-boris.json
+    python transcode.py -i ./exports/amanda-boris -c amanda-boris.json -o ./output --workers 3
+    python transcode.py -i ./exports/amanda-boris -c amanda-boris.json --force
+    python transcode.py -i ./exports/amanda-boris -c amanda-boris.json --chunk-seconds 120
+"""
+
+import argparse
+import bisect
+import collections
+import concurrent.futures
+import fractions
+import glob
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+import fingerprint
+
+
+Rung = collections.namedtuple("Rung", ["name", "width", "height", "video_bitrate", "bandwidth"])
+
+# NAME=value pairs of an HLS attribute list; quoted values may contain commas.
+HLS_ATTRIBUTE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+# Segment container: MPEG-TS (.ts, what transcode.sh writes) or fMP4/CMAF
+# (one init.mp4 per rung plus .m4s segments, referenced by EXT-X-MAP;
+# roughly 10% smaller than TS and able to carry HEVC/AV1).
+SEGMENT_FORMATS = {"ts": ("mpegts", ".ts"), "fmp4": ("fmp4", ".m4s")}
+INIT_SEGMENT = "init.mp4"
+
+# Single-file packaging: one stream.ts / stream.m4s per rung (fMP4 with
+# the init segment at its start) and EXT-X-BYTERANGE playlists, so a film
+# is a handful of R2 objects instead of one per 4-second segment.
+SINGLE_FILE_STEM = "stream"
+
+# Shared audio: one audio-only rendition per film in AUDIO_DIR, listed in
+# master.m3u8 as the AUDIO_GROUP group that every (video-only) rung uses.
+AUDIO_DIR = "audio"
+AUDIO_GROUP = "aac"
+
+# How a film's HLS output is packaged: segment_format is a SEGMENT_FORMATS
+# key, single_file selects byte-range stream files, shared_audio the
+# audio-only rendition. Part of the profile digest like the ladder.
+Packaging = collections.namedtuple("Packaging", ["segment_format", "single_file", "shared_audio"])
+
+# Encoding profiles, declared in profiles.json next to this script (also
+# read by transcode.sh / transcode.ps1 through profiles.py). A profile is
+# the codec settings every rung of every film shares, its ladder (each
+# rung with its fixed-ladder bitrate and the kbps range a per-title ladder
+# may pick from) and its default packaging; a profile may extend another
+# and override some of its keys. Keyframe interval and segment length are
+# given in seconds and turned into whole frames at each film's frame rate
+# (see plan_encoding), so a segment holds a whole number of GOPs and has
+# the same exact length, with keyframes on the same frames, in every rung.
+# scene_cut lets x264 add keyframes at scene changes too (segment
+# boundaries are then forced); without it every GOP is exactly
+# gop_seconds long. The profile name is not part of the journal's
+# settings key, only the flags it produces.
+Profile = collections.namedtuple(
+    "Profile", ["name", "description", "video_codec", "preset", "gop_seconds", "segment_seconds",
+                "scene_cut", "audio_codec", "audio_bitrate", "ladder", "rung_limits_kbps", "packaging"])
+PROFILES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles.json")
+PROFILE_SETTINGS = ("video_codec", "preset", "gop_seconds", "segment_seconds", "scene_cut",
+                    "audio_codec", "audio_bitrate")
+
+
+def read_profiles(path=PROFILES_PATH):
+    """Read a profile registry; return ({name: Profile}, default profile name).
+
+    Raises ValueError for a registry that cannot be read or a profile with
+    missing or invalid settings.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            registry = json.load(f)
+        declared = registry["profiles"]
+        default = registry.get("default", "")
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"could not read profile registry {path}: {e}") from e
+
+    def resolve(name, seen=()):
+        if name not in declared:
+            raise ValueError(f"unknown profile {name!r} in {path}")
+        if name in seen:
+            raise ValueError(f"profile {name!r} extends itself in {path}")
+        entry = dict(declared[name])
+        base = entry.pop("extends", None)
+        if base is None:
+            return entry
+        merged = resolve(base, seen + (name,))
+        packaging = dict(merged.get("packaging", {}), **entry.pop("packaging", {}))
+        merged.update(entry, packaging=packaging)
+        return merged
+
+    profiles = {}
+    for name in declared:
+        entry = resolve(name)
+        try:
+            audio_kbps = int(entry["audio_bitrate"].rstrip("k"))
+            ladder = tuple(Rung(rung["name"], int(rung["width"]), int(rung["height"]), rung["video_bitrate"],
+                                (int(rung["video_bitrate"].rstrip("k")) + audio_kbps) * 1000)
+                           for rung in entry["ladder"])
+            limits = {rung["name"]: tuple(int(kbps) for kbps in rung["kbps_range"]) for rung in entry["ladder"]}
+            packaging = Packaging(**entry["packaging"])
+            profile = Profile(name, entry.get("description", ""), *(entry[key] for key in PROFILE_SETTINGS),
+                              ladder, limits, packaging)
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            raise ValueError(f"profile {name!r} in {path} is incomplete or invalid: {e!r}") from e
+        if not ladder or packaging.segment_format not in SEGMENT_FORMATS:
+            raise ValueError(f"profile {name!r} in {path} needs rungs and a segment format "
+                             f"({', '.join(sorted(SEGMENT_FORMATS))})")
+        if not profile.gop_seconds > 0 or not profile.segment_seconds >= profile.gop_seconds:
+            raise ValueError(f"profile {name!r} in {path} needs 0 < gop_seconds <= segment_seconds")
+        profiles[name] = profile
+    if default not in profiles:
+        raise ValueError(f"default profile {default!r} is not defined in {path}")
+    return profiles, default
+
+
+PROFILES, DEFAULT_PROFILE_NAME = read_profiles()
+DEFAULT_PROFILE = PROFILES[DEFAULT_PROFILE_NAME]
+# The default profile's ladder (the fixed ladder transcode.sh has always
+# used; bandwidth is video + audio) and packaging. Per-title ladders (see
+# plan_ladder) use a profile's rung names and boxes.
+LADDER = DEFAULT_PROFILE.ladder
+DEFAULT_PACKAGING = DEFAULT_PROFILE.packaging
+
+# A film's encoding: its profile at its frame rate (a Fraction), with the
+# GOP and segment lengths in frames and the exact segment length in
+# seconds (4.004 s at 29.97 fps: 120 frames, not a drifting 119.88).
+Encoding = collections.namedtuple(
+    "Encoding", ["profile", "frame_rate", "gop_frames", "segment_frames", "segment_seconds"])
+# Frame rates above this are bogus (timestamp-derived rates of VFR files);
+# ffmpeg's own frame rate guess draws the line at the same place.
+MAX_FRAME_RATE = 210
+# -hls_time is set this many microseconds below the exact segment length,
+# so rounding a boundary frame's timestamp to the muxer's time base never
+# moves it past the split point (ffmpeg splits at the first keyframe at or
+# after each multiple of -hls_time).
+SPLIT_MARGIN_US = 100
+
+
+# Measured master playlists: every rendition's segment sizes give its peak
+# and average bitrate (BANDWIDTH / AVERAGE-BANDWIDTH); its first segment is
+# parsed for RFC 6381 codec strings (CODECS), the frame rate and the audio
+# channel count. codecs is None when a codec is not recognised (only
+# H.264 and AAC are, the PMT stream types below for TS), frame_rate and
+# channels are None for renditions without video or audio.
+PEAK_MIN_SECONDS = 1.0
+TS_PACKET_SIZE = 188
+TS_STREAM_TYPES = {0x1b: "h264", 0x0f: "aac"}
+RenditionStats = collections.namedtuple(
+    "RenditionStats", ["peak", "average", "codecs", "frame_rate", "channels"])
+
+# Per-title ladder. A quick CRF encode of a few sample windows at probe
+# size measures how hard a film is to compress; each rung gets that rate
+# scaled to its picture size (bitrate grows about as pixels^0.75 at equal
+# quality), clamped to the rung's range. A rung is dropped if it would
+# upscale the source or would save too little over the rung above it.
+PROBE_SIZE = (640, 360)
+PROBE_CRF = 21
+PROBE_PRESET = "veryfast"
+PROBE_WINDOWS = 6
+PROBE_WINDOW_SECONDS = 8
+LADDER_EXPONENT = 0.75
+RUNG_STEP = 1.5
+UPSCALE_TOLERANCE = 1.02
+# Complexity probes run side by side when planning (a probe at 360p
+# veryfast keeps about two cores busy).
+PROBE_WORKERS = max(1, (os.cpu_count() or 1) // 2)
+
+# Derivatives: every still the site shows for a film, cut from one decode
+# of the source by one ffmpeg filter graph (build_derivatives_command):
+# the poster at THUMB_POSITION, card thumbnails of the same frame, sprite
+# sheets of SPRITE_TILE tiles for scrubbing (one tile per
+# SPRITE_INTERVAL seconds, at most SPRITE_MAX_TILES per film) and
+# PREVIEW_FRAMES evenly spaced preview frames. The poster stays at
+# {output}/thumbs/{video_id}.jpg; the rest go to {output}/thumbs/{video_id}/.
+THUMB_SIZE = (1280, 720)
+THUMB_POSITION = 0.25
+# Card thumbnails: the poster frame at each width in each format, for the
+# <picture> srcset generate.py writes (AVIF first, JPEG as the fallback).
+# AVIF and WebP need the encoders in CARD_ENCODERS; an ffmpeg without one
+# (distro builds often lack libaom) still transcodes, and the cards are
+# written in the formats it has (card_formats).
+CARD_WIDTHS = (320, 480, 640, 960)
+CARD_FORMATS = {
+    "avif": ["-c:v", "libaom-av1", "-still-picture", "1", "-crf", "32", "-cpu-used", "6"],
+    "webp": ["-c:v", "libwebp", "-quality", "75"],
+    "jpg": ["-q:v", "4"],
+}
+CARD_ENCODERS = {"avif": "libaom-av1", "webp": "libwebp"}
+# Card atlas: the card thumbnail (its poster, scaled) of every film in the
+# collection grid (all but the featured one) laid out in one image per
+# couple, at each card width in each card format, so the grid's first
+# render fetches one image instead of one per film.
+# Tiles fill rows left to right in a roughly square grid, so the browser
+# decodes a compact image rather than a tall strip; neither side of the
+# widest atlas may pass CARD_ATLAS_MAX_SIDE (WebP's 16383px limit). The
+# file name carries a digest of the posters, so a re-cut atlas
+# gets a new URL under the Worker's year-long image cache; its tile
+# offsets are recorded in the couple config's "card_atlas" for generate.py.
+CARD_ATLAS_PREFIX = "cards"
+CARD_ATLAS_MAX_SIDE = 16383
+SPRITE_TILE = (160, 90)
+SPRITE_GRID = (10, 10)
+SPRITE_INTERVAL = 2
+SPRITE_MAX_TILES = 400
+PREVIEW_SIZE = (480, 270)
+PREVIEW_FRAMES = 12
+THUMBS_DIR = "thumbs"
+# WebVTT thumbnail track over the sprite sheets (players show the tile of
+# the cue under the scrub position; see thumbnails_vtt).
+THUMBNAILS_VTT = "thumbnails.vtt"
+
+# A film's derivative plan: the poster frame's time, the sprite tiles (one
+# at the middle of each sprite_step-second slice of the film) laid out
+# sprite_grid (columns, rows) per sheet, and the spacing of the preview
+# frames (also taken at the middle of their slices). A film too short to
+# fill a SPRITE_GRID sheet gets a sheet with fewer rows.
+Derivatives = collections.namedtuple("Derivatives", ["poster_at", "sprite_step", "sprite_tiles",
+                                                     "sprite_grid", "sprite_sheets", "preview_step"])
+
+# Rough per-job resource needs used to size the default worker pool. One
+# HLS job runs three x264 encoders off a single decode.
+CORES_PER_JOB = 4
+MEMORY_PER_JOB_MB = 1536
+
+JOURNAL_NAME = ".transcode-journal.json"
+
+# Chunked mode. Chunk audio is sliced from one AAC encode of the whole film,
+# at a fixed rate so frame boundaries are known without probing. ffmpeg's
+# aac encoder emits one frame of priming before the first real sample.
+CHUNKS_DIR = ".chunks"
+CHUNK_AUDIO_RATE = 48000
+AAC_FRAME_SAMPLES = 1024
+AAC_PRIMING_FRAMES = 1
+# Added to every chunk's timestamps. Keeps chunk 0's first B-frame DTS from
+# going negative, which would make ffmpeg shift that chunk alone. Outputs
+# of a film with a shared audio rendition get it too: ffmpeg shifts each
+# output by its own most negative DTS (B-frame delay for video, AAC
+# priming for audio), which would put the rendition 40 ms ahead of the
+# pictures.
+CHUNK_TS_OFFSET = 1.0
+
+# One chunk of a chunked film: `frames` video frames starting at the
+# segment boundary at `start` seconds (input seek to `seek`, half a frame
+# earlier so rounding never drops the first frame), plus AAC frames
+# [audio_frame, audio_frame + audio_frames) of the film's audio track
+# (audio_frames is None for the last chunk), which begin audio_offset
+# seconds after `start`.
+Chunk = collections.namedtuple(
+    "Chunk", ["index", "count", "start", "seek", "frames", "audio_frame", "audio_frames", "audio_offset"])
+
+# Job = one ffmpeg invocation. kind is "hls", "thumb" (the film's
+# derivative pass), or for chunked films "audio" (the film's audio track)
+# and "chunk"; key identifies the source
+# content + profile in the journal, outputs are the files it writes
+# (relative to the output directory). chunk is the Chunk a "chunk" job
+# encodes, or the film's list of Chunks for its "audio" job (None when
+# that job writes the shared audio rendition instead of chunk slices) and
+# for the film's "hls" job, which runs no ffmpeg itself and is finished by
+# stitching the chunks once they are all done. ladder is the film's
+# per-title ladder for its "hls" and "chunk" jobs (None: LADDER).
+Job = collections.namedtuple(
+    "Job", ["video_id", "kind", "argv", "log_path", "duration", "key", "outputs", "chunk", "ladder"],
+    defaults=(None, None))
+
+
+class TranscodeError(Exception):
+    """Raised when probing or transcoding a source fails."""
+
+
+def check_tools():
+    """Exit with an error if ffmpeg or ffprobe is missing from PATH."""
+    for tool in ("ffmpeg", "ffprobe"):
+        if not shutil.which(tool):
+            print(f"Error: {tool} not found in PATH. Install FFmpeg and ensure it is on your PATH.",
+                  file=sys.stderr)
+            sys.exit(1)
+
+
+_card_formats = None
+
+
+def card_formats():
+    """Return the card formats (CARD_FORMATS keys) this machine's ffmpeg can encode; JPEG always."""
+    global _card_formats
+    if _card_formats is None:
+        try:
+            encoders = subprocess.run(["ffmpeg", "-hide_banner", "-encoders"],
+                                      capture_output=True, text=True, check=True).stdout
+        except (OSError, subprocess.CalledProcessError):
+            encoders = ""
+        available = {line.split()[1] for line in encoders.splitlines() if len(line.split()) > 1}
+        _card_formats = tuple(ext for ext in CARD_FORMATS
+                              if ext not in CARD_ENCODERS or CARD_ENCODERS[ext] in available)
+    return _card_formats
+
+
+def warn_card_formats(formats):
+    """Warn about the card formats left out for want of an ffmpeg encoder."""
+    missing = [ext for ext in CARD_FORMATS if ext not in formats]
+    if missing:
+        print(f"Warning: ffmpeg lacks the {', '.join(CARD_ENCODERS[ext] for ext in missing)} encoder(s); "
+              f"the card thumbnails are written without {'/'.join(ext.upper() for ext in missing)}. "
+              "Install a full FFmpeg build (e.g. ffmpeg.org's static builds) for them.", file=sys.stderr)
+
+
+def probe_duration(path):
+    """Return the duration of a media file in seconds."""
+    try:
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration",
+             "-of", "csv=p=0", path],
+            capture_output=True, text=True, check=True,
+        )
+        return float(result.stdout.strip())
+    except (OSError, subprocess.CalledProcessError, ValueError) as e:
+        raise TranscodeError(f"could not probe duration: {e}") from e
+
+
+def probe_frames(path):
+    """Return the frame times of the first video stream, in presentation order.
+
+    Times are in seconds from the start of the file, the reference ffmpeg's
+    -ss uses. Reads packet headers only; nothing is decoded.
+    """
+    try:
+        start = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=start_time", "-of", "csv=p=0", path],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+        packets = subprocess.run(
+            ["ffprobe", "-v", "error", "-select_streams", "v:0",
+             "-show_entries", "packet=pts_time", "-of", "csv=p=0", path],
+            capture_output=True, text=True, check=True,
+        ).stdout
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise TranscodeError(f"could not probe frames: {e}") from e
+    offset = float(start) if start not in ("", "N/A") else 0.0
+    frames = []
+    for line in packets.splitlines():
+        try:
+            frames.append(float(line.strip().rstrip(",")) - offset)
+        except ValueError:
+            continue  # packets without a timestamp
+    if not frames:
+        raise TranscodeError("could not probe frames: no video frames found")
+    return sorted(frames)
+
+
+def probe_frame_rate(path):
+    """Return the first video stream's frame rate as a Fraction.
+
+    Uses r_frame_rate, the rate ffmpeg encodes a constant-frame-rate output
+    at, falling back to the average rate when that is missing or bogus.
+    """
+    try:
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-select_streams", "v:0",
+             "-show_entries", "stream=r_frame_rate,avg_frame_rate", "-of", "json", path],
+            capture_output=True, text=True, check=True,
+        )
+        stream = json.loads(result.stdout)["streams"][0]
+    except (OSError, subprocess.CalledProcessError, ValueError, KeyError, IndexError) as e:
+        raise TranscodeError(f"could not probe frame rate: {e}") from e
+    for key in ("r_frame_rate", "avg_frame_rate"):
+        try:
+            rate = fractions.Fraction(stream.get(key, ""))
+        except (ValueError, ZeroDivisionError):
+            continue
+        if 0 < rate <= MAX_FRAME_RATE:
+            return rate
+    raise TranscodeError(f"could not probe frame rate: no usable rate in {stream}")
+
+
+def plan_encoding(frame_rate, profile=DEFAULT_PROFILE):
+    """Return the Encoding of a profile at a film's frame rate.
+
+    The GOP is gop_seconds rounded to whole frames and a segment is the
+    nearest whole number of GOPs to segment_seconds, so keyframes and
+    segment boundaries fall on the same frames in every rung.
+    """
+    frame_rate = fractions.Fraction(frame_rate)
+    gop_frames = max(1, round(frame_rate * fractions.Fraction(profile.gop_seconds)))
+    segment_frames = gop_frames * max(1, round(fractions.Fraction(profile.segment_seconds)
+                                               / fractions.Fraction(profile.gop_seconds)))
+    return Encoding(profile, frame_rate, gop_frames, segment_frames, segment_frames / frame_rate)
+
+
+def probe_audio_start(path):
+    """Return the first audio stream's start in seconds from the file start, or None if it has none."""
+    try:
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "stream=codec_type,start_time:format=start_time",
+             "-of", "json", path],
+            capture_output=True, text=True, check=True,
+        )
+        info = json.loads(result.stdout)
+    except (OSError, subprocess.CalledProcessError, ValueError) as e:
+        raise TranscodeError(f"could not probe streams: {e}") from e
+    audio = [stream for stream in info.get("streams", []) if stream.get("codec_type") == "audio"]
+    if not audio:
+        return None
+
+    def seconds(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return 0.0
+    return max(0.0, seconds(audio[0].get("start_time")) - seconds(info.get("format", {}).get("start_time")))
+
+
+def plan_chunks(frames, encoding, chunk_seconds, audio_start=None):
+    """Split a film into chunks of at least chunk_seconds at segment boundaries.
+
+    Every chunk is a whole number of the encoding's segments long (the
+    last one excepted), so the stitched playlists have the same segments
+    as an unchunked encode and no short ones at the joins; chunks need not
+    start at source keyframes, as the input seek decodes up to the first
+    frame. A split that would leave less than half a chunk at the end is
+    dropped. Audio is assigned by whole AAC frames: every frame belongs to
+    the chunk its first sample falls in. Returns a list of Chunk (a single
+    chunk if the film is too short to split).
+    """
+    step = encoding.segment_frames * max(1, math.ceil(
+        chunk_seconds * encoding.frame_rate / encoding.segment_frames))
+    starts = [0.0] + [frames[first] for first in range(step, len(frames), step)
+                      if len(frames) - first >= step / 2]
+
+    frame_seconds = AAC_FRAME_SAMPLES / CHUNK_AUDIO_RATE
+
+    def first_audio_frame(t):
+        # AAC frame i (after the priming frames) starts at audio_start + (i - priming) * frame_seconds
+        if t <= 0 or audio_start is None:
+            return 0
+        return max(0, math.ceil((t - audio_start) / frame_seconds - 1e-6)) + AAC_PRIMING_FRAMES
+
+    chunks = []
+    for index, start in enumerate(starts):
+        end = starts[index + 1] if index + 1 < len(starts) else None
+        first = bisect.bisect_left(frames, start - 1e-6)
+        last = bisect.bisect_left(frames, end - 1e-6) if end is not None else len(frames)
+        half_frame = (frames[first] - frames[first - 1]) / 2 if first else 0.0
+        audio_frame = first_audio_frame(start)
+        audio_frames = first_audio_frame(end) - audio_frame if end is not None else None
+        audio_offset = ((audio_start or 0.0) + (audio_frame - AAC_PRIMING_FRAMES) * frame_seconds - start
+                        if audio_start is not None else 0.0)
+        chunks.append(Chunk(index, len(starts), start, max(0.0, start - half_frame), last - first,
+                            audio_frame, audio_frames, audio_offset))
+    return chunks
+
+
+def probe_video_size(path):
+    """Return the (width, height) of the first video stream."""
+    try:
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-select_streams", "v:0",
+             "-show_entries", "stream=width,height", "-of", "json", path],
+            capture_output=True, text=True, check=True,
+        )
+        stream = json.loads(result.stdout)["streams"][0]
+        return int(stream["width"]), int(stream["height"])
+    except (OSError, subprocess.CalledProcessError, ValueError, KeyError, IndexError, TypeError) as e:
+        raise TranscodeError(f"could not probe video size: {e}") from e
+
+
+def fit_scale(width, height, box_width, box_height):
+    """Return the factor that fits a width x height picture inside a box."""
+    return min(box_width / width, box_height / height)
+
+
+def probe_windows(duration):
+    """Return the (start, seconds) sample windows the complexity probe encodes."""
+    if duration <= PROBE_WINDOWS * PROBE_WINDOW_SECONDS:
+        return [(0.0, duration)]
+    step = duration / PROBE_WINDOWS
+    return [(step * (i + 0.5) - PROBE_WINDOW_SECONDS / 2, PROBE_WINDOW_SECONDS) for i in range(PROBE_WINDOWS)]
+
+
+def probe_settings():
+    """Identify the complexity probe's settings (for caching its results)."""
+    settings = [PROBE_SIZE, PROBE_CRF, PROBE_PRESET, PROBE_WINDOWS, PROBE_WINDOW_SECONDS]
+    return "complexity:" + hashlib.sha256(json.dumps(settings).encode("utf-8")).hexdigest()[:16]
+
+
+def probe_complexity(src, duration, width, height):
+    """Measure how hard a film is to compress.
+
+    Encodes the sample windows at PROBE_CRF, scaled to fit PROBE_SIZE (never
+    up), and returns the average rate in kbps, normalized to a full
+    PROBE_SIZE picture.
+    """
+    scale = min(1.0, fit_scale(width, height, *PROBE_SIZE))
+    picture = max(2, round(width * scale / 2) * 2) * max(2, round(height * scale / 2) * 2)
+    total_bytes = 0
+    total_seconds = 0.0
+    for start, seconds in probe_windows(duration):
+        argv = ["ffmpeg", "-nostdin", "-v", "error", "-ss", f"{start:.3f}", "-t", f"{seconds:.3f}",
+                "-i", src, "-an", "-vf",
+                f"scale={PROBE_SIZE[0]}:{PROBE_SIZE[1]}:force_original_aspect_ratio=decrease:force_divisible_by=2"
+                if scale < 1.0 else "scale=trunc(iw/2)*2:trunc(ih/2)*2",
+                "-c:v", "libx264", "-preset", PROBE_PRESET, "-crf", str(PROBE_CRF), "-f", "h264", "pipe:1"]
+        try:
+            proc = subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            size = 0
+            for block in iter(lambda: proc.stdout.read(1024 * 1024), b""):
+                size += len(block)
+            stderr = proc.communicate()[1]
+        except OSError as e:
+            raise TranscodeError(f"could not run the complexity probe: {e}") from e
+        if proc.returncode != 0:
+            raise TranscodeError(f"complexity probe failed: {stderr.decode('utf-8', 'replace').strip()}")
+        total_bytes += size
+        total_seconds += seconds
+    kbps = total_bytes * 8 / 1000 / max(total_seconds, 0.001)
+    return kbps * ((PROBE_SIZE[0] * PROBE_SIZE[1]) / picture) ** LADDER_EXPONENT
+
+
+def fit_ladder(width, height, ladder):
+    """Return the rungs of a ladder that do not upscale a width x height source.
+
+    The smallest rung is always kept, so sources below 480p still get one.
+    """
+    smallest = ladder[-1]
+    return tuple(rung for rung in ladder
+                 if rung is smallest or fit_scale(width, height, rung.width, rung.height) <= UPSCALE_TOLERANCE)
+
+
+def plan_ladder(width, height, complexity, profile=DEFAULT_PROFILE):
+    """Pick a film's rungs and bitrates from its size and probed complexity.
+
+    Rungs that would upscale the source are left out (fit_ladder), and so
+    are middle rungs needing more than 1/RUNG_STEP of the rate of the rung
+    above. The smallest rung is always kept, for slow connections. Each
+    rung's rate is the probe rate scaled to the rung's picture size and
+    clamped to the profile's range for it.
+    """
+    audio_kbps = int(profile.audio_bitrate.rstrip("k"))
+    smallest = profile.ladder[-1]
+    ladder = []
+    for rung in fit_ladder(width, height, profile.ladder):
+        scale = fit_scale(width, height, rung.width, rung.height)
+        picture = width * min(scale, 1.0) * height * min(scale, 1.0)
+        low, high = profile.rung_limits_kbps[rung.name]
+        kbps = complexity * (picture / (PROBE_SIZE[0] * PROBE_SIZE[1])) ** LADDER_EXPONENT
+        kbps = int(round(min(high, max(low, kbps)) / 50) * 50)
+        if (ladder and rung is not smallest
+                and kbps * RUNG_STEP > int(ladder[-1].video_bitrate.rstrip("k"))):
+            continue
+        ladder.append(rung._replace(video_bitrate=f"{kbps}k", bandwidth=(kbps + audio_kbps) * 1000))
+    return tuple(ladder)
+
+
+def format_ladder(ladder):
+    """One-line summary of a ladder's rungs and video rates, e.g. "1080p 4.2M / 720p 2.3M"."""
+    return " / ".join(f"{rung.name} {int(rung.video_bitrate.rstrip('k')) / 1000:.1f}M" for rung in ladder)
+
+
+def ladder_rate(ladder):
+    """Total video + audio kbps of a ladder."""
+    return sum(rung.bandwidth for rung in ladder) / 1000
+
+
+def profile_digest(kind, ladder=LADDER, packaging=DEFAULT_PACKAGING, encoding=None, formats=CARD_FORMATS):
+    """Hash the encoding settings a job kind uses, independent of paths.
+
+    Any change to the ladder, codec flags or derivative settings changes the
+    digest, which invalidates journal entries made with the old profile.
+    HLS and chunk jobs need the film's Encoding: the same profile at a
+    different frame rate is a different set of flags. Thumbnail jobs
+    depend on the card formats they write.
+    """
+    if kind == "hls":
+        argv = build_hls_command("<src>", "<out>", encoding, ladder=ladder, packaging=packaging)
+    elif kind == "chunk":
+        chunk = Chunk(0, 1, 0.0, 0.0, 0, 0, None, 0.0)
+        if packaging.shared_audio:
+            audio_argv = build_audio_rendition_command("<src>", "<audio>", encoding, packaging)
+        else:
+            audio_argv = build_audio_command("<src>", "<audio>", encoding.profile)
+        argv = (build_chunk_command("<src>", "<out>", chunk, encoding,
+                                    None if packaging.shared_audio else "<audio>",
+                                    ladder=ladder, packaging=packaging)
+                + audio_argv
+                + [CHUNK_TS_OFFSET, AAC_PRIMING_FRAMES])
+    else:
+        argv = build_derivatives_command("<src>", "<out>", "<id>", plan_derivatives(600), formats) + [
+            THUMB_POSITION, SPRITE_INTERVAL, SPRITE_MAX_TILES, PREVIEW_FRAMES]
+    return hashlib.sha256(json.dumps(argv).encode("utf-8")).hexdigest()[:16]
+
+
+def format_duration(seconds):
+    """Format seconds as M:SS, the way the couple config stores durations."""
+    total = int(seconds)
+    return f"{total // 60}:{total % 60:02d}"
+
+
+def scale_pad(width, height):
+    """Return the letterboxing scale+pad filter used for every rung."""
+    return (f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+            f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2")
+
+
+def offset_output_args(offset, packaging=DEFAULT_PACKAGING):
+    """Return the options that shift one output's timestamps by offset seconds."""
+    args = ["-output_ts_offset", f"{offset:.6f}"]
+    if packaging.segment_format == "fmp4":
+        # Keep the shifted timestamps in each fragment's tfdt; by default
+        # the MP4 muxer rebases the first fragment to zero.
+        args += ["-hls_segment_options", "movflags=+frag_discont"]
+    return args
+
+
+def hls_time(encoding):
+    """Return the -hls_time value for an encoding: its segment length, a hair short (SPLIT_MARGIN_US)."""
+    micros = math.floor(encoding.segment_seconds * 1000000) - SPLIT_MARGIN_US
+    return f"{micros // 1000000}.{micros % 1000000:06d}"
+
+
+def video_encoder_args(rung, encoding):
+    """Return one rung's video encoder options: codec, rate, preset and the keyframe policy.
+
+    Keyframes come every gop_frames frames. Without scene_cut, x264's
+    scene-cut detection (which would pick different frames in different
+    rungs) is off; with it, segment boundaries are forced keyframes.
+    """
+    profile = encoding.profile
+    args = ["-c:v", profile.video_codec, "-b:v", rung.video_bitrate, "-preset", profile.preset,
+            "-g", str(encoding.gop_frames), "-keyint_min", str(encoding.gop_frames)]
+    if profile.scene_cut:
+        return args + ["-force_key_frames", f"expr:eq(mod(n,{encoding.segment_frames}),0)"]
+    return args + ["-sc_threshold", "0"]
+
+
+def hls_output_args(rung_dir, encoding, packaging=DEFAULT_PACKAGING):
+    """Return the HLS muxer options and playlist path for one rung's (or the audio rendition's) output."""
+    segment_type, extension = SEGMENT_FORMATS[packaging.segment_format]
+    args = ["-hls_time", hls_time(encoding), "-hls_segment_type", segment_type]
+    if packaging.single_file:
+        args += ["-hls_flags", "single_file"]
+        segment_name = SINGLE_FILE_STEM + extension
+    else:
+        if packaging.segment_format == "fmp4":
+            args += ["-hls_fmp4_init_filename", INIT_SEGMENT]
+        segment_name = f"segment%03d{extension}"
+    return args + [
+        "-hls_segment_filename", os.path.join(rung_dir, segment_name),
+        "-hls_playlist_type", "vod",
+        os.path.join(rung_dir, "playlist.m3u8"),
+    ]
+
+
+def build_hls_command(src, video_out_dir, encoding, threads=0, ladder=LADDER,
+                      packaging=DEFAULT_PACKAGING, has_audio=True):
+    """Build the single-decode, multi-rung HLS ffmpeg argv for one source.
+
+    Every rung gets the film's Encoding (see plan_encoding). With shared
+    audio the rungs are video-only and the source's audio (if has_audio)
+    goes to one extra audio-only output; otherwise every rung carries its
+    own AAC encode of it.
+    """
+    profile = encoding.profile
+    labels = [f"v{i + 1}" for i in range(len(ladder))]
+    graph = f"[0:v]split={len(ladder)}" + "".join(f"[{label}]" for label in labels)
+    for label, rung in zip(labels, ladder):
+        graph += f";[{label}]{scale_pad(rung.width, rung.height)}[{label}out]"
+
+    argv = ["ffmpeg", "-nostdin", "-hide_banner", "-nostats", "-progress", "pipe:1",
+            "-i", src, "-filter_complex", graph]
+    if threads:
+        argv += ["-threads", str(threads)]
+    for label, rung in zip(labels, ladder):
+        rung_dir = os.path.join(video_out_dir, rung.name)
+        argv += ["-map", f"[{label}out]"] + video_encoder_args(rung, encoding)
+        if packaging.shared_audio:
+            argv += offset_output_args(CHUNK_TS_OFFSET, packaging)
+        else:
+            argv += ["-map", "0:a?", "-c:a", profile.audio_codec, "-b:a", profile.audio_bitrate]
+        argv += hls_output_args(rung_dir, encoding, packaging)
+    if packaging.shared_audio and has_audio:
+        argv += ["-map", "0:a:0", "-c:a", profile.audio_codec, "-b:a", profile.audio_bitrate]
+        argv += offset_output_args(CHUNK_TS_OFFSET, packaging)
+        argv += hls_output_args(os.path.join(video_out_dir, AUDIO_DIR), encoding, packaging)
+    return argv + ["-y"]
+
+
+def build_audio_command(src, audio_path, profile=DEFAULT_PROFILE):
+    """Build the argv that encodes a chunked film's whole audio track once."""
+    return ["ffmpeg", "-nostdin", "-hide_banner", "-nostats", "-progress", "pipe:1",
+            "-i", src, "-vn", "-c:a", profile.audio_codec, "-b:a", profile.audio_bitrate,
+            "-ar", str(CHUNK_AUDIO_RATE),
+            "-f", "adts", audio_path, "-y"]
+
+
+def build_audio_rendition_command(src, audio_dir, encoding, packaging=DEFAULT_PACKAGING):
+    """Build the argv that encodes a chunked film's shared audio rendition.
+
+    Offset like the chunks (CHUNK_TS_OFFSET), so it lines up with the
+    stitched video exactly as the audio of an unchunked encode would.
+    """
+    argv = ["ffmpeg", "-nostdin", "-hide_banner", "-nostats", "-progress", "pipe:1",
+            "-i", src, "-map", "0:a:0", "-c:a", encoding.profile.audio_codec,
+            "-b:a", encoding.profile.audio_bitrate]
+    return (argv + offset_output_args(CHUNK_TS_OFFSET, packaging)
+            + hls_output_args(audio_dir, encoding, packaging) + ["-y"])
+
+
+def build_chunk_command(src, chunk_dir, chunk, encoding, audio_path=None, threads=0, ladder=LADDER,
+                        packaging=DEFAULT_PACKAGING):
+    """Build the three-rung HLS argv for one chunk of a chunked film.
+
+    Same ladder and x264 settings as build_hls_command, but it decodes only
+    the chunk's frames, copies the chunk's slice of the film's audio track
+    instead of encoding audio per chunk (separately encoded AAC would click
+    at every join), and shifts all output timestamps to the chunk's place
+    in the film. Without audio_path (shared audio, or a silent film) the
+    chunk is video-only.
+    """
+    labels = [f"v{i + 1}" for i in range(len(ladder))]
+    # setpts: the seek lands half a frame before the chunk's first frame, and
+    # the encoder would round that half frame up to a whole one
+    graph = (f"[0:v]trim=end_frame={chunk.frames},setpts=PTS-STARTPTS,split={len(ladder)}"
+             + "".join(f"[{label}]" for label in labels))
+    for label, rung in zip(labels, ladder):
+        graph += f";[{label}]{scale_pad(rung.width, rung.height)}[{label}out]"
+
+    argv = ["ffmpeg", "-nostdin", "-hide_banner", "-nostats", "-progress", "pipe:1"]
+    if chunk.seek:
+        argv += ["-ss", f"{chunk.seek:.6f}"]
+    argv += ["-i", src]
+    if audio_path:
+        argv += ["-itsoffset", f"{chunk.audio_offset:.6f}", "-i", audio_path]
+    argv += ["-filter_complex", graph]
+    if threads:
+        argv += ["-threads", str(threads)]
+    for label, rung in zip(labels, ladder):
+        rung_dir = os.path.join(chunk_dir, rung.name)
+        argv += ["-map", f"[{label}out]"]
+        if audio_path:
+            argv += ["-map", "1:a", "-c:a", "copy"]
+            if packaging.segment_format == "fmp4":
+                argv += ["-bsf:a", "aac_adtstoasc"]  # MP4 carries raw AAC, not ADTS frames
+        argv += video_encoder_args(rung, encoding) + [
+            # Keep the chunk's frames as they are; in CFR mode (the MP4
+            # muxer's default) ffmpeg would pad or drop to fit its frame rate.
+            "-fps_mode", "passthrough",
+        ] + offset_output_args(chunk.start + CHUNK_TS_OFFSET, packaging)
+        argv += hls_output_args(rung_dir, encoding, packaging)
+    return argv + ["-y"]
+
+
+def slice_chunk_audio(audio_path, chunks_dir, chunks):
+    """Cut the film's audio track into one ADTS file per chunk (stream copy).
+
+    Seeks to half a frame before each chunk's first AAC frame so rounding
+    can never drop or repeat a frame at a join.
+    """
+    frame_seconds = AAC_FRAME_SAMPLES / CHUNK_AUDIO_RATE
+    for chunk in chunks:
+        argv = ["ffmpeg", "-nostdin", "-v", "error", "-i", audio_path]
+        if chunk.audio_frame:
+            argv += ["-ss", f"{(chunk.audio_frame - 0.5) * frame_seconds:.6f}"]
+        if chunk.audio_frames is not None:
+            argv += ["-frames:a", str(chunk.audio_frames)]
+        argv += ["-c", "copy", "-f", "adts", os.path.join(chunks_dir, f"audio{chunk.index:03d}.aac"), "-y"]
+        try:
+            subprocess.run(argv, capture_output=True, text=True, check=True)
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise TranscodeError(f"could not slice chunk audio: {getattr(e, 'stderr', '') or e}") from e
+
+
+def parse_byterange(value, next_offsets, uri):
+    """Parse an HLS "length[@offset]" byte range into (length, offset).
+
+    Without an offset the range starts where the previous range of the
+    same URI ended; next_offsets tracks that per URI.
+    """
+    length, _, offset = value.partition("@")
+    length = int(length)
+    offset = int(offset) if offset else next_offsets.get(uri, 0)
+    next_offsets[uri] = offset + length
+    return length, offset
+
+
+def read_media_playlist(path):
+    """Return ([(duration, uri, byterange)], init) from a finished media playlist.
+
+    byterange is (length, offset) for EXT-X-BYTERANGE (single-file)
+    playlists and None otherwise; init is the fMP4 init segment as
+    (uri, byterange), or None.
+    """
+    entries = []
+    duration = byterange = None
+    init = None
+    next_offsets = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("#EXT-X-MAP:"):
+                uri = line.split('URI="', 1)[1].split('"', 1)[0]
+                init_range = None
+                if 'BYTERANGE="' in line:
+                    init_range = parse_byterange(line.split('BYTERANGE="', 1)[1].split('"', 1)[0],
+                                                 next_offsets, uri)
+                init = (uri, init_range)
+            elif line.startswith("#EXTINF:"):
+                duration = float(line[len("#EXTINF:"):].split(",", 1)[0])
+            elif line.startswith("#EXT-X-BYTERANGE:"):
+                byterange = line[len("#EXT-X-BYTERANGE:"):]
+            elif line and not line.startswith("#"):
+                if byterange is not None:
+                    byterange = parse_byterange(byterange, next_offsets, line)
+                entries.append((duration, line, byterange))
+                byterange = None
+    return entries, init
+
+
+def parse_attributes(text):
+    """Return an HLS attribute list ('NAME=value,NAME="quoted, value"') as a dict, quotes removed."""
+    return {name: value[1:-1] if value.startswith('"') else value
+            for name, value in HLS_ATTRIBUTE.findall(text)}
+
+
+def read_master_playlist(path):
+    """Return ([(attributes, uri)] for each EXT-X-STREAM-INF, [attributes] for each EXT-X-MEDIA)."""
+    variants, media = [], []
+    attributes = None
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("#EXT-X-STREAM-INF:"):
+                attributes = parse_attributes(line[len("#EXT-X-STREAM-INF:"):])
+            elif line.startswith("#EXT-X-MEDIA:"):
+                media.append(parse_attributes(line[len("#EXT-X-MEDIA:"):]))
+            elif line and not line.startswith("#") and attributes is not None:
+                variants.append((attributes, line))
+                attributes = None
+    return variants, media
+
+
+def media_playlist(entries, init=None):
+    """Return a VOD media playlist for [(duration, uri, byterange)], in ffmpeg's layout.
+
+    EXT-X-TARGETDURATION is the longest segment rounded up, as the HLS
+    spec requires. init is the fMP4 init segment as (uri, byterange), if
+    any; byte ranges are (length, offset) or None, as read_media_playlist
+    returns them.
+    """
+    target = math.ceil(max((entry[0] for entry in entries), default=DEFAULT_PROFILE.segment_seconds) - 1e-6)
+    byteranges = any(entry[2] for entry in entries)
+    version = 7 if init else 4 if byteranges else 3
+    lines = ["#EXTM3U", f"#EXT-X-VERSION:{version}", f"#EXT-X-TARGETDURATION:{target}",
+             "#EXT-X-MEDIA-SEQUENCE:0", "#EXT-X-PLAYLIST-TYPE:VOD"]
+    if init:
+        uri, init_range = init
+        if init_range:
+            lines.append(f'#EXT-X-MAP:URI="{uri}",BYTERANGE="{init_range[0]}@{init_range[1]}"')
+        else:
+            lines.append(f'#EXT-X-MAP:URI="{uri}"')
+    for duration, uri, byterange in entries:
+        lines.append(f"#EXTINF:{duration:.6f},")
+        if byterange:
+            lines.append(f"#EXT-X-BYTERANGE:{byterange[0]}@{byterange[1]}")
+        lines.append(uri)
+    return "\n".join(lines + ["#EXT-X-ENDLIST"]) + "\n"
+
+
+def read_byterange(path, byterange=None):
+    """Return a file's bytes, or only the (length, offset) range of them."""
+    with open(path, "rb") as f:
+        if byterange is None:
+            return f.read()
+        length, offset = byterange
+        f.seek(offset)
+        data = f.read(length)
+    if len(data) != length:
+        raise TranscodeError(f"{path} is shorter than its playlist says")
+    return data
+
+
+def mp4_boxes(data, start=0, end=None):
+    """Yield (type, payload start, payload end) for the boxes in data[start:end]."""
+    end = len(data) if end is None else end
+    while start + 8 <= end:
+        size, kind = struct.unpack(">I4s", data[start:start + 8])
+        if size < 8:
+            break
+        yield kind.decode("latin-1"), start + 8, start + size
+        start += size
+
+
+def mp4_box(data, path, start=0, end=None):
+    """Return (payload start, payload end) of the first box at path below data[start:end], or None."""
+    for name in path:
+        for kind, box_start, box_end in mp4_boxes(data, start, end):
+            if kind == name:
+                start, end = box_start, box_end
+                break
+        else:
+            return None
+    return start, end
+
+
+def init_tracks(data):
+    """Yield (track ID, handler type, timescale, stsd payload range) for each trak of an fMP4 init segment."""
+    moov = mp4_box(data, ("moov",))
+    if moov is None:
+        return
+    for kind, trak_start, trak_end in mp4_boxes(data, *moov):
+        if kind != "trak":
+            continue
+        tkhd = mp4_box(data, ("tkhd",), trak_start, trak_end)
+        mdhd = mp4_box(data, ("mdia", "mdhd"), trak_start, trak_end)
+        hdlr = mp4_box(data, ("mdia", "hdlr"), trak_start, trak_end)
+        stsd = mp4_box(data, ("mdia", "minf", "stbl", "stsd"), trak_start, trak_end)
+        if not (tkhd and mdhd and hdlr and stsd):
+            continue
+        # tkhd and mdhd: version/flags, then creation and modification times
+        # (64-bit in version 1) before track_ID / timescale. hdlr:
+        # version/flags (4), pre_defined (4), handler_type (4).
+        id_at = tkhd[0] + (20 if data[tkhd[0]] == 1 else 12)
+        track_id = struct.unpack(">I", data[id_at:id_at + 4])[0]
+        scale_at = mdhd[0] + (20 if data[mdhd[0]] == 1 else 12)
+        timescale = struct.unpack(">I", data[scale_at:scale_at + 4])[0]
+        yield track_id, data[hdlr[0] + 8:hdlr[0] + 12].decode("latin-1"), timescale, stsd
+
+
+def init_video_config(data):
+    """Return the video sample description (stsd) of an fMP4 init segment.
+
+    This holds the codec, resolution and SPS/PPS, which every chunk's
+    init segment must agree on. The rest of the moov legitimately differs
+    per chunk (edit lists carry the chunk's start time, esds carries the
+    measured audio bitrate) and is ignored.
+    """
+    for _, handler, _, stsd in init_tracks(data):
+        if handler == "vide":
+            return data[stsd[0]:stsd[1]]
+    return None
+
+
+def stitch_chunks(video_out_dir, chunks, ladder=LADDER):
+    """Move every chunk's segments into the rung folders and write one playlist per rung.
+
+    Segments are renumbered in film order; their timestamps already run on
+    from chunk to chunk, so no discontinuity tags are needed. ffmpeg leaves
+    the duration of a chunk's last frame out of its last EXTINF, so that
+    segment gets the rest of the chunk's span instead. Single-file
+    chunks are instead appended, range by range, to one stream file per
+    rung with the byte ranges rebased. For fMP4 the first chunk's init
+    segment becomes the rung's; every other chunk must have the same video
+    configuration (see init_video_config), which is checked rather than
+    assumed.
+    """
+    chunks_dir = os.path.join(video_out_dir, CHUNKS_DIR)
+    for rung in ladder:
+        rung_dir = os.path.join(video_out_dir, rung.name)
+        os.makedirs(rung_dir, exist_ok=True)
+        entries = []
+        init = init_data = None
+        stream = None  # open stream file while stitching single-file chunks
+        try:
+            for chunk in chunks:
+                index = chunk.index
+                chunk_rung_dir = os.path.join(chunks_dir, f"{index:03d}", rung.name)
+                chunk_entries, chunk_init = read_media_playlist(os.path.join(chunk_rung_dir, "playlist.m3u8"))
+                if chunk_init:
+                    data = read_byterange(os.path.join(chunk_rung_dir, chunk_init[0]), chunk_init[1])
+                    if init_data is None:
+                        init_data = data
+                    elif init_video_config(data) != init_video_config(init_data):
+                        raise TranscodeError(f"chunk {index + 1} of {rung.name} has a different init segment")
+                if index + 1 < len(chunks) and chunk_entries:
+                    rest = chunks[index + 1].start - chunk.start - sum(entry[0] for entry in chunk_entries[:-1])
+                    chunk_entries[-1] = (max(rest, chunk_entries[-1][0]),) + chunk_entries[-1][1:]
+                for duration, uri, byterange in chunk_entries:
+                    extension = os.path.splitext(uri)[1]
+                    if byterange is None:
+                        name = f"segment{len(entries):03d}{extension}"
+                        os.replace(os.path.join(chunk_rung_dir, uri), os.path.join(rung_dir, name))
+                        entries.append((duration, name, None))
+                        continue
+                    name = SINGLE_FILE_STEM + extension
+                    if stream is None:
+                        stream = open(os.path.join(rung_dir, name), "wb")
+                        if init_data is not None:
+                            init = (name, (len(init_data), 0))
+                            stream.write(init_data)
+                    data = read_byterange(os.path.join(chunk_rung_dir, uri), byterange)
+                    entries.append((duration, name, (len(data), stream.tell())))
+                    stream.write(data)
+        finally:
+            if stream is not None:
+                stream.close()
+        if init_data is not None and init is None:
+            with open(os.path.join(rung_dir, INIT_SEGMENT), "wb") as f:
+                f.write(init_data)
+            init = (INIT_SEGMENT, None)
+        with open(os.path.join(rung_dir, "playlist.m3u8"), "w", encoding="utf-8", newline="\n") as f:
+            f.write(media_playlist(entries, init))
+
+
+def plan_derivatives(duration):
+    """Return the Derivatives plan for a film of duration seconds."""
+    tiles = max(1, min(SPRITE_MAX_TILES, round(duration / SPRITE_INTERVAL)))
+    columns, rows = SPRITE_GRID
+    rows = min(rows, -(-tiles // columns))
+    return Derivatives(duration * THUMB_POSITION, duration / tiles, tiles, (columns, rows),
+                       -(-tiles // (columns * rows)), duration / PREVIEW_FRAMES)
+
+
+def derivative_outputs(video_id, plan, formats=CARD_FORMATS):
+    """Return the files a film's derivative job writes, relative to the output directory."""
+    folder = f"{THUMBS_DIR}/{video_id}"
+    return ([f"{THUMBS_DIR}/{video_id}.jpg"]
+            + [f"{folder}/card-{width}.{ext}" for width in CARD_WIDTHS for ext in formats]
+            + [f"{folder}/sprite-{sheet:03d}.jpg" for sheet in range(plan.sprite_sheets)]
+            + [f"{folder}/{THUMBNAILS_VTT}"]
+            + [f"{folder}/preview-{frame:02d}.jpg" for frame in range(PREVIEW_FRAMES)])
+
+
+def vtt_timestamp(seconds):
+    """Format seconds as a WebVTT timestamp (HH:MM:SS.mmm)."""
+    millis = round(seconds * 1000)
+    return f"{millis // 3600000:02d}:{millis // 60000 % 60:02d}:{millis // 1000 % 60:02d}.{millis % 1000:03d}"
+
+
+def thumbnails_vtt(plan):
+    """Return the WebVTT thumbnail track for a film's sprite sheets.
+
+    One cue per tile, covering the slice of the film the tile was taken
+    from; its text is the sheet (relative to the track) with the tile's
+    rectangle as a #xywh media fragment, the form Vidstack, Video.js and
+    JW Player read.
+    """
+    columns, rows = plan.sprite_grid
+    width, height = SPRITE_TILE
+    lines = ["WEBVTT", ""]
+    for tile in range(plan.sprite_tiles):
+        sheet, cell = divmod(tile, columns * rows)
+        row, column = divmod(cell, columns)
+        lines += [f"{vtt_timestamp(tile * plan.sprite_step)} --> {vtt_timestamp((tile + 1) * plan.sprite_step)}",
+                  f"sprite-{sheet:03d}.jpg#xywh={column * width},{row * height},{width},{height}", ""]
+    return "\n".join(lines)
+
+
+def write_thumbnails_vtt(output_dir, video_id, plan):
+    """Write a film's thumbnails.vtt next to its sprite sheets."""
+    path = os.path.join(output_dir, THUMBS_DIR, video_id, THUMBNAILS_VTT)
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        f.write(thumbnails_vtt(plan))
+
+
+def select_frames(count, step, first=None):
+    """Return a select filter passing count frames, one per step seconds from first (default: step / 2)."""
+    first = step / 2 if first is None else first
+    return f"select='lt(selected_n,{count})*gte(t,{first:.6f}+selected_n*{step:.6f})'"
+
+
+def build_derivatives_command(src, output_dir, video_id, plan, formats=CARD_FORMATS):
+    """Build the ffmpeg argv that cuts every derivative of a film from one decode.
+
+    The decoded frames are split into three branches that each keep only
+    the frames they need before scaling: the poster frame (also scaled to
+    each card width, in each of the card formats), the sprite tiles (tiled
+    into sheets) and the preview frames. Image outputs are written frame
+    by frame (no duplication to a constant rate).
+    """
+    folder = os.path.join(output_dir, THUMBS_DIR, video_id)
+    cards = len(CARD_WIDTHS)
+    graph = [
+        "[0:v:0]setpts=PTS-STARTPTS,split=3[poster][sprite][preview]",
+        f"[poster]{select_frames(1, 0, plan.poster_at)},{scale_pad(*THUMB_SIZE)},"
+        f"split={cards + 1}[poster_out]" + "".join(f"[card{i}]" for i in range(cards)),
+        f"[sprite]{select_frames(plan.sprite_tiles, plan.sprite_step)},{scale_pad(*SPRITE_TILE)},"
+        f"tile={plan.sprite_grid[0]}x{plan.sprite_grid[1]}[sprite_out]",
+        f"[preview]{select_frames(PREVIEW_FRAMES, plan.preview_step)},{scale_pad(*PREVIEW_SIZE)}[preview_out]",
+    ]
+    graph += [f"[card{i}]scale={width}:-2,split={len(formats)}"
+              + "".join(f"[card{i}_{ext}]" for ext in formats)
+              for i, width in enumerate(CARD_WIDTHS)]
+    argv = ["ffmpeg", "-nostdin", "-hide_banner", "-nostats", "-progress", "pipe:1",
+            "-i", src, "-filter_complex", ";".join(graph),
+            "-map", "[poster_out]", "-frames:v", "1", "-q:v", "2",
+            os.path.join(output_dir, THUMBS_DIR, f"{video_id}.jpg")]
+    for i, width in enumerate(CARD_WIDTHS):
+        for ext in formats:
+            argv += ["-map", f"[card{i}_{ext}]", "-frames:v", "1", *CARD_FORMATS[ext],
+                     os.path.join(folder, f"card-{width}.{ext}")]
+    argv += ["-map", "[sprite_out]", "-fps_mode", "passthrough", "-q:v", "5", "-start_number", "0",
+             os.path.join(folder, "sprite-%03d.jpg"),
+             "-map", "[preview_out]", "-fps_mode", "passthrough", "-q:v", "4", "-start_number", "0",
+             os.path.join(folder, "preview-%02d.jpg"), "-y"]
+    return argv
+
+
+def ts_streams(data):
+    """Return {PID: (stream type, [(PTS, PES payload)])} for the H.264/AAC streams in MPEG-TS data.
+
+    The PAT and PMT are read from the data itself (ffmpeg repeats them at
+    the start of every segment); PES headers are stripped, so a payload
+    is one access unit's elementary stream bytes. PTS is in 90 kHz ticks,
+    or None if the PES header has none. A PES packet cut off by the end
+    of data keeps what it has.
+    """
+    pmt_pids = set()
+    streams = {}
+    for pos in range(0, len(data) - TS_PACKET_SIZE + 1, TS_PACKET_SIZE):
+        packet = data[pos:pos + TS_PACKET_SIZE]
+        if packet[0] != 0x47:
+            continue
+        pid = ((packet[1] & 0x1f) << 8) | packet[2]
+        unit_start = packet[1] & 0x40
+        adaptation = (packet[3] >> 4) & 3
+        offset = 4 + (1 + packet[4] if adaptation & 2 else 0)
+        if not adaptation & 1 or offset >= TS_PACKET_SIZE:
+            continue
+        payload = packet[offset:]
+        if pid == 0 or pid in pmt_pids:
+            if not unit_start:
+                continue
+            section = payload[1 + payload[0]:]
+            end = 3 + (((section[1] & 0x0f) << 8) | section[2]) - 4  # before the CRC
+            if pid == 0:
+                for at in range(8, end, 4):
+                    if section[at:at + 2] != b"\x00\x00":  # program 0 is the network PID
+                        pmt_pids.add(((section[at + 2] & 0x1f) << 8) | section[at + 3])
+            else:
+                at = 12 + (((section[10] & 0x0f) << 8) | section[11])
+                while at + 5 <= end:
+                    es_pid = ((section[at + 1] & 0x1f) << 8) | section[at + 2]
+                    if section[at] in TS_STREAM_TYPES:
+                        streams.setdefault(es_pid, (section[at], []))
+                    at += 5 + (((section[at + 3] & 0x0f) << 8) | section[at + 4])
+        elif pid in streams:
+            units = streams[pid][1]
+            if unit_start:
+                units.append(bytearray(payload))
+            elif units:
+                units[-1] += payload
+    for _, units in streams.values():
+        units[:] = [(pes_pts(unit), bytes(unit[9 + unit[8]:])) for unit in units if len(unit) > 9]
+    return streams
+
+
+def pes_pts(header):
+    """Return the PTS of a PES packet header in 90 kHz ticks, or None."""
+    if not header[7] & 0x80 or len(header) < 14:
+        return None
+    return (((header[9] >> 1) & 7) << 30 | header[10] << 22 | (header[11] >> 1) << 15
+            | header[12] << 7 | header[13] >> 1)
+
+
+def avc_codec(data):
+    """Return the avc1 codec string from the first SPS in H.264 Annex B data, or None."""
+    at = data.find(b"\x00\x00\x01")
+    while at != -1 and at + 7 <= len(data):
+        if data[at + 3] & 0x1f == 7:
+            # profile_idc, constraint flags, level_idc
+            return "avc1." + data[at + 4:at + 7].hex()
+        at = data.find(b"\x00\x00\x01", at + 3)
+    return None
+
+
+def adts_config(data):
+    """Return (codec string, channels) from the ADTS header at the start of AAC data, or (None, None)."""
+    if len(data) < 4 or data[0] != 0xff or data[1] & 0xf0 != 0xf0:
+        return None, None
+    audio_object_type = (data[2] >> 6) + 1
+    return f"mp4a.40.{audio_object_type}", ((data[2] & 1) << 2) | (data[3] >> 6)
+
+
+def ts_media_info(segment):
+    """Return (codecs, video frames, channels) for one MPEG-TS segment.
+
+    ffmpeg writes one video access unit per PES packet, so the packets
+    count the frames.
+    """
+    codecs, frames, channels = [], None, None
+    for stream_type, units in ts_streams(segment).values():
+        if not units:
+            continue
+        if TS_STREAM_TYPES[stream_type] == "h264":
+            codecs.append(next(filter(None, (avc_codec(data) for _, data in units)), None))
+            frames = len(units)
+        else:
+            codec, channels = adts_config(units[0][1])
+            codecs.append(codec)
+    return codecs, frames, channels
+
+
+def mp4_descriptors(data, start, end):
+    """Yield (tag, payload start, payload end) for the MPEG-4 descriptors in data[start:end]."""
+    while start + 2 <= end:
+        tag, length = data[start], 0
+        start += 1
+        for _ in range(4):
+            byte = data[start]
+            start += 1
+            length = (length << 7) | (byte & 0x7f)
+            if not byte & 0x80:
+                break
+        yield tag, start, start + length
+        start += length
+
+
+def esds_codec(data, start, end):
+    """Return the mp4a codec string from an esds box payload, or None."""
+    for tag, es_start, es_end in mp4_descriptors(data, start + 4, end):  # after version/flags
+        if tag != 0x03:  # ES_Descriptor
+            continue
+        flags = data[es_start + 2]
+        es_start += 3 + (2 if flags & 0x80 else 0) + (2 if flags & 0x20 else 0)
+        if flags & 0x40:
+            es_start += 1 + data[es_start]
+        for tag, config_start, config_end in mp4_descriptors(data, es_start, es_end):
+            if tag != 0x04:  # DecoderConfigDescriptor
+                continue
+            object_type = data[config_start]
+            for tag, info_start, _ in mp4_descriptors(data, config_start + 13, config_end):
+                if tag == 0x05:  # DecoderSpecificInfo: AudioSpecificConfig
+                    audio_object_type = data[info_start] >> 3
+                    if audio_object_type == 31:
+                        audio_object_type = 32 + (((data[info_start] & 7) << 3) | (data[info_start + 1] >> 5))
+                    return f"mp4a.{object_type:02x}.{audio_object_type}"
+            return f"mp4a.{object_type:02x}"
+    return None
+
+
+def fmp4_media_info(init, segment):
+    """Return (codecs, video frames, channels) for one fMP4 media segment and its init segment.
+
+    Codecs and channels come from the init segment's sample entries, the
+    frame count from the video track's trun boxes in the segment.
+    """
+    codecs, frames, channels = [], None, None
+    video_track = None
+    for track_id, handler, _, stsd in init_tracks(init):
+        entry = next(mp4_boxes(init, stsd[0] + 8, stsd[1]), None)  # after version/flags, entry_count
+        if entry is None or handler not in ("vide", "soun"):
+            continue
+        kind, entry_start, entry_end = entry
+        if handler == "vide":
+            video_track = track_id
+            # VisualSampleEntry fields take 78 bytes before the child boxes.
+            avcc = mp4_box(init, ("avcC",), entry_start + 78, entry_end) if kind in ("avc1", "avc3") else None
+            codecs.append(f"{kind}." + init[avcc[0] + 1:avcc[0] + 4].hex() if avcc else None)
+        else:
+            # AudioSampleEntry: channelcount at 16, child boxes after 28 bytes.
+            channels = struct.unpack(">H", init[entry_start + 16:entry_start + 18])[0]
+            esds = mp4_box(init, ("esds",), entry_start + 28, entry_end) if kind == "mp4a" else None
+            codecs.append(esds_codec(init, *esds) if esds else None)
+    if video_track is not None:
+        frames = 0
+        for kind, moof_start, moof_end in mp4_boxes(segment):
+            if kind != "moof":
+                continue
+            for kind, traf_start, traf_end in mp4_boxes(segment, moof_start, moof_end):
+                tfhd = mp4_box(segment, ("tfhd",), traf_start, traf_end) if kind == "traf" else None
+                if not tfhd or struct.unpack(">I", segment[tfhd[0] + 4:tfhd[0] + 8])[0] != video_track:
+                    continue
+                for kind, trun_start, _ in mp4_boxes(segment, traf_start, traf_end):
+                    if kind == "trun":
+                        frames += struct.unpack(">I", segment[trun_start + 4:trun_start + 8])[0]
+    return codecs, frames, channels
+
+
+def measure_media_playlist(path):
+    """Return the RenditionStats of a finished media playlist.
+
+    BANDWIDTH is the peak segment bitrate (segment size over its EXTINF
+    duration) and AVERAGE-BANDWIDTH the total size over the total
+    duration, as the HLS spec defines them (see segment_bitrates); fMP4
+    init segments are not counted. The frame rate is the first segment's frame count over its
+    duration.
+    """
+    entries, init = read_media_playlist(path)
+    if not entries:
+        raise TranscodeError(f"{path} lists no segments")
+    base = os.path.dirname(path)
+    sizes = [byterange[0] if byterange else os.path.getsize(os.path.join(base, uri))
+             for _, uri, byterange in entries]
+    peak, average = segment_bitrates(sizes, [entry[0] for entry in entries])
+    first_duration, first_uri, first_range = entries[0]
+    segment = read_byterange(os.path.join(base, first_uri), first_range)
+    if init:
+        codecs, frames, channels = fmp4_media_info(read_byterange(os.path.join(base, init[0]), init[1]), segment)
+    else:
+        codecs, frames, channels = ts_media_info(segment)
+    frame_rate = round(frames / first_duration, 3) if frames and first_duration > 0 else None
+    return RenditionStats(math.ceil(peak), math.ceil(average),
+                          tuple(codecs) if codecs and None not in codecs else None, frame_rate, channels)
+
+
+def segment_bitrates(sizes, durations):
+    """Return (peak, average) bits per second of a rendition's segments.
+
+    A segment under PEAK_MIN_SECONDS (in practice a film's last, a few
+    frames long) counts towards the peak together with the one before
+    it, as its container overhead alone would otherwise set the peak.
+    """
+    windows = []  # (bytes, seconds) per segment, short tails merged
+    for size, duration in zip(sizes, durations):
+        if windows and duration < PEAK_MIN_SECONDS:
+            windows[-1] = (windows[-1][0] + size, windows[-1][1] + duration)
+        else:
+            windows.append((size, duration))
+    peak = max((size * 8 / max(duration, 1e-3) for size, duration in windows), default=0)
+    return peak, sum(sizes) * 8 / max(sum(durations), 1e-3)
+
+
+def master_playlist(ladder=LADDER, shared_audio=False, stats=None):
+    """Return the master.m3u8 content pointing at each rung's playlist.
+
+    With shared_audio the rungs reference the audio rendition in AUDIO_DIR
+    as their EXT-X-MEDIA audio group. stats maps rung names (and AUDIO_DIR)
+    to their measured RenditionStats; measured rungs get BANDWIDTH,
+    AVERAGE-BANDWIDTH, CODECS and FRAME-RATE from them, the others the
+    ladder's nominal bandwidth. Either way BANDWIDTH includes the audio.
+    """
+    stats = stats or {}
+    audio = stats.get(AUDIO_DIR) if shared_audio else None
+    lines = ["#EXTM3U", f"#EXT-X-VERSION:{4 if shared_audio else 3}"]
+    group = ""
+    if shared_audio:
+        channels = f',CHANNELS="{audio.channels}"' if audio and audio.channels else ""
+        lines.append(f'#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="{AUDIO_GROUP}",NAME="Audio",'
+                     f'DEFAULT=YES,AUTOSELECT=YES{channels},URI="{AUDIO_DIR}/playlist.m3u8"')
+        group = f',AUDIO="{AUDIO_GROUP}"'
+    for rung in ladder:
+        measured = stats.get(rung.name)
+        if measured is None or (shared_audio and audio is None):
+            attributes = f"BANDWIDTH={rung.bandwidth}"
+        else:
+            peak, average, codecs = measured.peak, measured.average, measured.codecs
+            if audio:
+                peak += audio.peak
+                average += audio.average
+                codecs = codecs + audio.codecs if codecs and audio.codecs else None
+            attributes = f"BANDWIDTH={peak},AVERAGE-BANDWIDTH={average}"
+            if codecs:
+                attributes += f',CODECS="{",".join(codecs)}"'
+        attributes += f",RESOLUTION={rung.width}x{rung.height}"
+        if measured and measured.frame_rate:
+            attributes += f",FRAME-RATE={measured.frame_rate:.3f}"
+        lines.append(f'#EXT-X-STREAM-INF:{attributes},NAME="{rung.name}"{group}')
+        lines.append(f"{rung.name}/playlist.m3u8")
+    return "\n".join(lines) + "\n"
+
+
+def measure_renditions(video_out_dir, ladder=LADDER):
+    """Return {rung name or AUDIO_DIR: RenditionStats} for a film's finished renditions."""
+    stats = {}
+    for name in [rung.name for rung in ladder] + [AUDIO_DIR]:
+        path = os.path.join(video_out_dir, name, "playlist.m3u8")
+        if os.path.isfile(path):
+            stats[name] = measure_media_playlist(path)
+    return stats
+
+
+def write_master_playlist(video_out_dir, ladder=LADDER):
+    """Measure a film's renditions and write its master.m3u8. Returns the stats.
+
+    The film has shared audio if AUDIO_DIR holds a playlist. Only reads
+    the finished output, so it can be rerun over any output tree (see
+    playlists.py).
+    """
+    stats = measure_renditions(video_out_dir, ladder)
+    with open(os.path.join(video_out_dir, "master.m3u8"), "w", encoding="utf-8", newline="\n") as f:
+        f.write(master_playlist(ladder, AUDIO_DIR in stats, stats))
+    return stats
+
+
+def playlist_complete(path):
+    """Return True if a playlist exists and every file it references exists.
+
+    Media playlists must also be finished (#EXT-X-ENDLIST); master playlists
+    carry no end tag and only need their variant playlists present.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            lines = [line.strip() for line in f]
+    except OSError:
+        return False
+    is_master = any(line.startswith("#EXT-X-STREAM-INF") for line in lines)
+    if not is_master and "#EXT-X-ENDLIST" not in lines:
+        return False
+    base = os.path.dirname(path)
+    return all(os.path.isfile(os.path.join(base, line))
+               for line in lines if line and not line.startswith("#"))
+
+
+def outputs_complete(job, output_dir):
+    """Return True if every output of a job is on disk (playlists complete)."""
+    for rel in job.outputs:
+        path = os.path.join(output_dir, rel)
+        if path.endswith(".m3u8"):
+            if not playlist_complete(path):
+                return False
+        elif not os.path.isfile(path):
+            return False
+    return True
+
+
+class Journal:
+    """Checkpoint file recording which ffmpeg jobs have finished.
+
+    Entries are keyed by "{kind}:{source hash}:{profile digest}" and record
+    the video ID, outputs, and the size and SHA-256 of every file the job
+    wrote (the uploader verifies against these), plus the seconds the job
+    took when it ran here. A job counts as done only if its entry exists
+    for the same video ID and every output is still on disk (playlists must
+    be complete). The file is rewritten atomically after every change, so
+    a crash mid-run loses at most the jobs that were in flight. The couple's
+    card atlas gets an "atlas:{name}" entry of its own, with the checksums
+    of its files.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f).get("jobs", {})
+        except FileNotFoundError:
+            self.entries = {}
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"Warning: Ignoring unreadable journal {path}: {e}", file=sys.stderr)
+            self.entries = {}
+
+    def is_done(self, job, output_dir):
+        entry = self.entries.get(job.key)
+        if not entry or entry.get("video_id") != job.video_id:
+            return False
+        return outputs_complete(job, output_dir)
+
+    def mark_done(self, job, checksums=None, seconds=None):
+        with self.lock:
+            # Drop entries for older versions of the same film and job kind
+            # (a film's chunks coexist until drop() clears them after stitching)
+            for key, entry in list(self.entries.items()):
+                if (job.kind != "chunk" and entry.get("video_id") == job.video_id
+                        and key.startswith(job.kind + ":")):
+                    del self.entries[key]
+            self.entries[job.key] = {
+                "video_id": job.video_id,
+                "outputs": list(job.outputs),
+                "checksums": checksums or {},
+                "completed": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }
+            if job.kind == "hls" and job.ladder:
+                self.entries[job.key]["ladder"] = [list(rung) for rung in job.ladder]
+            if seconds is not None:
+                self.entries[job.key]["seconds"] = round(seconds, 2)
+            self._save()
+
+    def drop(self, video_id, kinds):
+        """Forget a film's entries of the given job kinds."""
+        with self.lock:
+            for key, entry in list(self.entries.items()):
+                if entry.get("video_id") == video_id and key.split(":", 1)[0] in kinds:
+                    del self.entries[key]
+            self._save()
+
+    def mark_atlas(self, atlas, checksums=None):
+        """Record the couple's card atlas files in place of any earlier atlas (None forgets it)."""
+        with self.lock:
+            for key in [key for key in self.entries if key.startswith("atlas:")]:
+                del self.entries[key]
+            if atlas is not None:
+                self.entries[f"atlas:{atlas['name']}"] = {
+                    "outputs": card_atlas_outputs(atlas),
+                    "checksums": checksums or {},
+                    "completed": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                }
+            self._save()
+
+    def update_checksums(self, checksums):
+        """Replace the recorded checksums of files rewritten after their job finished.
+
+        Only paths some entry already records are updated. Returns how
+        many were.
+        """
+        updated = 0
+        with self.lock:
+            for entry in self.entries.values():
+                recorded = entry.get("checksums", {})
+                for rel, checksum in checksums.items():
+                    if rel in recorded:
+                        recorded[rel] = list(checksum)
+                        updated += 1
+            if updated:
+                self._save()
+        return updated
+
+    def checksums(self):
+        """Return {relative path: (size, sha256)} across all finished jobs."""
+        merged = {}
+        for entry in self.entries.values():
+            for rel, (size, digest) in entry.get("checksums", {}).items():
+                merged[rel] = (size, digest)
+        return merged
+
+    def _save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "jobs": self.entries}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        os.replace(tmp_path, self.path)
+
+
+def print_ladder_report(journal, video_ids):
+    """Print each film's ladder and its HLS size against the fixed ladder.
+
+    The fixed-ladder size is estimated from the ratio of the two ladders'
+    total bitrates. Prints nothing if no film has a per-title ladder.
+    """
+    rows = []
+    for entry in journal.entries.values():
+        ladder = entry.get("ladder")
+        if entry.get("video_id") not in video_ids or not ladder:
+            continue
+        ladder = tuple(Rung(*rung) for rung in ladder)
+        written = sum(size for size, _ in entry.get("checksums", {}).values())
+        rows.append((entry["video_id"], ladder, written, written * ladder_rate(LADDER) / ladder_rate(ladder)))
+    if not rows or all(ladder == LADDER for _, ladder, _, _ in rows):
+        return
+    print("\n=== Per-Title Ladder ===")
+    for video_id, ladder, written, fixed in sorted(rows):
+        print(f"  {video_id:<28} {format_ladder(ladder):<36} {written / 1e6:8.1f} MB "
+              f"(fixed ladder ~{fixed / 1e6:.1f} MB, {(written - fixed) / fixed:+.0%})")
+    written = sum(row[2] for row in rows)
+    fixed = sum(row[3] for row in rows)
+    print(f"  Total: {written / 1e6:.1f} MB written, ~{fixed / 1e6:.1f} MB with the fixed ladder "
+          f"({(written - fixed) / fixed:+.0%}, {(fixed - written) / 1e6:.1f} MB saved)")
+
+
+def print_audio_report(journal, video_ids):
+    """Print what sharing one audio rendition per film saved for the couple.
+
+    Muxed into every rung, each film's audio would be stored and uploaded
+    once per rung (and encoded once per rung). Prints nothing if no film
+    has a shared audio rendition.
+    """
+    films = 0
+    audio = saved = written = 0
+    for key, entry in journal.entries.items():
+        video_id = entry.get("video_id")
+        if video_id not in video_ids or not key.startswith("hls:"):
+            continue
+        checksums = entry.get("checksums", {})
+        size = sum(size for rel, (size, _) in checksums.items()
+                   if rel.startswith(f"{video_id}/{AUDIO_DIR}/"))
+        if not size:
+            continue
+        rungs = len(entry.get("ladder") or LADDER)
+        films += 1
+        audio += size
+        saved += size * (rungs - 1)
+        written += sum(size for size, _ in checksums.values())
+    if not films:
+        return
+    print("\n=== Shared Audio ===")
+    print(f"  {films} film(s): {audio / 1e6:.1f} MB of audio stored and uploaded once instead of per rung, "
+          f"~{saved / 1e6:.1f} MB saved ({saved / (written + saved):.0%} of the HLS output)")
+
+
+def print_derivative_report(journal, video_ids):
+    """Print how long each film's derivative pass took and what it wrote.
+
+    Every derivative comes from one decode of the source; films whose
+    pass ran elsewhere (a queue worker) have no recorded time and are
+    left out. Prints nothing if no film has one.
+    """
+    rows = []
+    for key, entry in journal.entries.items():
+        if entry.get("video_id") not in video_ids or not key.startswith("thumb:") or "seconds" not in entry:
+            continue
+        checksums = entry.get("checksums", {})
+        rows.append((entry["video_id"], len(checksums), sum(size for size, _ in checksums.values()),
+                     entry["seconds"]))
+    if not rows:
+        return
+    print("\n=== Derivatives ===")
+    for video_id, files, size, seconds in sorted(rows):
+        print(f"  {video_id:<28} {files:>4} files {size / 1e6:6.1f} MB in {seconds:6.1f}s (one decode)")
+    print(f"  Total: {sum(row[1] for row in rows)} files from {len(rows)} decode(s) "
+          f"in {sum(row[3] for row in rows):.1f}s")
+
+
+def clean_partial_hls(video_out_dir):
+    """Remove a film's master playlist, rung and audio directories before re-encoding.
+
+    Leftover segments from an interrupted or older encode would otherwise
+    be mixed into the new output and uploaded. Rung folders of every
+    registered profile are removed, so switching to a profile without, say,
+    a 1440p rung does not leave the old one behind.
+    """
+    master = os.path.join(video_out_dir, "master.m3u8")
+    if os.path.exists(master):
+        os.remove(master)
+    rungs = sorted({rung.name for profile in PROFILES.values() for rung in profile.ladder})
+    for name in rungs + [AUDIO_DIR]:
+        shutil.rmtree(os.path.join(video_out_dir, name), ignore_errors=True)
+
+
+def prepare_job(job, output_dir):
+    """Clear what an earlier attempt at a job left behind and create its folders."""
+    video_out_dir = os.path.join(output_dir, job.video_id)
+    if job.kind == "hls":
+        clean_partial_hls(video_out_dir)
+        if job.chunk:
+            return  # stitched from the chunks in .chunks/
+        shutil.rmtree(os.path.join(video_out_dir, CHUNKS_DIR), ignore_errors=True)
+        for rung in job.ladder or LADDER:
+            os.makedirs(os.path.join(video_out_dir, rung.name), exist_ok=True)
+        if f"{job.video_id}/{AUDIO_DIR}/playlist.m3u8" in job.outputs:
+            os.makedirs(os.path.join(video_out_dir, AUDIO_DIR), exist_ok=True)
+    elif job.kind == "chunk":
+        chunk_dir = os.path.join(video_out_dir, CHUNKS_DIR, f"{job.chunk.index:03d}")
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+        for rung in job.ladder or LADDER:
+            os.makedirs(os.path.join(chunk_dir, rung.name), exist_ok=True)
+    elif job.kind == "thumb":
+        # Sprite sheets of an older, longer cut would otherwise linger
+        thumbs_dir = os.path.join(output_dir, THUMBS_DIR, job.video_id)
+        shutil.rmtree(thumbs_dir, ignore_errors=True)
+        os.makedirs(thumbs_dir)
+    elif job.kind == "audio":
+        os.makedirs(os.path.join(video_out_dir, CHUNKS_DIR), exist_ok=True)
+        if job.chunk is None:
+            audio_dir = os.path.join(video_out_dir, CHUNKS_DIR, AUDIO_DIR)
+            shutil.rmtree(audio_dir, ignore_errors=True)
+            os.makedirs(audio_dir)
+
+
+def default_workers():
+    """Size the worker pool to the machine's cores and available memory."""
+    cores = os.cpu_count() or 1
+    workers = max(1, cores // CORES_PER_JOB)
+    try:
+        available_mb = os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        available_mb = None  # not exposed on Windows
+    if available_mb:
+        workers = min(workers, max(1, available_mb // MEMORY_PER_JOB_MB))
+    return workers
+
+
+def job_label(job):
+    """Short label for progress lines: the job kind, or "3/12" for a chunk."""
+    if job.kind == "chunk":
+        return f"{job.chunk.index + 1}/{job.chunk.count}"
+    return job.kind
+
+
+class ProgressReporter:
+    """Prints per-job progress lines from concurrent ffmpeg runs.
+
+    Each job reports at most once per `step` percent so several encodes
+    running side by side stay readable.
+    """
+
+    def __init__(self, step=10):
+        self.step = step
+        self.lock = threading.Lock()
+        self.last = {}
+
+    def update(self, job, fraction, speed):
+        percent = min(100, int(fraction * 100))
+        with self.lock:
+            if percent < self.last.get(job.key, -self.step) + self.step:
+                return
+            self.last[job.key] = percent - percent % self.step
+            print(f"  {job.video_id:<28} {job_label(job):<5} {percent:3d}%  {speed or '':>6}", flush=True)
+
+    def message(self, text):
+        with self.lock:
+            print(text, flush=True)
+
+
+def run_ffmpeg(job, reporter=None, on_spawn=None):
+    """Run one ffmpeg job, streaming -progress output to the reporter.
+
+    stderr goes to job.log_path. on_spawn(proc) is called once ffmpeg has
+    started (so another thread can terminate it). Returns the ffmpeg exit
+    code.
+    """
+    os.makedirs(os.path.dirname(job.log_path), exist_ok=True)
+    with open(job.log_path, "w", encoding="utf-8", errors="replace") as log:
+        proc = subprocess.Popen(job.argv, stdout=subprocess.PIPE, stderr=log,
+                                stdin=subprocess.DEVNULL, text=True, errors="replace")
+        if on_spawn:
+            on_spawn(proc)
+        speed = None
+        for line in proc.stdout:
+            key, _, value = line.strip().partition("=")
+            if key == "speed":
+                speed = value
+            elif key == "out_time_us" and reporter and job.duration:
+                try:
+                    reporter.update(job, int(value) / 1e6 / job.duration, speed)
+                except ValueError:
+                    pass  # "N/A" before the first frame is written
+            elif key == "progress" and value == "end" and reporter:
+                reporter.update(job, 1.0, speed)
+        return proc.wait()
+
+
+def run_job(job, retries=2, reporter=None):
+    """Run a job, retrying with backoff. Raises TranscodeError on final failure."""
+    for attempt in range(retries + 1):
+        if attempt:
+            delay = 2 ** attempt
+            if reporter:
+                reporter.message(f"  {job.video_id:<28} {job_label(job):<5} retry {attempt}/{retries} in {delay}s")
+            time.sleep(delay)
+        try:
+            code = run_ffmpeg(job, reporter)
+        except OSError as e:
+            code = f"could not start ffmpeg: {e}"
+        if code == 0:
+            return
+    raise TranscodeError(f"ffmpeg exit code {code} (log: {job.log_path})")
+
+
+def record_checksums(output_dir, rel_paths):
+    """Return {relative path: [size, sha256]} for files under output_dir."""
+    checksums = {}
+    for rel in rel_paths:
+        path = os.path.join(output_dir, rel)
+        checksums[rel] = [os.path.getsize(path), fingerprint.hash_full(path)]
+    return checksums
+
+
+def finish_job(job, output_dir):
+    """Write a finished job's remaining outputs and checksum what it wrote.
+
+    HLS jobs get their measured master playlist here (chunked films are
+    stitched and get their shared audio rendition moved into place first); a
+    chunked film's audio job slices its track for the chunks, and a
+    derivative job writes the thumbnail track over its sprite sheets.
+    Normally runs on the worker thread so hashing freshly written segments
+    (still in the page cache) overlaps with other encodes. Returns the
+    checksums for the journal; chunk and audio outputs are intermediate
+    and get none.
+    """
+    video_out_dir = os.path.join(output_dir, job.video_id)
+    if job.kind in ("audio", "chunk"):
+        if job.kind == "audio" and job.chunk:
+            chunks_dir = os.path.join(video_out_dir, CHUNKS_DIR)
+            slice_chunk_audio(os.path.join(chunks_dir, "audio.aac"), chunks_dir, job.chunk)
+        os.remove(job.log_path)
+        return {}
+    if job.kind == "hls":
+        audio_dir = os.path.join(video_out_dir, AUDIO_DIR)
+        if job.chunk:
+            stitch_chunks(video_out_dir, job.chunk, job.ladder or LADDER)
+            chunk_audio_dir = os.path.join(video_out_dir, CHUNKS_DIR, AUDIO_DIR)
+            if os.path.isdir(chunk_audio_dir):
+                shutil.rmtree(audio_dir, ignore_errors=True)
+                os.replace(chunk_audio_dir, audio_dir)
+            shutil.rmtree(os.path.join(video_out_dir, CHUNKS_DIR), ignore_errors=True)
+        write_master_playlist(video_out_dir, job.ladder or LADDER)
+        if os.path.exists(job.log_path):
+            os.remove(job.log_path)
+        rel_paths = []
+        for dirpath, dirnames, filenames in os.walk(video_out_dir):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            for name in filenames:
+                if not name.endswith(".log"):
+                    rel = os.path.relpath(os.path.join(dirpath, name), output_dir)
+                    rel_paths.append(rel.replace(os.sep, "/"))
+    else:
+        if job.kind == "thumb":
+            write_thumbnails_vtt(output_dir, job.video_id, plan_derivatives(job.duration))
+        os.remove(job.log_path)
+        rel_paths = list(job.outputs)
+    return record_checksums(output_dir, sorted(rel_paths))
+
+
+def run_and_finish(job, output_dir, retries=2, reporter=None, on_start=None, after=None):
+    """Run a job, then finish it.
+
+    after is a future (a chunk's audio job) that must succeed first.
+    Returns (checksums from finish_job(), seconds the job took, retries
+    included).
+    """
+    if after is not None:
+        after.result()
+    if on_start:
+        on_start(job)
+    started = time.perf_counter()
+    run_job(job, retries, reporter)
+    checksums = finish_job(job, output_dir)
+    return checksums, time.perf_counter() - started
+
+
+def card_atlas_films(config, output_dir):
+    """Return the collection grid's video IDs, in display order, that have a poster in output_dir.
+
+    The grid is every video but the featured one (the first with
+    "featured" set, else the first), as generate.collection_videos picks it.
+    """
+    videos = config.get("videos", [])
+    if not videos:
+        return []
+    featured = next((video for video in videos if video.get("featured")), videos[0])
+    grid = sorted((video for video in videos if video is not featured), key=lambda video: video.get("order", 0))
+    return [video["id"] for video in grid
+            if os.path.isfile(os.path.join(output_dir, THUMBS_DIR, f"{video['id']}.jpg"))]
+
+
+def card_atlas_grid(count):
+    """Return the (columns, rows) of a card atlas of count tiles: as square as CARD_ATLAS_MAX_SIDE allows."""
+    tile_width = CARD_WIDTHS[-1]
+    columns = min(math.ceil(math.sqrt(count)), CARD_ATLAS_MAX_SIDE // tile_width)
+    rows = -(-count // columns)
+    if rows * (tile_width * 9 // 16) > CARD_ATLAS_MAX_SIDE:
+        raise TranscodeError(f"{count} films do not fit in one card atlas")
+    return columns, rows
+
+
+def plan_card_atlas(output_dir, video_ids, formats=CARD_FORMATS):
+    """Return the card atlas record for the posters of video_ids.
+
+    The record is what the couple config stores: the atlas name (with a
+    digest of the films, their posters and the grid), its grid of tiles,
+    each film's tile as [column, row] and the card formats it is written in.
+    """
+    columns, rows = card_atlas_grid(len(video_ids))
+    digest = hashlib.sha256(f"{columns}x{rows}".encode("utf-8"))
+    for video_id in video_ids:
+        with open(os.path.join(output_dir, THUMBS_DIR, f"{video_id}.jpg"), "rb") as f:
+            digest.update(b"\0" + video_id.encode("utf-8") + b"\0" + hashlib.sha256(f.read()).digest())
+    return {
+        "name": f"{CARD_ATLAS_PREFIX}-{digest.hexdigest()[:12]}",
+        "columns": columns,
+        "rows": rows,
+        "offsets": {video_id: [i % columns, i // columns] for i, video_id in enumerate(video_ids)},
+        "formats": list(formats),
+    }
+
+
+def card_atlas_formats(atlas):
+    """Return the card formats an atlas is written in (records from before "formats" have them all)."""
+    return atlas.get("formats", list(CARD_FORMATS))
+
+
+def card_atlas_outputs(atlas):
+    """Return the files of a card atlas, relative to the output directory."""
+    return [f"{THUMBS_DIR}/{atlas['name']}-{width}.{ext}"
+            for width in CARD_WIDTHS for ext in card_atlas_formats(atlas)]
+
+
+def build_card_atlas_command(output_dir, atlas):
+    """Build the ffmpeg argv that lays a couple's posters out as its card atlas.
+
+    Each poster is scaled to the widest card, the tiles are laid out in
+    the order of their offsets, and the atlas is scaled to every card
+    width in each of its card formats.
+    """
+    films = sorted(atlas["offsets"], key=lambda video_id: atlas["offsets"][video_id][::-1])
+    width = CARD_WIDTHS[-1]
+    height = width * 9 // 16
+    columns, rows = atlas["columns"], atlas["rows"]
+    formats = card_atlas_formats(atlas)
+    argv = ["ffmpeg", "-nostdin", "-v", "error"]
+    for video_id in films:
+        argv += ["-i", os.path.join(output_dir, THUMBS_DIR, f"{video_id}.jpg")]
+    graph = [f"[{i}:v]{scale_pad(width, height)},setsar=1[tile{i}]"
+             for i in range(len(films))]
+    graph.append("".join(f"[tile{i}]" for i in range(len(films)))
+                 + f"concat=n={len(films)}:v=1:a=0,tile={columns}x{rows},"
+                 f"split={len(CARD_WIDTHS)}" + "".join(f"[atlas{i}]" for i in range(len(CARD_WIDTHS))))
+    graph += [f"[atlas{i}]scale={columns * card_width}:{rows * card_width * 9 // 16},"
+              f"split={len(formats)}" + "".join(f"[atlas{i}_{ext}]" for ext in formats)
+              for i, card_width in enumerate(CARD_WIDTHS)]
+    argv += ["-filter_complex", ";".join(graph)]
+    for i, card_width in enumerate(CARD_WIDTHS):
+        for ext in formats:
+            argv += ["-map", f"[atlas{i}_{ext}]", "-frames:v", "1", *CARD_FORMATS[ext],
+                     os.path.join(output_dir, THUMBS_DIR, f"{atlas['name']}-{card_width}.{ext}")]
+    return argv + ["-y"]
+
+
+def write_card_atlas(output_dir, config_path, journal=None):
+    """Build the couple's card atlas from the posters in output_dir and record it in the config.
+
+    With a journal, the atlas files' checksums are recorded in it too, for
+    the uploaders to verify against.
+
+    The atlas is rebuilt only if its films or posters changed (or its
+    files are missing); older atlases are removed from thumbs/. Returns
+    the atlas record, or None if no grid card has a poster yet (any atlas
+    recorded before is then dropped).
+    """
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    video_ids = card_atlas_films(config, output_dir)
+    atlas = plan_card_atlas(output_dir, video_ids, card_formats()) if video_ids else None
+    outputs = card_atlas_outputs(atlas) if atlas else []
+    built = bool(outputs) and not all(os.path.isfile(os.path.join(output_dir, rel)) for rel in outputs)
+    if built:
+        try:
+            subprocess.run(build_card_atlas_command(output_dir, atlas), capture_output=True, text=True, check=True)
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise TranscodeError(f"could not build the card atlas: {getattr(e, 'stderr', '') or e}") from e
+    current = {os.path.basename(rel) for rel in outputs}
+    for path in glob.glob(os.path.join(output_dir, THUMBS_DIR, f"{CARD_ATLAS_PREFIX}-*")):
+        if os.path.basename(path) not in current:
+            os.remove(path)
+    if journal is not None and (built or (f"atlas:{atlas['name']}" if atlas else None) not in journal.entries):
+        journal.mark_atlas(atlas, record_checksums(output_dir, outputs))
+    if config.get("card_atlas") != atlas:
+        if atlas is None:
+            del config["card_atlas"]
+        else:
+            config["card_atlas"] = atlas
+        with open(config_path, "w", encoding="utf-8") as f:
+            json.dump(config, f, indent=4)
+            f.write("\n")
+    return atlas
+
+
+def refresh_card_atlas(output_dir, config_path, journal=None):
+    """write_card_atlas, with a failure reported as a warning (the page falls back to per-film cards).
+
+    Returns the atlas record, or None.
+    """
+    try:
+        return write_card_atlas(output_dir, config_path, journal)
+    except (TranscodeError, OSError) as e:
+        print(f"Warning: {e}", file=sys.stderr)
+        return None
+
+
+def print_card_atlas(output_dir, atlas):
+    """Print one summary line for a couple's card atlas (nothing if there is none)."""
+    if atlas is None:
+        return
+    ext = card_atlas_formats(atlas)[0]
+    paths = {width: os.path.join(output_dir, THUMBS_DIR, f"{atlas['name']}-{width}.{ext}") for width in CARD_WIDTHS}
+    sizes = ", ".join(f"{width}px {os.path.getsize(path) / 1000:.0f} KB" for width, path in paths.items())
+    print(f"\nCard atlas: {THUMBS_DIR}/{atlas['name']}-*, {len(atlas['offsets'])} film(s) "
+          f"in {atlas['columns']}x{atlas['rows']} tiles ({ext.upper()} {sizes})")
+
+
+def discover_sources(input_dir):
+    """Return the sorted MP4 paths in input_dir."""
+    return sorted(glob.glob(os.path.join(input_dir, "*.mp4")))
+
+
+def update_config_durations(config_path, durations):
+    """Write detected durations into the couple config.
+
+    Returns the video IDs that had no matching config entry.
+    """
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    unmatched = set(durations)
+    changed = False
+    for video in config.get("videos", []):
+        if video.get("id") in durations:
+            unmatched.discard(video["id"])
+            if video.get("duration") != durations[video["id"]]:
+                video["duration"] = durations[video["id"]]
+                changed = True
+    if changed:
+        with open(config_path, "w", encoding="utf-8") as f:
+            json.dump(config, f, indent=4)
+            f.write("\n")
+    return sorted(unmatched)
+
+
+def chunked_jobs(src, video_id, video_out_dir, chunks, encoding, audio_start, duration, threads, key_prefix,
+                 ladder=LADDER, packaging=DEFAULT_PACKAGING):
+    """Build the audio, chunk and film jobs for a film encoded in chunks.
+
+    With shared audio the audio job writes the film's audio rendition
+    (moved into place when the film is stitched) and the chunks are
+    video-only; otherwise it writes the slices the chunks mux in.
+    """
+    chunks_dir = os.path.join(video_out_dir, CHUNKS_DIR)
+    layout = ",".join(f"{chunk.start:.3f}" for chunk in chunks)
+    shared_audio = packaging.shared_audio and audio_start is not None
+    muxed_audio = not packaging.shared_audio and audio_start is not None
+    jobs = []
+    if shared_audio:
+        jobs.append(Job(
+            video_id, "audio",
+            build_audio_rendition_command(src, os.path.join(chunks_dir, AUDIO_DIR), encoding, packaging),
+            os.path.join(chunks_dir, "audio.log"), duration,
+            f"audio:{key_prefix}",
+            [f"{video_id}/{CHUNKS_DIR}/{AUDIO_DIR}/playlist.m3u8"],
+        ))
+    elif muxed_audio:
+        jobs.append(Job(
+            video_id, "audio", build_audio_command(src, os.path.join(chunks_dir, "audio.aac"), encoding.profile),
+            os.path.join(chunks_dir, "audio.log"), duration,
+            f"audio:{key_prefix}:{layout}",
+            [f"{video_id}/{CHUNKS_DIR}/audio{chunk.index:03d}.aac" for chunk in chunks],
+            chunks,
+        ))
+    for chunk in chunks:
+        chunk_dir = os.path.join(chunks_dir, f"{chunk.index:03d}")
+        end = chunks[chunk.index + 1].start if chunk.index + 1 < len(chunks) else duration
+        jobs.append(Job(
+            video_id, "chunk",
+            build_chunk_command(src, chunk_dir, chunk, encoding,
+                                os.path.join(chunks_dir, f"audio{chunk.index:03d}.aac")
+                                if muxed_audio else None,
+                                threads, ladder, packaging),
+            os.path.join(chunk_dir, "ffmpeg.log"), end - chunk.start,
+            f"chunk:{key_prefix}:{layout}:{chunk.index}",
+            [f"{video_id}/{CHUNKS_DIR}/{chunk.index:03d}/{rung.name}/playlist.m3u8" for rung in ladder],
+            chunk, ladder,
+        ))
+    jobs.append(Job(
+        video_id, "hls", None, os.path.join(video_out_dir, "ffmpeg.log"), duration,
+        f"hls:{key_prefix}", hls_outputs(video_id, ladder, shared_audio), chunks, ladder,
+    ))
+    return jobs
+
+
+def hls_outputs(video_id, ladder, shared_audio):
+    """Return the playlists a film's HLS job writes, relative to the output directory."""
+    outputs = [f"{video_id}/master.m3u8"] + [f"{video_id}/{rung.name}/playlist.m3u8" for rung in ladder]
+    if shared_audio:
+        outputs.append(f"{video_id}/{AUDIO_DIR}/playlist.m3u8")
+    return outputs
+
+
+def plan_film_ladders(sources, source_hashes, index, profile=DEFAULT_PROFILE):
+    """Return each film's per-title ladder, probing the complexity of films not yet cached.
+
+    The probes run PROBE_WORKERS at a time, once per distinct source; the
+    index is only used from this thread. Returns (ladders, failures) keyed
+    by source path, where failures maps sources that could not be probed
+    to errors.
+    """
+    name = probe_settings()
+    sizes = {}
+    complexities = {}
+    pending = {}
+    failures = {}
+    for src in sources:
+        source_hash = source_hashes[src]
+        try:
+            sizes[src] = probe_video_size(src)
+            if source_hash in complexities or source_hash in pending:
+                continue
+            complexity = index.cached_probe(source_hash, name)
+            if complexity is None:
+                pending[source_hash] = (src, probe_duration(src))
+            else:
+                complexities[source_hash] = complexity
+        except TranscodeError as e:
+            failures[src] = str(e)
+
+    errors = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=PROBE_WORKERS) as pool:
+        futures = {pool.submit(probe_complexity, src, duration, *sizes[src]): source_hash
+                   for source_hash, (src, duration) in pending.items()}
+        for future in concurrent.futures.as_completed(futures):
+            source_hash = futures[future]
+            try:
+                complexities[source_hash] = future.result()
+            except TranscodeError as e:
+                errors[source_hash] = str(e)
+                continue
+            index.store_probe(source_hash, name, complexities[source_hash])
+
+    ladders = {}
+    for src in sources:
+        source_hash = source_hashes[src]
+        if src in failures:
+            continue
+        if source_hash in errors:
+            failures[src] = errors[source_hash]
+        else:
+            ladders[src] = plan_ladder(*sizes[src], complexities[source_hash], profile)
+    return ladders, failures
+
+
+def plan_jobs(sources, output_dir, threads, index, chunk_seconds=0, fixed_ladder=False,
+              packaging=None, profile=DEFAULT_PROFILE):
+    """Probe and fingerprint each source and build its HLS and derivative (thumb) jobs.
+
+    Films are encoded with profile: each gets a per-title ladder from the
+    profile's rungs (plan_ladder) unless fixed_ladder is set, packaged as
+    packaging says (segment format, single file, shared audio rendition;
+    default: the profile's packaging), with keyframes and segments planned
+    from its frame rate (plan_encoding). Films at least twice
+    chunk_seconds long (if set) get chunked jobs instead of a single HLS
+    job. Source hashes come from the fingerprint index, so unchanged
+    sources are not re-read (nor re-probed for complexity; the other
+    films' probes run side by side, see plan_film_ladders). Returns
+    (durations, jobs, failures) where durations maps video IDs to seconds
+    and failures maps video IDs that could not be probed to errors.
+    """
+    packaging = packaging or profile.packaging
+    formats = card_formats()
+    warn_card_formats(formats)
+    thumb_profile = profile_digest("thumb", formats=formats)
+    source_hashes, _ = index.scan(sources, "full")
+    ladders, probe_failures = {}, {}
+    if not fixed_ladder:
+        ladders, probe_failures = plan_film_ladders(sources, source_hashes, index, profile)
+    durations = {}
+    jobs = []
+    failures = {}
+    for src in sources:
+        video_id = os.path.splitext(os.path.basename(src))[0]
+        source_hash = source_hashes[src]
+        if src in probe_failures:
+            failures[video_id] = probe_failures[src]
+            continue
+        try:
+            duration = probe_duration(src)
+            ladder = ladders.get(src, profile.ladder)
+            encoding = plan_encoding(probe_frame_rate(src), profile)
+            chunks = None
+            audio_start = probe_audio_start(src)
+            if chunk_seconds and duration >= 2 * chunk_seconds:
+                chunks = plan_chunks(probe_frames(src), encoding, chunk_seconds, audio_start)
+        except TranscodeError as e:
+            failures[video_id] = str(e)
+            continue
+        durations[video_id] = duration
+        video_out_dir = os.path.join(output_dir, video_id)
+        if chunks and len(chunks) > 1:
+            jobs += chunked_jobs(src, video_id, video_out_dir, chunks, encoding, audio_start, duration, threads,
+                                 f"{source_hash}:{profile_digest('chunk', ladder, packaging, encoding)}",
+                                 ladder, packaging)
+        else:
+            has_audio = audio_start is not None
+            jobs.append(Job(
+                video_id, "hls",
+                build_hls_command(src, video_out_dir, encoding, threads, ladder, packaging, has_audio),
+                os.path.join(video_out_dir, "ffmpeg.log"), duration,
+                f"hls:{source_hash}:{profile_digest('hls', ladder, packaging, encoding)}",
+                hls_outputs(video_id, ladder, packaging.shared_audio and has_audio),
+                ladder=ladder,
+            ))
+        derivatives = plan_derivatives(duration)
+        jobs.append(Job(
+            video_id, "thumb",
+            build_derivatives_command(src, output_dir, video_id, derivatives, formats),
+            os.path.join(video_out_dir, "thumb.log"), duration,
+            f"thumb:{source_hash}:{thumb_profile}",
+            derivative_outputs(video_id, derivatives, formats),
+        ))
+    return durations, jobs, failures
+
+
+# Pool order: a chunked film's audio job before its chunks (which wait for
+# it), then the encodes longest first, then the derivative passes (one
+# decode each, no encoding beyond a few stills).
+JOB_ORDER = {"audio": 0, "hls": 1, "chunk": 1, "thumb": 2}
+
+
+def transcode_all(sources, output_dir, workers, retries=2, reporter=None, journal=None,
+                  index=None, on_start=None, on_finished=None, chunk_seconds=0, fixed_ladder=False,
+                  packaging=None, profile=DEFAULT_PROFILE):
+    """Transcode every source on a pool of `workers` concurrent ffmpeg jobs.
+
+    Jobs already recorded as done in the journal are skipped. Films are
+    encoded with profile and get per-title ladders unless fixed_ladder is
+    set, packaged as packaging says. Long films are split
+    into chunk jobs if chunk_seconds is set (see plan_jobs) and
+    stitched here once their last chunk finishes. on_start(job) is called
+    on the worker thread just before a job's ffmpeg starts (after its
+    output folders were cleaned); on_finished(job, checksums) on the
+    calling thread once it has finished and been journaled (for a chunked
+    film, once it is stitched). Returns (durations, failures, skipped):
+    {video_id: "M:SS"} for every film whose HLS output is complete,
+    {video_id: error message} for the rest, and the number of jobs skipped
+    as already done.
+    """
+    reporter = reporter or ProgressReporter()
+    os.makedirs(os.path.join(output_dir, "thumbs"), exist_ok=True)
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    if index is None:
+        index = fingerprint.FingerprintIndex()
+    durations, jobs, failures = plan_jobs(sources, output_dir, threads, index, chunk_seconds, fixed_ladder,
+                                          packaging, profile)
+
+    def done(job):
+        return journal is not None and journal.is_done(job, output_dir)
+
+    films = {}  # video_id -> film job of a chunked film still to be stitched
+    parts_left = collections.Counter()
+    for job in jobs:
+        if job.kind == "hls" and job.chunk and not done(job):
+            films[job.video_id] = job
+    pending = []
+    skipped = 0
+    for job in jobs:
+        if job.kind in ("audio", "chunk") and job.video_id not in films:
+            continue  # the stitched film is already complete
+        if job.kind == "hls" and job.chunk:
+            skipped += job.video_id not in films  # otherwise stitched once its chunks are done
+            continue
+        if done(job):
+            skipped += job.kind not in ("audio", "chunk")
+            continue
+        prepare_job(job, output_dir)
+        if job.kind in ("audio", "chunk"):
+            parts_left[job.video_id] += 1
+        pending.append(job)
+
+    def stitch(film):
+        """Finish a chunked film whose chunks are all done."""
+        prepare_job(film, output_dir)
+        try:
+            checksums = finish_job(film, output_dir)
+        except (TranscodeError, OSError) as e:
+            failures[film.video_id] = f"could not stitch chunks: {e}"
+            return
+        if journal is not None:
+            journal.mark_done(film, checksums)
+            journal.drop(film.video_id, ("audio", "chunk"))
+        reporter.message(f"  {film.video_id:<28} stitched {len(film.chunk)} chunks")
+        if on_finished:
+            on_finished(film, checksums)
+
+    for video_id, film in films.items():
+        if not parts_left[video_id]:
+            stitch(film)  # every chunk finished before a crash; only the stitch is left
+
+    # Longest encodes first keeps the pool busy and shortens the overall run;
+    # the quicker derivative jobs fill in at the end.
+    pending.sort(key=lambda job: (JOB_ORDER[job.kind], -(job.duration or 0)))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        audio_futures = {}
+        # Submitted in order, so a film's audio job is always started
+        # before any of its chunks can block a worker waiting for it.
+        # Chunks only wait for audio slices, not for a shared rendition.
+        for job in pending:
+            future = pool.submit(run_and_finish, job, output_dir, retries, reporter, on_start,
+                                 audio_futures.get(job.video_id) if job.kind == "chunk" else None)
+            if job.kind == "audio" and job.chunk:
+                audio_futures[job.video_id] = future
+            futures[future] = job
+        for future in concurrent.futures.as_completed(futures):
+            job = futures[future]
+            try:
+                checksums, seconds = future.result()
+            except (TranscodeError, OSError) as e:
+                if job.kind == "thumb":
+                    reporter.message(f"  {job.video_id:<28} derivatives failed ({e})")
+                else:
+                    failures.setdefault(job.video_id, str(e))
+                continue
+            if job.kind == "thumb":
+                reporter.message(f"  {job.video_id:<28} {len(job.outputs)} derivatives from one decode "
+                                 f"in {seconds:.1f}s")
+            if journal is not None:
+                journal.mark_done(job, checksums, seconds)
+            if job.kind in ("audio", "chunk"):
+                parts_left[job.video_id] -= 1
+                if not parts_left[job.video_id] and job.video_id not in failures:
+                    stitch(films[job.video_id])
+            elif on_finished:
+                on_finished(job, checksums)
+
+    ok = {video_id: format_duration(seconds) for video_id, seconds in durations.items()
+          if video_id not in failures}
+    return ok, failures, skipped
+
+
+def add_packaging_arguments(parser):
+    """Add the --profile, --segment-format, --single-file and --muxed-audio options."""
+    parser.add_argument(
+        "--profile", choices=sorted(PROFILES), default=DEFAULT_PROFILE_NAME,
+        help=f"Encoding profile from {os.path.basename(PROFILES_PATH)} (default: {DEFAULT_PROFILE_NAME}; "
+             "see profiles.py list)"
+    )
+    parser.add_argument(
+        "--segment-format", choices=sorted(SEGMENT_FORMATS),
+        help="HLS segments as MPEG-TS (.ts) or fMP4/CMAF (init.mp4 + .m4s) (default: the profile's)"
+    )
+    parser.add_argument(
+        "--single-file", action="store_true",
+        help="Write each rung as one media file with EXT-X-BYTERANGE playlists instead of one file per segment"
+    )
+    parser.add_argument(
+        "--muxed-audio", action="store_true",
+        help="Mux the audio into every rung (as transcode.sh does) instead of one shared audio rendition"
+    )
+
+
+def profile_from_args(args):
+    """Return the Profile selected by add_packaging_arguments' --profile option."""
+    return PROFILES[args.profile]
+
+
+def packaging_from_args(args):
+    """Return the Packaging selected by add_packaging_arguments' options over the profile's."""
+    packaging = profile_from_args(args).packaging
+    return Packaging(args.segment_format or packaging.segment_format,
+                     args.single_file or packaging.single_file,
+                     packaging.shared_audio and not args.muxed_audio)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Transcode a folder of MP4s into multi-bitrate HLS on a pool of ffmpeg workers."
+    )
+    parser.add_argument(
+        "-i", "--input-dir", required=True,
+        help="Directory containing source MP4 files"
+    )
+    parser.add_argument(
+        "-c", "--config", required=True,
+        help="Path to the couple config JSON (durations are written back)"
+    )
+    parser.add_argument(
+        "-o", "--output-dir", default="./output",
+        help="Output directory for HLS files (default: ./output)"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=0,
+        help="Concurrent ffmpeg jobs (default: sized to CPU cores and free memory)"
+    )
+    parser.add_argument(
+        "--retries", type=int, default=2,
+        help="Retries per failed ffmpeg job (default: 2)"
+    )
+    parser.add_argument(
+        "--journal",
+        help=f"Checkpoint journal path (default: <output-dir>/{JOURNAL_NAME})"
+    )
+    parser.add_argument(
+        "--force", action="store_true",
+        help="Ignore the journal and transcode everything again"
+    )
+    parser.add_argument(
+        "--fingerprint-db",
+        help=f"Source fingerprint index (default: {fingerprint.default_db_path()})"
+    )
+    parser.add_argument(
+        "--chunk-seconds", type=float, default=0,
+        help="Encode films at least twice this long in segment-aligned chunks in parallel "
+             "(e.g. 120; default: off)"
+    )
+    parser.add_argument(
+        "--fixed-ladder", action="store_true",
+        help="Encode every film at the profile's fixed ladder (standard: 5000k/2500k/1000k) "
+             "instead of a per-title one"
+    )
+    add_packaging_arguments(parser)
+    args = parser.parse_args()
+
+    check_tools()
+    if not os.path.isdir(args.input_dir):
+        print(f"Error: Input directory not found: {args.input_dir}", file=sys.stderr)
+        sys.exit(1)
+    try:
+        with open(args.config, "r", encoding="utf-8") as f:
+            json.load(f)
+    except FileNotFoundError:
+        print(f"Error: Config file not found: {args.config}", file=sys.stderr)
+        sys.exit(1)
+    except json.JSONDecodeError as e:
+        print(f"Error: Config file is not valid JSON: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    sources = discover_sources(args.input_dir)
+    if not sources:
+        print(f"Error: No MP4 files found in {args.input_dir}", file=sys.stderr)
+        sys.exit(1)
+
+    workers = args.workers or default_workers()
+    output_dir = os.path.abspath(args.output_dir)
+    print("\n=== Flyin' Iris HLS Transcoder ===")
+    print(f"Input:   {os.path.abspath(args.input_dir)}")
+    print(f"Output:  {output_dir}")
+    print(f"Config:  {os.path.abspath(args.config)}")
+    print(f"Found {len(sources)} MP4 file(s), running {workers} job(s) at a time\n")
+
+    os.makedirs(output_dir, exist_ok=True)
+    journal = Journal(args.journal or os.path.join(output_dir, JOURNAL_NAME))
+    if args.force:
+        journal.entries = {}
+
+    started = time.perf_counter()
+    with fingerprint.FingerprintIndex(args.fingerprint_db) as index:
+        durations, failures, skipped = transcode_all(sources, output_dir, workers, args.retries,
+                                                     journal=journal, index=index,
+                                                     chunk_seconds=args.chunk_seconds,
+                                                     fixed_ladder=args.fixed_ladder,
+                                                     packaging=packaging_from_args(args),
+                                                     profile=profile_from_args(args))
+    unmatched = update_config_durations(args.config, durations)
+    atlas = refresh_card_atlas(output_dir, args.config, journal)
+
+    print("\n=== Transcode Complete ===")
+    for video_id in sorted(durations):
+        note = "  (no matching config entry)" if video_id in unmatched else ""
+        print(f"  done    {video_id:<28} {durations[video_id]:>6}{note}")
+    for video_id in sorted(failures):
+        print(f"  FAILED  {video_id:<28} {failures[video_id]}", file=sys.stderr)
+    print(f"\nProcessed: {len(sources)} video(s) in {time.perf_counter() - started:.1f}s")
+    if skipped:
+        print(f"Skipped:   {skipped} job(s) already done (see {journal.path})")
+    if failures:
+        print(f"Failed:    {len(failures)} video(s)")
+    print(f"Output:    {output_dir}")
+    print(f"Config updated: {args.config}")
+    print_ladder_report(journal, durations)
+    print_audio_report(journal, durations)
+    print_derivative_report(journal, durations)
+    print_card_atlas(output_dir, atlas)
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
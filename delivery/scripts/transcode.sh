@@ -3,26 +3,36 @@
 # transcode.sh — Flyin' Iris HLS Transcoder
 #
 # Transcodes MP4 files into multi-bitrate HLS streams.
-# For each MP4, creates 1080p/720p/480p variants, master playlist,
-# thumbnail, and updates the couple config JSON with detected durations.
+# For each MP4, creates the variants of an encoding profile (default:
+# 1080p/720p/480p, none above the source's resolution), master playlist,
+# poster and the other stills (card thumbnails, sprite sheets, preview
+# frames; one decode), and updates the couple config JSON with detected
+# durations. The ffmpeg command comes from the
+# profile registry (profiles.json, through profiles.py), the same one
+# transcode.py encodes with.
 #
 # Usage:
-#   ./transcode.sh -i <input_dir> -c <config_file> [-o <output_dir>]
+#   ./transcode.sh -i <input_dir> -c <config_file> [-o <output_dir>] [-p <profile>]
 #
-# Dependencies: ffmpeg, ffprobe, jq
+# Dependencies: ffmpeg, ffprobe, jq, python3
 
 set -euo pipefail
 
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+
 # --- Defaults ---
 OUTPUT_DIR="./output"
+PROFILE=""
 
 # --- Usage ---
 usage() {
-    echo "Usage: $0 -i <input_dir> -c <config_file> [-o <output_dir>]"
+    echo "Usage: $0 -i <input_dir> -c <config_file> [-o <output_dir>] [-p <profile>]"
     echo ""
     echo "  -i  Directory containing source MP4 files (required)"
     echo "  -c  Path to couple JSON config file (required)"
     echo "  -o  Output directory for HLS files (default: ./output)"
+    echo "  -p  Encoding profile from profiles.json (default: the registry's default;"
+    echo "      list them with: python3 $SCRIPT_DIR/profiles.py list)"
     exit 1
 }
 
@@ -30,11 +40,12 @@ usage() {
 INPUT_DIR=""
 CONFIG_FILE=""
 
-while getopts "i:c:o:h" opt; do
+while getopts "i:c:o:p:h" opt; do
     case $opt in
         i) INPUT_DIR="$OPTARG" ;;
         c) CONFIG_FILE="$OPTARG" ;;
         o) OUTPUT_DIR="$OPTARG" ;;
+        p) PROFILE="$OPTARG" ;;
         h) usage ;;
         *) usage ;;
     esac
@@ -57,11 +68,35 @@ if ! command -v ffprobe &>/dev/null; then
     exit 1
 fi
 
+# The AVIF and WebP card thumbnails need these encoders; without one the
+# cards are written in the other formats (profiles.py leaves it out)
+ffmpeg_encoders=$(ffmpeg -hide_banner -encoders 2>/dev/null)
+for encoder in libaom-av1 libwebp; do
+    if ! grep -qw -- "$encoder" <<<"$ffmpeg_encoders"; then
+        echo "WARNING: ffmpeg lacks the $encoder encoder; the card thumbnails are written without it."
+    fi
+done
+
 if ! command -v jq &>/dev/null; then
     echo "ERROR: jq not found in PATH. Install jq for JSON manipulation."
     exit 1
 fi
 
+if ! command -v python3 &>/dev/null; then
+    echo "ERROR: python3 not found in PATH. It builds the ffmpeg commands from profiles.json."
+    exit 1
+fi
+
+# Check the registry and the profile once, before any encode
+profile_args=()
+if [[ -n "$PROFILE" ]]; then
+    profile_args=(-p "$PROFILE")
+fi
+if ! python3 "$SCRIPT_DIR/profiles.py" show ${PROFILE:+"$PROFILE"} >/dev/null; then
+    echo "ERROR: Could not load profile '${PROFILE:-default}' from $SCRIPT_DIR/profiles.json"
+    exit 1
+fi
+
 if [[ ! -d "$INPUT_DIR" ]]; then
     echo "ERROR: Input directory not found: $INPUT_DIR"
     exit 1
@@ -99,6 +134,7 @@ echo "=== Flyin' Iris HLS Transcoder ==="
 echo "Input:  $INPUT_DIR"
 echo "Output: $OUTPUT_DIR"
 echo "Config: $CONFIG_FILE"
+echo "Profile: ${PROFILE:-default}"
 echo "Found ${#mp4_files[@]} MP4 file(s)"
 echo ""
 
@@ -136,62 +172,44 @@ for mp4_path in "${mp4_files[@]}"; do
     seconds=$((total_seconds % 60))
     duration_formatted="$(printf "%d:%02d" "$minutes" "$seconds")"
 
-    # --- Create output directories ---
-    mkdir -p "$video_out_dir/1080p" "$video_out_dir/720p" "$video_out_dir/480p"
-
-    # --- Transcode to HLS (single-pass, 3 qualities) ---
-    if ! ffmpeg -i "$mp4_path" \
-        -filter_complex "[0:v]split=3[v1][v2][v3];[v1]scale=1920:1080:force_original_aspect_ratio=decrease,pad=1920:1080:(ow-iw)/2:(oh-ih)/2[v1out];[v2]scale=1280:720:force_original_aspect_ratio=decrease,pad=1280:720:(ow-iw)/2:(oh-ih)/2[v2out];[v3]scale=854:480:force_original_aspect_ratio=decrease,pad=854:480:(ow-iw)/2:(oh-ih)/2[v3out]" \
-        -map "[v1out]" -map "0:a?" \
-        -c:v:0 libx264 -b:v:0 5000k -c:a:0 aac -b:a:0 128k \
-        -preset medium -g 48 -keyint_min 48 \
-        -hls_time 4 -hls_segment_type mpegts \
-        -hls_segment_filename "$video_out_dir/1080p/segment%03d.ts" \
-        -hls_playlist_type vod \
-        "$video_out_dir/1080p/playlist.m3u8" \
-        -map "[v2out]" -map "0:a?" \
-        -c:v:1 libx264 -b:v:1 2500k -c:a:1 aac -b:a:1 128k \
-        -preset medium -g 48 -keyint_min 48 \
-        -hls_time 4 -hls_segment_type mpegts \
-        -hls_segment_filename "$video_out_dir/720p/segment%03d.ts" \
-        -hls_playlist_type vod \
-        "$video_out_dir/720p/playlist.m3u8" \
-        -map "[v3out]" -map "0:a?" \
-        -c:v:2 libx264 -b:v:2 1000k -c:a:2 aac -b:a:2 128k \
-        -preset medium -g 48 -keyint_min 48 \
-        -hls_time 4 -hls_segment_type mpegts \
-        -hls_segment_filename "$video_out_dir/480p/segment%03d.ts" \
-        -hls_playlist_type vod \
-        "$video_out_dir/480p/playlist.m3u8" \
-        -y 2>"$video_out_dir/ffmpeg.log"; then
+    # --- Transcode to HLS (single decode, every rung the source fills) ---
+    # profiles.py plans the command for this source: the profile's ladder
+    # without the rungs above the source's resolution, codec flags and
+    # packaging, with keyframes and segments in whole frames at the
+    # source's frame rate.
+    if ! ffmpeg_cmd="$(python3 "$SCRIPT_DIR/profiles.py" command ${profile_args[@]+"${profile_args[@]}"} --format sh --mkdir \
+            "$mp4_path" "$video_out_dir")"; then
+        echo " FAILED (could not plan the encode)"
+        fail_count=$((fail_count + 1))
+        continue
+    fi
+    eval "ffmpeg_argv=($ffmpeg_cmd)"
+    if ! "${ffmpeg_argv[@]}" >/dev/null 2>"$video_out_dir/ffmpeg.log"; then
         echo " FAILED (ffmpeg error)"
         echo "  Check log: $video_out_dir/ffmpeg.log"
         fail_count=$((fail_count + 1))
         continue
     fi
 
-    # --- Generate master.m3u8 ---
-    cat > "$video_out_dir/master.m3u8" <<'MASTER'
-#EXTM3U
-#EXT-X-VERSION:3
-#EXT-X-STREAM-INF:BANDWIDTH=5128000,RESOLUTION=1920x1080,NAME="1080p"
-1080p/playlist.m3u8
-#EXT-X-STREAM-INF:BANDWIDTH=2628000,RESOLUTION=1280x720,NAME="720p"
-720p/playlist.m3u8
-#EXT-X-STREAM-INF:BANDWIDTH=1128000,RESOLUTION=854x480,NAME="480p"
-480p/playlist.m3u8
-MASTER
-
-    # --- Generate thumbnail (frame at 25% duration) ---
-    thumb_time="$(echo "$duration_sec * 0.25" | bc -l 2>/dev/null || echo "$(( total_seconds / 4 ))")"
-    thumb_path="$OUTPUT_DIR/thumbs/$video_id.jpg"
-    if ! ffmpeg -ss "$thumb_time" -i "$mp4_path" \
-        -frames:v 1 \
-        -vf "scale=1280:720:force_original_aspect_ratio=decrease,pad=1280:720:(ow-iw)/2:(oh-ih)/2" \
-        -q:v 2 \
-        "$thumb_path" \
-        -y 2>/dev/null; then
-        printf " (thumbnail failed)"
+    # --- Generate master.m3u8 (nominal; measured at the end) ---
+    python3 "$SCRIPT_DIR/profiles.py" master ${profile_args[@]+"${profile_args[@]}"} "$mp4_path" > "$video_out_dir/master.m3u8"
+
+    # --- Derivatives (poster, card thumbs, sprite sheets, preview frames) ---
+    # One decode of the source feeds every still through one filter graph,
+    # instead of one seek-and-decode per still.
+    derivatives_started=$SECONDS
+    derivatives_note=""
+    if derivatives_cmd="$(python3 "$SCRIPT_DIR/profiles.py" derivatives --format sh --mkdir \
+            "$mp4_path" "$OUTPUT_DIR")"; then
+        eval "derivatives_argv=($derivatives_cmd)"
+        if "${derivatives_argv[@]}" >/dev/null 2>"$video_out_dir/thumb.log"; then
+            derivatives_note=", stills in $((SECONDS - derivatives_started))s"
+            rm -f "$video_out_dir/thumb.log"
+        else
+            printf " (thumbnails failed, see %s)" "$video_out_dir/thumb.log"
+        fi
+    else
+        printf " (thumbnails failed)"
     fi
 
     # --- Update config JSON duration ---
@@ -201,7 +219,7 @@ MASTER
         "$config_tmp" > "$config_tmp_new"
     mv "$config_tmp_new" "$config_tmp"
 
-    echo " done ($duration_formatted)"
+    echo " done ($duration_formatted$derivatives_note)"
 
     # Clean up log on success
     rm -f "$video_out_dir/ffmpeg.log"
@@ -211,6 +229,20 @@ done
 cp "$config_tmp" "$CONFIG_FILE"
 rm -f "$config_tmp"
 
+# --- Measure master playlists ---
+# The master.m3u8 files above have nominal bandwidths and no CODECS;
+# playlists.py rewrites them with values measured from the segments.
+if ! python3 "$SCRIPT_DIR/playlists.py" -o "$OUTPUT_DIR" >/dev/null; then
+    echo "WARNING: Could not measure master playlists; they keep nominal bandwidths."
+fi
+
+# --- Card atlas ---
+# Every film's card thumbnail in one image for the collection grid,
+# recorded in the config for generate.py
+if ! python3 "$SCRIPT_DIR/atlas.py" -o "$OUTPUT_DIR" -c "$CONFIG_FILE" >/dev/null; then
+    echo "WARNING: Could not build the card atlas; the page loads each film's card thumbnail."
+fi
+
 # --- Summary ---
 echo ""
 echo "=== Transcode Complete ==="
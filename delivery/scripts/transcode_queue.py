@@ -0,0 +1,619 @@
+#!/usr/bin/env python3
+"""
+Flyin' Iris — Distributed Transcode Queue
+
+Spreads transcode.py's jobs (HLS encodes, chunks of long films, thumbnails)
+over several machines through a shared SQLite broker. One machine submits
+a couple's films; workers on any box that can see the broker, the sources
+and the output folder claim jobs one at a time and run them.
+
+Every claimed job holds a lease that its worker renews with heartbeats
+while ffmpeg runs. If a worker dies (or loses the network share), its
+lease expires and the job goes back on the queue for the next worker;
+a worker that finds its lease taken over kills its ffmpeg and moves on.
+Failed jobs are retried up to --retries times, on whichever worker claims
+them next.
+
+Paths are stored as given, so the broker, the sources and the output
+folder must be mounted at the same path on every machine (e.g. a studio
+share at /mnt/studio). The output layout is transcode.py's, and submit
+records finished jobs in the same journal and updates the config's
+durations, so upload.py and pipeline.py work on the result as usual.
+
+Usage:
+    python transcode_queue.py submit -i /mnt/studio/exports/amanda-boris -c amanda-boris.json \\
+        -o /mnt/studio/output/amanda-boris --broker /mnt/studio/queue.sqlite3
+    python transcode_queue.py work --broker /mnt/studio/queue.sqlite3
+    python transcode_queue.py status --broker /mnt/studio/queue.sqlite3
+
+    # Everything on one machine, with three local worker processes:
+    python transcode_queue.py submit -i ./exports/amanda-boris -c amanda-boris.json \\
+        --broker ./queue.sqlite3 --local-workers 3
+"""
+
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+import fingerprint
+import transcode
+
+LEASE_SECONDS = 60
+POLL_SECONDS = 5
+
+STATES = ("queued", "running", "done", "failed")
+
+
+def default_broker_path(output_dir):
+    return os.path.join(output_dir, ".transcode-queue.sqlite3")
+
+
+def encode_chunk(job):
+    """Return job.chunk as JSON-able lists (a Chunk, a list of them, or None)."""
+    if job.chunk is None:
+        return None
+    if job.kind == "chunk":
+        return list(job.chunk)
+    return [list(chunk) for chunk in job.chunk]
+
+
+def decode_chunk(kind, data):
+    if data is None:
+        return None
+    if kind == "chunk":
+        return transcode.Chunk(*data)
+    return [transcode.Chunk(*chunk) for chunk in data]
+
+
+def job_dependencies(jobs):
+    """Return {job key: [keys it must wait for]} for the jobs being queued.
+
+    A chunked film's chunks wait for its audio slices (not for a shared
+    audio rendition, which they do not use), and the film (the stitch)
+    waits for its audio job and every chunk.
+    """
+    after = {}
+    for job in jobs:
+        audio = [other for other in jobs if other.kind == "audio" and other.video_id == job.video_id]
+        if job.kind == "chunk":
+            after[job.key] = [other.key for other in audio if other.chunk]
+        elif job.kind == "hls" and job.chunk:
+            after[job.key] = [other.key for other in audio] + [
+                other.key for other in jobs if other.kind == "chunk" and other.video_id == job.video_id]
+        else:
+            after[job.key] = []
+    return after
+
+
+class Broker:
+    """Job queue in a SQLite file shared by the submitter and all workers.
+
+    Every state change runs in its own IMMEDIATE transaction, so workers
+    on several machines can claim jobs concurrently without two of them
+    getting the same one. The default rollback journal is kept (WAL does
+    not work over network shares). One connection, shared by the threads
+    of one process under a lock.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.transaction():
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id INTEGER PRIMARY KEY, output_dir TEXT NOT NULL, key TEXT NOT NULL,"
+                " video_id TEXT NOT NULL, kind TEXT NOT NULL, argv TEXT, log_path TEXT NOT NULL,"
+                " duration REAL, outputs TEXT NOT NULL, chunk TEXT, ladder TEXT, after TEXT NOT NULL,"
+                " rank INTEGER NOT NULL, state TEXT NOT NULL, worker TEXT, lease_expires REAL,"
+                " attempts INTEGER NOT NULL DEFAULT 0, max_attempts INTEGER NOT NULL,"
+                " error TEXT, checksums TEXT, enqueued REAL NOT NULL, finished REAL,"
+                " UNIQUE (output_dir, key))"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS workers ("
+                " worker TEXT PRIMARY KEY, started REAL NOT NULL, heartbeat REAL NOT NULL,"
+                " job_id INTEGER, jobs_done INTEGER NOT NULL DEFAULT 0)"
+            )
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def transaction(self):
+        return _Transaction(self)
+
+    # --- submitting ---
+
+    def enqueue(self, jobs, output_dir, retries=2):
+        """Add jobs to the queue and return their row IDs.
+
+        A job already queued or running is left alone. One that failed,
+        or finished but whose outputs are gone, is queued again. A chunked
+        film's audio and chunk jobs are left out once the film's own job is
+        done with its outputs on disk (its chunks were removed after
+        stitching, so they would never look complete).
+        """
+        after = job_dependencies(jobs)
+        ids = []
+        now = time.time()
+        with self.transaction():
+            films_done = set()
+            for job in jobs:
+                if job.kind != "hls":
+                    continue
+                row = self.conn.execute("SELECT state FROM jobs WHERE output_dir = ? AND key = ?",
+                                        (output_dir, job.key)).fetchone()
+                if row is not None and row["state"] == "done" and transcode.outputs_complete(job, output_dir):
+                    films_done.add(job.video_id)
+            for job in jobs:
+                if job.kind in ("audio", "chunk") and job.video_id in films_done:
+                    continue
+                row = self.conn.execute("SELECT id, state FROM jobs WHERE output_dir = ? AND key = ?",
+                                        (output_dir, job.key)).fetchone()
+                if row is None:
+                    cursor = self.conn.execute(
+                        "INSERT INTO jobs (output_dir, key, video_id, kind, argv, log_path, duration,"
+                        " outputs, chunk, ladder, after, rank, state, max_attempts, enqueued)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'queued', ?, ?)",
+                        (output_dir, job.key, job.video_id, job.kind, json.dumps(job.argv), job.log_path,
+                         job.duration, json.dumps(job.outputs), json.dumps(encode_chunk(job)),
+                         json.dumps([list(rung) for rung in job.ladder] if job.ladder else None),
+                         json.dumps(after[job.key]), transcode.JOB_ORDER[job.kind], retries + 1, now),
+                    )
+                    ids.append(cursor.lastrowid)
+                    continue
+                ids.append(row["id"])
+                if row["state"] == "failed" or (row["state"] == "done"
+                                                and not transcode.outputs_complete(job, output_dir)):
+                    self.conn.execute(
+                        "UPDATE jobs SET state = 'queued', worker = NULL, lease_expires = NULL,"
+                        " attempts = 0, max_attempts = ?, error = NULL, checksums = NULL, finished = NULL"
+                        " WHERE id = ?", (retries + 1, row["id"]))
+        return ids
+
+    def jobs(self, ids=None):
+        """Return rows for the given job IDs (all jobs if None)."""
+        with self.lock:
+            rows = self.conn.execute("SELECT * FROM jobs ORDER BY id").fetchall()
+        if ids is not None:
+            wanted = set(ids)
+            rows = [row for row in rows if row["id"] in wanted]
+        return rows
+
+    def workers(self):
+        with self.lock:
+            return self.conn.execute("SELECT * FROM workers ORDER BY worker").fetchall()
+
+    def clear(self, states=("done", "failed")):
+        """Delete finished jobs; returns how many were removed."""
+        with self.transaction():
+            placeholders = ",".join("?" * len(states))
+            return self.conn.execute(f"DELETE FROM jobs WHERE state IN ({placeholders})", states).rowcount
+
+    # --- working ---
+
+    def register(self, worker):
+        now = time.time()
+        with self.transaction():
+            self.conn.execute("INSERT OR REPLACE INTO workers (worker, started, heartbeat) VALUES (?, ?, ?)",
+                              (worker, now, now))
+
+    def unregister(self, worker):
+        with self.transaction():
+            self.conn.execute("DELETE FROM workers WHERE worker = ?", (worker,))
+
+    def claim(self, worker, lease=LEASE_SECONDS):
+        """Lease the most urgent runnable job to worker; returns its row or None.
+
+        Jobs whose lease has expired are requeued (or failed, once out of
+        attempts) first. A job is runnable once every job it waits for is
+        done; a job whose dependency failed fails too.
+        """
+        now = time.time()
+        with self.transaction():
+            self._expire(now)
+            rows = self.conn.execute(
+                "SELECT * FROM jobs WHERE state = 'queued' ORDER BY rank, duration DESC, id").fetchall()
+            for row in rows:
+                after = json.loads(row["after"])
+                if after:
+                    placeholders = ",".join("?" * len(after))
+                    states = [r[0] for r in self.conn.execute(
+                        f"SELECT state FROM jobs WHERE output_dir = ? AND key IN ({placeholders})",
+                        [row["output_dir"]] + after)]
+                    if "failed" in states:
+                        self.conn.execute(
+                            "UPDATE jobs SET state = 'failed', error = ?, finished = ? WHERE id = ?",
+                            ("a job it depends on failed", now, row["id"]))
+                        continue
+                    if len(states) < len(after) or any(state != "done" for state in states):
+                        continue
+                self.conn.execute(
+                    "UPDATE jobs SET state = 'running', worker = ?, lease_expires = ?,"
+                    " attempts = attempts + 1 WHERE id = ?", (worker, now + lease, row["id"]))
+                self.conn.execute("UPDATE workers SET heartbeat = ?, job_id = ? WHERE worker = ?",
+                                  (now, row["id"], worker))
+                return self.conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+            self.conn.execute("UPDATE workers SET heartbeat = ?, job_id = NULL WHERE worker = ?",
+                              (now, worker))
+        return None
+
+    def _expire(self, now):
+        # Workers are never silent for a whole lease while alive
+        self.conn.execute("DELETE FROM workers WHERE heartbeat < ?", (now - 2 * LEASE_SECONDS,))
+        for row in self.conn.execute(
+                "SELECT id, worker, attempts, max_attempts FROM jobs"
+                " WHERE state = 'running' AND lease_expires < ?", (now,)).fetchall():
+            error = f"worker {row['worker']} stopped responding"
+            if row["attempts"] >= row["max_attempts"]:
+                self.conn.execute("UPDATE jobs SET state = 'failed', error = ?, finished = ? WHERE id = ?",
+                                  (error, now, row["id"]))
+            else:
+                self.conn.execute("UPDATE jobs SET state = 'queued', worker = NULL, lease_expires = NULL,"
+                                  " error = ? WHERE id = ?", (error, row["id"]))
+
+    def heartbeat(self, worker, job_id, lease=LEASE_SECONDS):
+        """Renew worker's lease on a job; returns False if the job is no longer its own."""
+        now = time.time()
+        with self.transaction():
+            self.conn.execute("UPDATE workers SET heartbeat = ? WHERE worker = ?", (now, worker))
+            return self.conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND state = 'running' AND worker = ?",
+                (now + lease, job_id, worker)).rowcount == 1
+
+    def complete(self, worker, job_id, checksums):
+        """Mark a job done; returns False if the lease was lost meanwhile."""
+        now = time.time()
+        with self.transaction():
+            self.conn.execute("UPDATE workers SET heartbeat = ?, job_id = NULL, jobs_done = jobs_done + 1"
+                              " WHERE worker = ?", (now, worker))
+            return self.conn.execute(
+                "UPDATE jobs SET state = 'done', lease_expires = NULL, error = NULL, checksums = ?,"
+                " finished = ? WHERE id = ? AND state = 'running' AND worker = ?",
+                (json.dumps(checksums), now, job_id, worker)).rowcount == 1
+
+    def fail(self, worker, job_id, error):
+        """Requeue a failed job, or fail it for good once out of attempts."""
+        now = time.time()
+        with self.transaction():
+            self.conn.execute("UPDATE workers SET heartbeat = ?, job_id = NULL WHERE worker = ?", (now, worker))
+            self.conn.execute(
+                "UPDATE jobs SET state = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,"
+                " worker = NULL, lease_expires = NULL, error = ?,"
+                " finished = CASE WHEN attempts >= max_attempts THEN ? END"
+                " WHERE id = ? AND state = 'running' AND worker = ?", (error, now, job_id, worker))
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT (ROLLBACK on error) under the broker lock."""
+
+    def __init__(self, broker):
+        self.broker = broker
+
+    def __enter__(self):
+        self.broker.lock.acquire()
+        try:
+            self.broker.conn.execute("BEGIN IMMEDIATE")
+        except BaseException:
+            self.broker.lock.release()
+            raise
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.broker.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.broker.lock.release()
+
+
+def row_job(row):
+    """Rebuild the transcode.Job a queue row describes."""
+    ladder = json.loads(row["ladder"])
+    return transcode.Job(
+        row["video_id"], row["kind"], json.loads(row["argv"]), row["log_path"], row["duration"],
+        row["key"], json.loads(row["outputs"]), decode_chunk(row["kind"], json.loads(row["chunk"])),
+        tuple(transcode.Rung(*rung) for rung in ladder) if ladder else None,
+    )
+
+
+def run_claimed(broker, worker, row, reporter, lease=LEASE_SECONDS):
+    """Run one claimed job, heartbeating its lease, and report the outcome."""
+    job = row_job(row)
+    output_dir = row["output_dir"]
+    proc = []
+    lost = threading.Event()
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(lease / 3):
+            try:
+                still_ours = broker.heartbeat(worker, row["id"], lease)
+            except sqlite3.Error as e:
+                reporter.message(f"Warning: Heartbeat failed ({e})")
+                continue
+            if not still_ours:
+                lost.set()
+                if proc:
+                    proc[0].terminate()
+                return
+
+    heart = threading.Thread(target=beat, daemon=True)
+    heart.start()
+    try:
+        transcode.prepare_job(job, output_dir)
+        if job.argv:
+            code = transcode.run_ffmpeg(job, reporter, on_spawn=proc.append)
+            if code != 0:
+                raise transcode.TranscodeError(f"ffmpeg exit code {code} (log: {job.log_path})")
+        checksums = transcode.finish_job(job, output_dir)
+    except (transcode.TranscodeError, OSError) as e:
+        stop.set()
+        if lost.is_set():
+            reporter.message(f"  {job.video_id:<28} {transcode.job_label(job):<5} lease lost, abandoned")
+        else:
+            broker.fail(worker, row["id"], f"{e} [{worker}]")
+            reporter.message(f"  {job.video_id:<28} {transcode.job_label(job):<5} failed: {e}")
+        return False
+    finally:
+        stop.set()
+        heart.join()
+    if not broker.complete(worker, row["id"], checksums):
+        reporter.message(f"  {job.video_id:<28} {transcode.job_label(job):<5} finished after its lease "
+                         "was lost; result discarded")
+        return False
+    return True
+
+
+def work(broker_path, exit_when_idle=False, lease=LEASE_SECONDS, poll=POLL_SECONDS):
+    """Claim and run jobs until interrupted (or, if exit_when_idle, the queue is empty)."""
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    reporter = transcode.ProgressReporter()
+    done = 0
+    with Broker(broker_path) as broker:
+        broker.register(worker)
+        print(f"Worker {worker} polling {os.path.abspath(broker_path)}")
+        try:
+            while True:
+                row = broker.claim(worker, lease)
+                if row is None:
+                    if exit_when_idle and not any(r["state"] in ("queued", "running") for r in broker.jobs()):
+                        break
+                    time.sleep(poll)
+                    continue
+                done += run_claimed(broker, worker, row, reporter, lease)
+        except KeyboardInterrupt:
+            print(f"\nWorker {worker} interrupted; its job will be requeued when the lease expires")
+        finally:
+            broker.unregister(worker)
+    print(f"Worker {worker} finished {done} job(s)")
+
+
+def wait_for(broker, ids, poll=POLL_SECONDS):
+    """Print progress until none of the given jobs is queued or running; returns their rows."""
+    last = None
+    while True:
+        rows = broker.jobs(ids)
+        counts = {state: sum(row["state"] == state for row in rows) for state in STATES}
+        line = "  ".join(f"{state} {counts[state]}" for state in STATES)
+        if line != last:
+            print(f"  [{time.strftime('%H:%M:%S')}] {line}")
+            last = line
+        if not counts["queued"] and not counts["running"]:
+            return rows
+        time.sleep(poll)
+
+
+def sync_journal(journal, rows):
+    """Record finished HLS and thumbnail jobs in the transcode journal."""
+    for row in rows:
+        if row["state"] != "done" or row["kind"] not in ("hls", "thumb"):
+            continue
+        job = row_job(row)
+        journal.mark_done(job, json.loads(row["checksums"] or "{}"))
+        if job.chunk:
+            journal.drop(job.video_id, ("audio", "chunk"))
+
+
+def pending_jobs(jobs, journal, output_dir):
+    """Return the jobs the journal does not already record as done.
+
+    A chunked film's audio and chunk jobs are left out once the film itself
+    is done (its chunks were removed after stitching).
+    """
+    done = {job.key for job in jobs if job.kind in ("hls", "thumb") and journal.is_done(job, output_dir)}
+    films_done = {job.video_id for job in jobs if job.kind == "hls" and job.key in done}
+    return [job for job in jobs if job.key not in done
+            and not (job.kind in ("audio", "chunk") and job.video_id in films_done)]
+
+
+def submit(args):
+    transcode.check_tools()
+    if not os.path.isdir(args.input_dir):
+        print(f"Error: Input directory not found: {args.input_dir}", file=sys.stderr)
+        sys.exit(1)
+    try:
+        with open(args.config, "r", encoding="utf-8") as f:
+            json.load(f)
+    except FileNotFoundError:
+        print(f"Error: Config file not found: {args.config}", file=sys.stderr)
+        sys.exit(1)
+    except json.JSONDecodeError as e:
+        print(f"Error: Config file is not valid JSON: {e}", file=sys.stderr)
+        sys.exit(1)
+    sources = [os.path.abspath(src) for src in transcode.discover_sources(args.input_dir)]
+    if not sources:
+        print(f"Error: No MP4 files found in {args.input_dir}", file=sys.stderr)
+        sys.exit(1)
+
+    output_dir = os.path.abspath(args.output_dir)
+    broker_path = os.path.abspath(args.broker or default_broker_path(output_dir))
+    os.makedirs(os.path.join(output_dir, "thumbs"), exist_ok=True)
+    journal = transcode.Journal(args.journal or os.path.join(output_dir, transcode.JOURNAL_NAME))
+    if args.force:
+        journal.entries = {}
+
+    print("\n=== Flyin' Iris Transcode Queue ===")
+    print(f"Input:   {os.path.abspath(args.input_dir)}")
+    print(f"Output:  {output_dir}")
+    print(f"Broker:  {broker_path}")
+
+    started = time.perf_counter()
+    with fingerprint.FingerprintIndex(args.fingerprint_db) as index:
+        # threads=0: each worker runs one job at a time, so ffmpeg may use every core
+        durations, jobs, failures = transcode.plan_jobs(sources, output_dir, 0, index, args.chunk_seconds,
+                                                        args.fixed_ladder,
+                                                        transcode.packaging_from_args(args),
+                                                        transcode.profile_from_args(args))
+    pending = pending_jobs(jobs, journal, output_dir)
+    with Broker(broker_path) as broker:
+        ids = broker.enqueue(pending, output_dir, args.retries)
+        print(f"Queued {len(ids)} job(s) for {len(sources)} MP4 file(s); "
+              f"{len(jobs) - len(pending)} already done\n")
+        if args.no_wait:
+            print(f"Start workers with: python {os.path.basename(__file__)} work --broker {broker_path}")
+            return
+
+        local = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "work", "--broker", broker_path,
+                                   "--exit-when-idle"]) for _ in range(args.local_workers)]
+        try:
+            rows = wait_for(broker, ids)
+        finally:
+            for proc in local:
+                proc.wait()
+        sync_journal(journal, rows)
+
+    for row in rows:
+        if row["state"] == "failed":
+            if row["kind"] == "thumb":
+                print(f"Warning: {row['video_id']} thumbnail failed ({row['error']})", file=sys.stderr)
+            else:
+                failures.setdefault(row["video_id"], row["error"])
+    done = {video_id: transcode.format_duration(seconds) for video_id, seconds in durations.items()
+            if video_id not in failures}
+    unmatched = transcode.update_config_durations(args.config, done)
+    atlas = transcode.refresh_card_atlas(output_dir, args.config, journal)
+
+    print("\n=== Transcode Complete ===")
+    for video_id in sorted(done):
+        note = "  (no matching config entry)" if video_id in unmatched else ""
+        print(f"  done    {video_id:<28} {done[video_id]:>6}{note}")
+    for video_id in sorted(failures):
+        print(f"  FAILED  {video_id:<28} {failures[video_id]}", file=sys.stderr)
+    workers = {row["worker"] for row in rows if row["state"] == "done" and row["worker"]}
+    print(f"\nProcessed: {len(sources)} video(s) in {time.perf_counter() - started:.1f}s"
+          + (f" on {len(workers)} worker(s)" if workers else ""))
+    if failures:
+        print(f"Failed:    {len(failures)} video(s)")
+    print(f"Output:    {output_dir}")
+    print(f"Config updated: {args.config}")
+    transcode.print_ladder_report(journal, done)
+    transcode.print_audio_report(journal, done)
+    transcode.print_derivative_report(journal, done)
+    transcode.print_card_atlas(output_dir, atlas)
+    if failures:
+        sys.exit(1)
+
+
+def status(args):
+    if not os.path.exists(args.broker):
+        print(f"Error: Broker not found: {args.broker}", file=sys.stderr)
+        sys.exit(1)
+    with Broker(args.broker) as broker:
+        if args.clear:
+            print(f"Removed {broker.clear()} finished job(s)")
+            return
+        rows = broker.jobs()
+        now = time.time()
+        print(f"\n=== Queue: {os.path.abspath(args.broker)} ===")
+        for state in STATES:
+            print(f"  {state:<8} {sum(row['state'] == state for row in rows)}")
+        running = [row for row in rows if row["state"] == "running"]
+        if running:
+            print("\nRunning:")
+            for row in running:
+                print(f"  {row['video_id']:<28} {transcode.job_label(row_job(row)):<5} on {row['worker']} "
+                      f"(attempt {row['attempts']}/{row['max_attempts']}, "
+                      f"lease {row['lease_expires'] - now:+.0f}s)")
+        failed = [row for row in rows if row["state"] == "failed"]
+        if failed:
+            print("\nFailed:")
+            for row in failed:
+                print(f"  {row['video_id']:<28} {transcode.job_label(row_job(row)):<5} {row['error']}")
+        workers = broker.workers()
+        print("\nWorkers:")
+        for worker in workers:
+            print(f"  {worker['worker']:<32} last seen {now - worker['heartbeat']:.0f}s ago, "
+                  f"{worker['jobs_done']} job(s) done")
+        if not workers:
+            print("  (none)")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Distribute transcode jobs over several machines through a shared SQLite queue."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    submit_parser = commands.add_parser("submit", help="Queue a folder of MP4s and wait for the workers")
+    submit_parser.add_argument("-i", "--input-dir", required=True, help="Directory containing source MP4 files")
+    submit_parser.add_argument("-c", "--config", required=True,
+                               help="Path to the couple config JSON (durations are written back)")
+    submit_parser.add_argument("-o", "--output-dir", default="./output",
+                               help="Output directory for HLS files (default: ./output)")
+    submit_parser.add_argument("--broker",
+                               help="Queue database on storage every worker can reach "
+                                    "(default: <output-dir>/.transcode-queue.sqlite3)")
+    submit_parser.add_argument("--retries", type=int, default=2,
+                               help="Retries per failed job, on any worker (default: 2)")
+    submit_parser.add_argument("--journal",
+                               help=f"Checkpoint journal path (default: <output-dir>/{transcode.JOURNAL_NAME})")
+    submit_parser.add_argument("--force", action="store_true",
+                               help="Ignore the journal and transcode everything again")
+    submit_parser.add_argument("--fingerprint-db",
+                               help=f"Source fingerprint index (default: {fingerprint.default_db_path()})")
+    submit_parser.add_argument("--chunk-seconds", type=float, default=0,
+                               help="Split films at least twice this long into chunks any worker can take "
+                                    "(default: off)")
+    submit_parser.add_argument("--fixed-ladder", action="store_true",
+                               help="Encode every film at the profile's fixed ladder")
+    transcode.add_packaging_arguments(submit_parser)
+    submit_parser.add_argument("--local-workers", type=int, default=0,
+                               help="Also start this many worker processes on this machine")
+    submit_parser.add_argument("--no-wait", action="store_true",
+                               help="Queue the jobs and exit (run submit again later to collect results)")
+
+    work_parser = commands.add_parser("work", help="Run jobs from the queue")
+    work_parser.add_argument("--broker", required=True, help="Queue database")
+    work_parser.add_argument("--exit-when-idle", action="store_true",
+                             help="Exit once nothing is queued or running instead of waiting for more")
+    work_parser.add_argument("--lease", type=float, default=LEASE_SECONDS,
+                             help=f"Seconds a job stays claimed without a heartbeat (default: {LEASE_SECONDS})")
+
+    status_parser = commands.add_parser("status", help="Show queued, running and failed jobs and workers")
+    status_parser.add_argument("--broker", required=True, help="Queue database")
+    status_parser.add_argument("--clear", action="store_true", help="Remove done and failed jobs")
+
+    args = parser.parse_args()
+    if args.command == "submit":
+        submit(args)
+    elif args.command == "work":
+        transcode.check_tools()
+        work(args.broker, args.exit_when_idle, args.lease)
+    else:
+        status(args)
+
+
+if __name__ == "__main__":
+    main()
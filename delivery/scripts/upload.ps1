@@ -69,7 +69,7 @@ $hasErrors = $false
 # --- Upload HLS (exclude thumbs) ---
 Write-Host "[1/3] Uploading HLS files..." -ForegroundColor Yellow
 try {
-    & rclone sync "$OutputDir" "$baseRemote/hls/" --exclude "thumbs/**" --progress
+    & rclone sync "$OutputDir" "$baseRemote/hls/" --exclude "thumbs/**" --exclude ".transcode-journal.json*" --exclude ".upload-manifest.json*" --exclude ".chunks/**" --exclude ".transcode-queue.sqlite3*" --progress
     if ($LASTEXITCODE -ne 0) { throw "rclone sync HLS failed with exit code $LASTEXITCODE" }
     Write-Host "      HLS upload complete." -ForegroundColor Green
 } catch {
@@ -111,7 +111,7 @@ Write-Host "Verifying uploads..." -ForegroundColor Yellow
 $verifyFailed = $false
 
 Write-Host "  Checking HLS..."
-& rclone check "$OutputDir" "$baseRemote/hls/" --exclude "thumbs/**" 2>&1 | ForEach-Object {
+& rclone check "$OutputDir" "$baseRemote/hls/" --exclude "thumbs/**" --exclude ".transcode-journal.json*" --exclude ".upload-manifest.json*" --exclude ".chunks/**" --exclude ".transcode-queue.sqlite3*" 2>&1 | ForEach-Object {
     if ($_ -match "ERROR") { $verifyFailed = $true }
     Write-Host "    $_"
 }
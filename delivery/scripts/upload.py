@@ -0,0 +1,522 @@
+#!/usr/bin/env python3
+"""
+Flyin' Iris — R2 Uploader
+
+Uploads a couple's HLS output, original MP4s and thumbnails to R2 under the
+same couples/{slug}/{hls,originals,thumbs}/ layout as upload.sh, using a
+pool of concurrent keep-alive connections instead of three serial
+rclone syncs. Large originals go up as parallel multipart uploads, failed
+requests are retried with exponential backoff, and integrity is checked
+against the checksums recorded when the files were produced rather than by
+re-reading everything afterwards:
+
+    - HLS segments, playlists and thumbnails: SHA-256s from the transcode
+      journal are sent as x-amz-content-sha256, so R2 rejects any body that
+      no longer matches what transcode.py wrote.
+    - Originals: the running SHA-256 of the parts is compared against the
+      fingerprint index before the multipart upload is completed.
+
+Files with no recorded checksum are still hashed as they are sent, so the
+transfer itself is always verified; they are reported as unrecorded.
+
+Before anything is sent, the HLS output is checked with hls_check.py
+(playlists, segment durations, keyframe alignment across rungs); an
+output directory with errors is not uploaded unless --no-check is given.
+
+What was uploaded is recorded in a per-couple manifest in the output
+directory (see upload_manifest.py). Later runs only PUT files that are new
+or changed since, and DELETE remote objects whose local file is gone,
+without listing or re-checking the bucket.
+
+Credentials come from R2_ENDPOINT, R2_ACCESS_KEY_ID and R2_SECRET_ACCESS_KEY
+(AWS_* names also work). Point --endpoint at s3stub.py to test offline.
+
+Usage:
+    python upload.py -s amanda-boris -o ./output -r ./exports/amanda-boris
+    python upload.py -s amanda-boris -o ./output -r ./exports/amanda-boris --workers 32
+    python upload.py -s amanda-boris -o ./output --dry-run
+    python upload.py -s amanda-boris -o ./output -r ./exports/amanda-boris --endpoint http://127.0.0.1:9000
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import hashlib
+import os
+import random
+import sys
+import threading
+import time
+
+import fingerprint
+import hls_check
+import transcode
+import upload_manifest
+from s3client import S3Client, S3Error
+
+CONTENT_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".ts": "video/MP2T",
+    ".m4s": "video/iso.segment",
+    ".mp4": "video/mp4",
+    ".jpg": "image/jpeg",
+    ".vtt": "text/vtt",
+    ".webp": "image/webp",
+    ".avif": "image/avif",
+}
+
+MiB = 1024 * 1024
+MULTIPART_THRESHOLD = 64 * MiB
+PART_SIZE = 16 * MiB  # R2 needs equal parts of at least 5 MiB (last excepted)
+
+# category is "hls", "originals" or "thumbs"; sha256 is the checksum
+# recorded when the file was produced, or None if there is none.
+UploadItem = collections.namedtuple("UploadItem", ["path", "key", "size", "sha256", "category"])
+
+
+class UploadError(Exception):
+    """Raised when a file cannot be uploaded or fails verification."""
+
+
+def content_type(path):
+    return CONTENT_TYPES.get(os.path.splitext(path)[1].lower(), "application/octet-stream")
+
+
+def recorded(checksums, rel, size):
+    """Return the recorded SHA-256 for rel if its size still matches."""
+    entry = checksums.get(rel)
+    if entry and entry[0] == size:
+        return entry[1]
+    return None
+
+
+def collect_items(slug, output_dir, original_dir, checksums, index=None):
+    """List every file to upload with its R2 key and recorded checksum.
+
+    HLS files are everything in output_dir except thumbs/, logs and
+    dotfiles (the transcode journal). thumbs/ holds the posters and each
+    film's folder of derivatives. Originals are the MP4s in
+    original_dir; their checksums come from the fingerprint index.
+    """
+    prefix = f"couples/{slug}"
+    items = []
+    for dirpath, dirnames, filenames in os.walk(output_dir):
+        rel_dir = os.path.relpath(dirpath, output_dir)
+        dirnames[:] = sorted(d for d in dirnames
+                             if not d.startswith(".") and not (rel_dir == "." and d == "thumbs"))
+        for name in sorted(filenames):
+            if name.startswith(".") or name.endswith(".log"):
+                continue
+            path = os.path.join(dirpath, name)
+            rel = os.path.relpath(path, output_dir).replace(os.sep, "/")
+            size = os.path.getsize(path)
+            items.append(UploadItem(path, f"{prefix}/hls/{rel}", size,
+                                    recorded(checksums, rel, size), "hls"))
+
+    thumbs_dir = os.path.join(output_dir, "thumbs")
+    for dirpath, dirnames, filenames in os.walk(thumbs_dir):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for name in sorted(filenames):
+            if name.startswith("."):
+                continue
+            path = os.path.join(dirpath, name)
+            rel = os.path.relpath(path, output_dir).replace(os.sep, "/")
+            size = os.path.getsize(path)
+            items.append(UploadItem(path, f"{prefix}/{rel}", size, recorded(checksums, rel, size), "thumbs"))
+
+    if original_dir:
+        for name in sorted(os.listdir(original_dir)):
+            path = os.path.join(original_dir, name)
+            if not name.lower().endswith(".mp4") or not os.path.isfile(path):
+                continue
+            sha256 = index.lookup(path, "full") if index is not None else None
+            items.append(UploadItem(path, f"{prefix}/originals/{name}", os.path.getsize(path),
+                                    sha256, "originals"))
+    return items
+
+
+def upload_phases(items):
+    """Split items into the order they must reach the bucket in.
+
+    Segments, thumbnails and originals first, then each rung's playlist,
+    then master playlists, so a player never finds a playlist whose
+    segments are not there yet.
+    """
+    phases = ([], [], [])
+    for item in items:
+        name = os.path.basename(item.key)
+        phases[2 if name == "master.m3u8" else 1 if name.endswith(".m3u8") else 0].append(item)
+    return phases
+
+
+class Progress:
+    """Thread-safe upload counters with a throttled one-line status print.
+
+    interval=None disables printing.
+    """
+
+    def __init__(self, total_files, total_bytes, interval=2.0):
+        self.lock = threading.Lock()
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.files = 0
+        self.bytes = 0
+        self.retries = 0
+        self.interval = interval
+        self.started = time.perf_counter()
+        self.last_print = 0.0
+
+    def add_bytes(self, n):
+        with self.lock:
+            self.bytes += n
+            self._maybe_print()
+
+    def file_done(self):
+        with self.lock:
+            self.files += 1
+            self._maybe_print(force=self.files == self.total_files)
+
+    def retried(self):
+        with self.lock:
+            self.retries += 1
+
+    def _maybe_print(self, force=False):
+        if self.interval is None:
+            return
+        now = time.perf_counter()
+        if not force and now - self.last_print < self.interval:
+            return
+        self.last_print = now
+        rate = self.bytes / max(now - self.started, 1e-9) / 1e6
+        print(f"  {self.files}/{self.total_files} files  "
+              f"{self.bytes / 1e9:.2f}/{self.total_bytes / 1e9:.2f} GB  {rate:.1f} MB/s", flush=True)
+
+
+class Uploader:
+    """Uploads files on a thread pool, one pooled connection per thread.
+
+    Multipart parts run on a separate pool so a file worker waiting on its
+    parts never starves them. One semaphore, shared by every multipart
+    upload, caps the parts read into memory and not yet sent at workers + 2
+    for the whole run, however many large files are in flight.
+    """
+
+    def __init__(self, client, workers=16, retries=5, part_size=PART_SIZE,
+                 multipart_threshold=MULTIPART_THRESHOLD, backoff=0.5, progress_interval=2.0):
+        self.client = client
+        self.workers = workers
+        self.retries = retries
+        self.part_size = part_size
+        self.multipart_threshold = multipart_threshold
+        self.backoff = backoff
+        self.progress_interval = progress_interval
+        self.progress = None
+        self.in_flight = threading.BoundedSemaphore(workers + 2)
+
+    def call(self, fn, *args, **kwargs):
+        """Call an S3 operation, retrying retryable errors with backoff."""
+        for attempt in range(self.retries + 1):
+            try:
+                return fn(*args, **kwargs)
+            except S3Error as e:
+                if not e.retryable or attempt == self.retries:
+                    raise
+                if self.progress:
+                    self.progress.retried()
+                delay = min(20.0, self.backoff * 2 ** attempt)
+                time.sleep(delay + random.uniform(0, delay / 4))
+
+    def upload(self, item, part_pool=None):
+        """Upload one item and return the SHA-256 the server verified it against."""
+        if item.size >= self.multipart_threshold and part_pool is not None:
+            return self._upload_multipart(item, part_pool)
+        with open(item.path, "rb") as f:
+            body = f.read()
+        sha256 = item.sha256 or hashlib.sha256(body).hexdigest()
+        try:
+            self.call(self.client.put_object, item.key, body, sha256=sha256,
+                      content_type=content_type(item.path))
+        except S3Error as e:
+            if e.code == "XAmzContentSHA256Mismatch":
+                raise UploadError(f"{item.path} no longer matches its recorded checksum") from e
+            raise
+        if self.progress:
+            self.progress.add_bytes(len(body))
+        return sha256
+
+    def _upload_multipart(self, item, part_pool):
+        upload_id = self.call(self.client.create_multipart_upload, item.key, content_type(item.path))
+        running = hashlib.sha256()
+        futures = []
+
+        def send_part(number, body):
+            try:
+                etag = self.call(self.client.upload_part, item.key, upload_id, number, body,
+                                 sha256=hashlib.sha256(body).hexdigest())
+                if self.progress:
+                    self.progress.add_bytes(len(body))
+                return number, etag
+            finally:
+                self.in_flight.release()
+
+        try:
+            with open(item.path, "rb") as f:
+                number = 1
+                while True:
+                    body = f.read(self.part_size)
+                    if not body:
+                        break
+                    running.update(body)
+                    self.in_flight.acquire()
+                    futures.append(part_pool.submit(send_part, number, body))
+                    number += 1
+            parts = [future.result() for future in futures]
+            if item.sha256 and running.hexdigest() != item.sha256:
+                raise UploadError(f"{item.path} no longer matches its recorded checksum")
+            self.call(self.client.complete_multipart_upload, item.key, upload_id, parts)
+        except BaseException:
+            for future in futures:
+                if future.cancel():
+                    self.in_flight.release()  # send_part never runs to release its slot
+            try:
+                self.client.abort_multipart_upload(item.key, upload_id)
+            except S3Error:
+                pass  # the bucket's lifecycle rules clean up stray uploads
+            raise
+        return running.hexdigest()
+
+    def upload_all(self, items):
+        """Upload every item. Returns (verified, unrecorded, failures).
+
+        verified/unrecorded are lists of the uploaded items with sha256 set
+        to the digest that was sent (items in unrecorded had none recorded
+        beforehand); failures maps items to error messages.
+        """
+        self.progress = Progress(len(items), sum(item.size for item in items), self.progress_interval)
+        verified, unrecorded, failures = [], [], {}
+        # Big files first so their parts overlap with the many small segments
+        ordered = sorted(items, key=lambda item: -item.size)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as part_pool, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self.upload, item, part_pool): item for item in ordered}
+            for future in concurrent.futures.as_completed(futures):
+                item = futures[future]
+                try:
+                    uploaded = item._replace(sha256=future.result())
+                    (verified if item.sha256 else unrecorded).append(uploaded)
+                except (S3Error, UploadError, OSError) as e:
+                    failures[item] = str(e)
+                self.progress.file_done()
+        return verified, unrecorded, failures
+
+    def delete_all(self, keys):
+        """Delete keys concurrently. Returns (deleted keys, {key: error})."""
+        deleted, failures = [], {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self.call, self.client.delete_object, key): key for key in keys}
+            for future in concurrent.futures.as_completed(futures):
+                key = futures[future]
+                try:
+                    future.result()
+                    deleted.append(key)
+                except (S3Error, OSError) as e:
+                    failures[key] = str(e)
+        return deleted, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Upload a couple's HLS output, originals and thumbnails to R2 in parallel."
+    )
+    parser.add_argument(
+        "-s", "--slug", required=True,
+        help="Couple slug (e.g., amanda-boris)"
+    )
+    parser.add_argument(
+        "-o", "--output-dir", required=True,
+        help="HLS output directory from the transcoder"
+    )
+    parser.add_argument(
+        "-r", "--original-dir",
+        help="Directory containing the original source MP4 files"
+    )
+    parser.add_argument(
+        "--endpoint",
+        help="S3 endpoint URL (default: $R2_ENDPOINT)"
+    )
+    parser.add_argument(
+        "--bucket", default="fi-films",
+        help="Bucket name (default: fi-films)"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=16,
+        help="Concurrent uploads / pooled connections (default: 16)"
+    )
+    parser.add_argument(
+        "--retries", type=int, default=5,
+        help="Retries per request on throttling, 5xx or connection errors (default: 5)"
+    )
+    parser.add_argument(
+        "--part-size-mb", type=int, default=PART_SIZE // MiB,
+        help=f"Multipart part size in MiB (default: {PART_SIZE // MiB})"
+    )
+    parser.add_argument(
+        "--multipart-threshold-mb", type=int, default=MULTIPART_THRESHOLD // MiB,
+        help=f"Files at least this large use multipart (default: {MULTIPART_THRESHOLD // MiB})"
+    )
+    parser.add_argument(
+        "--journal",
+        help=f"Transcode journal with recorded checksums (default: <output-dir>/{transcode.JOURNAL_NAME})"
+    )
+    parser.add_argument(
+        "--fingerprint-db",
+        help=f"Fingerprint index with original checksums (default: {fingerprint.default_db_path()})"
+    )
+    parser.add_argument(
+        "--manifest",
+        help=f"Upload manifest for this couple (default: <output-dir>/{upload_manifest.MANIFEST_NAME})"
+    )
+    parser.add_argument(
+        "--full", action="store_true",
+        help="Upload every file even if the manifest says it is unchanged"
+    )
+    parser.add_argument(
+        "--verify-remote", action="store_true",
+        help="List the bucket first and forget manifest entries missing or resized remotely"
+    )
+    parser.add_argument(
+        "--keep-remote", action="store_true",
+        help="Do not delete remote objects whose local file is gone"
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true",
+        help="Print the planned PUTs and DELETEs without uploading"
+    )
+    parser.add_argument(
+        "--no-check", action="store_true",
+        help="Upload without checking the HLS output first (see hls_check.py)"
+    )
+    args = parser.parse_args()
+
+    for label, path in (("Output", args.output_dir), ("Original", args.original_dir)):
+        if path and not os.path.isdir(path):
+            print(f"Error: {label} directory not found: {path}", file=sys.stderr)
+            sys.exit(1)
+    if args.part_size_mb < 5:
+        parser.error("--part-size-mb must be at least 5")
+
+    report = None
+    if not args.no_check:
+        report = hls_check.check_outputs([args.output_dir])
+        if not report["ok"]:
+            print("Error: The HLS output failed the pre-upload check:", file=sys.stderr)
+            for film in report["couples"][0]["films"]:
+                for found in film["issues"]:
+                    if found["severity"] == "error":
+                        print(hls_check.format_issue(film["video_id"], found), file=sys.stderr)
+            print("Fix and re-transcode, or pass --no-check to upload anyway.", file=sys.stderr)
+            sys.exit(1)
+
+    try:
+        client = S3Client.from_env(args.endpoint, args.bucket)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    journal = transcode.Journal(args.journal or os.path.join(args.output_dir, transcode.JOURNAL_NAME))
+    with fingerprint.FingerprintIndex(args.fingerprint_db) as index:
+        items = collect_items(args.slug, args.output_dir, args.original_dir, journal.checksums(), index)
+    if not items:
+        print(f"Error: Nothing to upload in {args.output_dir}", file=sys.stderr)
+        sys.exit(1)
+
+    prefix = f"couples/{args.slug}"
+    manifest = upload_manifest.UploadManifest(
+        args.manifest or os.path.join(args.output_dir, upload_manifest.MANIFEST_NAME),
+        f"{client.scheme}://{client.host}/{args.bucket}/{prefix}",
+    )
+
+    print("\n=== Flyin' Iris R2 Uploader ===")
+    print(f"Couple:   {args.slug}")
+    print(f"Remote:   {args.bucket}/{prefix}/ via {client.scheme}://{client.host}")
+    print(f"Files:    {len(items)} ({sum(item.size for item in items) / 1e9:.2f} GB), "
+          f"{args.workers} connections")
+    if report is not None:
+        print(f"Check:    {report['couples'][0]['totals']['films']} film(s) passed, "
+              f"{report['warnings']} warning(s) (run hls_check.py for details)")
+
+    uploader = Uploader(client, args.workers, args.retries,
+                        args.part_size_mb * MiB, args.multipart_threshold_mb * MiB)
+    if args.verify_remote:
+        try:
+            listing = uploader.call(lambda: list(client.list_objects(prefix + "/")))
+        except S3Error as e:
+            print(f"Error: Could not list {args.bucket}/{prefix}/: {e}", file=sys.stderr)
+            sys.exit(1)
+        print(f"Listed:   {len(listing)} remote object(s); "
+              f"dropped {manifest.reconcile(listing)} stale manifest entries")
+
+    categories = {"hls", "thumbs"} | ({"originals"} if args.original_dir else set())
+    if args.full:
+        plan = upload_manifest.Plan(items, [], [])
+    else:
+        plan = upload_manifest.plan_delta(items, manifest, categories)
+    deletes = [] if args.keep_remote else plan.deletes
+    print(f"Plan:     {len(plan.puts)} PUT(s) ({sum(item.size for item in plan.puts) / 1e9:.2f} GB), "
+          f"{len(deletes)} DELETE(s), {len(plan.unchanged)} unchanged\n")
+
+    if args.dry_run:
+        for item in plan.puts:
+            print(f"  PUT     {item.key}")
+        for key in deletes:
+            print(f"  DELETE  {key}")
+        return
+
+    started = time.perf_counter()
+    verified, unrecorded, failures = [], [], {}
+    retries = 0
+    for phase in upload_phases(plan.puts):
+        if failures:
+            break  # never publish playlists over missing segments
+        if not phase:
+            continue
+        phase_verified, phase_unrecorded, failures = uploader.upload_all(phase)
+        verified += phase_verified
+        unrecorded += phase_unrecorded
+        retries += uploader.progress.retries
+        for item in phase_verified + phase_unrecorded:
+            manifest.record(item.key, item.size, item.sha256)
+    # Deletes go last so players never see a playlist whose segments are gone
+    deleted, delete_failures = uploader.delete_all(deletes) if not failures else ([], {})
+    for key in deleted:
+        manifest.forget(key)
+    manifest.save()
+    elapsed = time.perf_counter() - started
+
+    print("\n=== Upload Summary ===")
+    for category in ("hls", "originals", "thumbs"):
+        done = [item for item in verified + unrecorded if item.category == category]
+        if done:
+            print(f"  {category:<10} {len(done):>6} file(s)  {sum(item.size for item in done) / 1e9:8.2f} GB")
+    uploaded_bytes = sum(item.size for item in verified + unrecorded)
+    print(f"\nUploaded {len(verified) + len(unrecorded)} file(s) in {elapsed:.1f}s "
+          f"({uploaded_bytes / max(elapsed, 1e-9) / 1e6:.1f} MB/s), {retries} retried request(s)")
+    print(f"Verified against recorded checksums: {len(verified)}; no recorded checksum: {len(unrecorded)}")
+    print(f"Unchanged (skipped): {len(plan.unchanged)}; deleted: {len(deleted)}")
+    for item, error in sorted(failures.items(), key=lambda pair: pair[0].key):
+        print(f"  FAILED  {item.key}: {error}", file=sys.stderr)
+    for key, error in sorted(delete_failures.items()):
+        print(f"  FAILED  DELETE {key}: {error}", file=sys.stderr)
+    if failures:
+        print("Skipped the remaining playlists and DELETEs because uploads failed; re-run to finish.",
+              file=sys.stderr)
+
+    errors = len(failures) + len(delete_failures)
+    if errors:
+        print(f"\nUpload completed with {errors} error(s).", file=sys.stderr)
+        sys.exit(1)
+    print("\nAll uploads completed successfully.")
+
+
+if __name__ == "__main__":
+    main()
@@ -78,7 +78,7 @@ has_errors=false
 
 # --- Upload HLS (exclude thumbs) ---
 echo "[1/3] Uploading HLS files..."
-if rclone sync "$OUTPUT_DIR" "$BASE_REMOTE/hls/" --exclude "thumbs/**" --progress; then
+if rclone sync "$OUTPUT_DIR" "$BASE_REMOTE/hls/" --exclude "thumbs/**" --exclude ".transcode-journal.json*" --exclude ".upload-manifest.json*" --exclude ".chunks/**" --exclude ".transcode-queue.sqlite3*" --progress; then
     echo "      HLS upload complete."
 else
     echo "      HLS upload FAILED."
@@ -115,7 +115,7 @@ echo "Verifying uploads..."
 verify_failed=false
 
 echo "  Checking HLS..."
-if ! rclone check "$OUTPUT_DIR" "$BASE_REMOTE/hls/" --exclude "thumbs/**" 2>&1; then
+if ! rclone check "$OUTPUT_DIR" "$BASE_REMOTE/hls/" --exclude "thumbs/**" --exclude ".transcode-journal.json*" --exclude ".upload-manifest.json*" --exclude ".chunks/**" --exclude ".transcode-queue.sqlite3*" 2>&1; then
     verify_failed=true
 fi
 
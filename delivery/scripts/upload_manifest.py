@@ -0,0 +1,144 @@
+"""
+Flyin' Iris — Upload Manifest & Delta Planner
+
+Keeps a local record of what upload.py has put in R2 for one couple (key,
+size, SHA-256 and upload time per object) next to the transcoder output,
+and diffs it against the local tree to work out the smallest set of PUTs
+and DELETEs. Re-uploading a couple after re-transcoding one film then
+costs one film's worth of requests instead of a listing and check of
+every segment in the bucket.
+
+The manifest only describes objects the uploader wrote itself, so it can
+fall behind if the bucket is changed by other means (rclone, the
+dashboard). upload.py --verify-remote reconciles it against a listing.
+"""
+
+import collections
+import json
+import os
+import sys
+import threading
+import time
+
+import fingerprint
+
+MANIFEST_NAME = ".upload-manifest.json"
+
+# puts are UploadItems to send; deletes are remote keys to remove;
+# unchanged are UploadItems already in the bucket with the same content.
+Plan = collections.namedtuple("Plan", ["puts", "deletes", "unchanged"])
+
+
+def key_category(key):
+    """Return "hls", "originals" or "thumbs" for a couples/{slug}/... key."""
+    parts = key.split("/", 3)
+    return parts[2] if len(parts) > 3 else None
+
+
+class UploadManifest:
+    """Per-couple record of uploaded objects, keyed by R2 key.
+
+    remote identifies the endpoint, bucket and couple prefix the manifest
+    describes; a manifest written for a different remote is ignored, so
+    uploading the same output to a test bucket never suppresses uploads
+    to the real one. Saved atomically like the transcode journal.
+    """
+
+    def __init__(self, path, remote):
+        self.path = path
+        self.remote = remote
+        self.lock = threading.Lock()
+        self.objects = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Warning: Ignoring unreadable upload manifest {path}: {e}", file=sys.stderr)
+            return
+        if not isinstance(data, dict) or data.get("remote") != remote:
+            print(f"Warning: Upload manifest {path} was written for a different remote; "
+                  f"uploading everything to {remote}", file=sys.stderr)
+            return
+        self.objects = data.get("objects", {})
+
+    def get(self, key):
+        return self.objects.get(key)
+
+    def record(self, key, size, sha256):
+        with self.lock:
+            self.objects[key] = {
+                "size": size,
+                "sha256": sha256,
+                "uploaded": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }
+
+    def keys(self):
+        with self.lock:
+            return list(self.objects)
+
+    def forget(self, key):
+        with self.lock:
+            self.objects.pop(key, None)
+
+    def reconcile(self, listing):
+        """Drop entries whose object is missing or a different size remotely.
+
+        listing is an iterable of {"key", "size"} (S3Client.list_objects).
+        Returns the number of entries dropped.
+        """
+        remote = {obj["key"]: obj["size"] for obj in listing}
+        stale = [key for key, entry in self.objects.items() if remote.get(key) != entry["size"]]
+        with self.lock:
+            for key in stale:
+                del self.objects[key]
+        return len(stale)
+
+    def save(self):
+        with self.lock:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": 1, "remote": self.remote, "objects": self.objects},
+                          f, indent=2, sort_keys=True)
+                f.write("\n")
+            os.replace(tmp_path, self.path)
+
+
+def check_item(item, manifest):
+    """Return (item, unchanged) for one UploadItem.
+
+    An item is unchanged when the manifest has its key with the same size
+    and SHA-256. An item without a recorded checksum is hashed (and
+    returned with it) only if a same-size entry could match it.
+    """
+    entry = manifest.get(item.key)
+    if not entry or entry["size"] != item.size:
+        return item, False
+    if item.sha256 is None:
+        item = item._replace(sha256=fingerprint.hash_full(item.path))
+    return item, entry["sha256"] == item.sha256
+
+
+def plan_delta(items, manifest, categories=None):
+    """Diff local UploadItems against the manifest (see check_item).
+
+    Changed and new items are PUTs. Manifest keys with no local file are
+    DELETEs, limited to the categories being uploaded this run (so leaving
+    out the originals folder never deletes remote originals).
+    """
+    if categories is None:
+        categories = {item.category for item in items}
+
+    puts, unchanged = [], []
+    for item in items:
+        item, same = check_item(item, manifest)
+        if same:
+            unchanged.append(item)
+        else:
+            puts.append(item)
+
+    local_keys = {item.key for item in items}
+    deletes = sorted(key for key in manifest.keys()
+                     if key not in local_keys and key_category(key) in categories)
+    return Plan(puts, deletes, unchanged)
@@ -29,8 +29,9 @@ self.addEventListener('activate', (event) => {
 self.addEventListener('fetch', (event) => {
   const url = new URL(event.request.url);
 
-  // Network-only for HLS segments and playlists (never cache streaming data)
-  if (url.pathname.endsWith('.ts') || url.pathname.endsWith('.m3u8')) {
+  // Network-only for HLS segments and playlists (never cache streaming data):
+  // .ts, fMP4 .m4s / init.mp4, and byte ranges of single-file streams
+  if (url.pathname.includes('/hls/') || url.pathname.endsWith('.m3u8')) {
     event.respondWith(fetch(event.request));
     return;
   }
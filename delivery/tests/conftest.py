@@ -0,0 +1,11 @@
+"""
+Flyin' Iris — Test Setup
+
+The scripts are standalone files that import each other by module name,
+so their folder goes on sys.path the way running one of them puts it.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "scripts"))
@@ -0,0 +1,80 @@
+"""Tests for generate.py's template rendering, --incremental digests and collection grid."""
+
+import generate
+
+
+def templates(page="<h1>{{COUPLE_NAMES}}</h1>"):
+    return {"index.html": generate.compile_template(page), "sw.js": "self.skipWaiting();"}
+
+
+def test_render_template_fills_every_placeholder():
+    compiled = generate.compile_template("<h1>{{COUPLE_NAMES}}</h1><p>{{COUPLE_NAMES}} {{DATE_LONG}}</p>")
+    assert (generate.render_template(compiled, {"{{COUPLE_NAMES}}": "A & B", "{{DATE_LONG}}": "June"})
+            == "<h1>A & B</h1><p>A & B June</p>")
+
+
+def test_render_template_does_not_substitute_inside_values():
+    compiled = generate.compile_template("<h1>{{COUPLE_NAMES}}</h1><p>{{DATE_LONG}}</p>")
+    html = generate.render_template(compiled, {"{{COUPLE_NAMES}}": "{{DATE_LONG}}", "{{DATE_LONG}}": "June"})
+    assert html == "<h1>{{DATE_LONG}}</h1><p>June</p>"
+
+
+def test_render_template_leaves_unknown_placeholders():
+    compiled = generate.compile_template("<p>{{NOT_A_TOKEN}}</p>")
+    assert generate.render_template(compiled, {"{{COUPLE_NAMES}}": "A & B"}) == "<p>{{NOT_A_TOKEN}}</p>"
+
+
+def test_inputs_digest_is_stable():
+    assert generate.inputs_digest(templates(), "https://w") == generate.inputs_digest(templates(), "https://w")
+
+
+def test_inputs_digest_changes_with_a_template():
+    assert (generate.inputs_digest(templates(), "https://w")
+            != generate.inputs_digest(templates("<h2>{{COUPLE_NAMES}}</h2>"), "https://w"))
+
+
+def test_inputs_digest_changes_with_the_worker_base():
+    assert generate.inputs_digest(templates(), "https://a") != generate.inputs_digest(templates(), "https://b")
+
+
+def test_inputs_digest_ignores_template_order():
+    forward = templates()
+    backward = dict(reversed(list(forward.items())))
+    assert generate.inputs_digest(forward, "https://w") == generate.inputs_digest(backward, "https://w")
+
+
+def test_couple_digest_changes_with_the_config():
+    base = generate.inputs_digest(templates(), "https://w")
+    config = {"slug": "amanda-boris", "videos": [{"id": "highlight", "order": 1}]}
+    changed = dict(config, videos=[{"id": "highlight", "order": 2}])
+    assert generate.couple_digest(base, config) == generate.couple_digest(base, dict(config))
+    assert generate.couple_digest(base, config) != generate.couple_digest(base, changed)
+
+
+def video(video_id, order, featured=False):
+    entry = {"id": video_id, "order": order}
+    if featured:
+        entry["featured"] = True
+    return entry
+
+
+def test_collection_videos_leaves_out_the_featured_film():
+    videos = [video("teaser", 1), video("highlight", 2, featured=True), video("ceremony", 3)]
+    assert [v["id"] for v in generate.collection_videos(videos)] == ["teaser", "ceremony"]
+
+
+def test_collection_videos_features_the_first_film_by_default():
+    videos = [video("highlight", 3), video("teaser", 2), video("ceremony", 1)]
+    assert [v["id"] for v in generate.collection_videos(videos)] == ["ceremony", "teaser"]
+
+
+def test_collection_videos_sorts_by_order():
+    videos = [video("highlight", 0, featured=True), video("vows", 9), video("toasts", 4), video("first-dance", 6)]
+    assert [v["id"] for v in generate.collection_videos(videos)] == ["toasts", "first-dance", "vows"]
+
+
+def test_page_videos_carry_their_atlas_tile():
+    config = {"videos": [video("highlight", 1, featured=True), video("ceremony", 2), video("vows", 3)],
+              "card_atlas": {"name": "cards-0123456789ab", "columns": 1, "rows": 1, "offsets": {"ceremony": [0, 0]}}}
+    assert [v.get("atlas_offset") for v in generate.page_videos(config)] == [None, [0, 0], None]
+    assert generate.page_videos({"videos": [video("highlight", 1)]}) == [video("highlight", 1)]
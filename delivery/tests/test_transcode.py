@@ -0,0 +1,182 @@
+"""Tests for transcode.py's planning: per-title ladders, keyframe/segment lengths and card atlases."""
+
+import fractions
+import os
+
+import pytest
+
+import fingerprint
+import transcode
+from transcode import Rung
+
+LADDER = (
+    Rung("1080p", 1920, 1080, "5000k", 5128000),
+    Rung("720p", 1280, 720, "2500k", 2628000),
+    Rung("480p", 854, 480, "1000k", 1128000),
+)
+PROFILE = transcode.DEFAULT_PROFILE._replace(
+    ladder=LADDER,
+    rung_limits_kbps={"1080p": (2000, 7500), "720p": (1000, 4000), "480p": (400, 1600)},
+    audio_bitrate="128k", gop_seconds=2, segment_seconds=4, scene_cut=False,
+)
+
+
+def names(ladder):
+    return [rung.name for rung in ladder]
+
+
+def rates(ladder):
+    return [rung.video_bitrate for rung in ladder]
+
+
+def test_fit_ladder_drops_rungs_above_the_source():
+    assert names(transcode.fit_ladder(1920, 1080, LADDER)) == ["1080p", "720p", "480p"]
+    assert names(transcode.fit_ladder(1280, 720, LADDER)) == ["720p", "480p"]
+    assert names(transcode.fit_ladder(1900, 1068, LADDER)) == ["1080p", "720p", "480p"]
+
+
+def test_fit_ladder_keeps_the_smallest_rung():
+    assert names(transcode.fit_ladder(640, 360, LADDER)) == ["480p"]
+
+
+def test_plan_ladder_scales_the_probe_rate_to_each_rung():
+    ladder = transcode.plan_ladder(1920, 1080, 800, PROFILE)
+    assert rates(ladder) == ["4150k", "2250k", "1250k"]
+    assert [rung.bandwidth for rung in ladder] == [4278000, 2378000, 1378000]
+
+
+def test_plan_ladder_leaves_out_upscaled_rungs():
+    assert names(transcode.plan_ladder(1280, 720, 800, PROFILE)) == ["720p", "480p"]
+
+
+def test_plan_ladder_clamps_to_the_rung_ranges():
+    assert rates(transcode.plan_ladder(1920, 1080, 100, PROFILE)) == ["2000k", "1000k", "400k"]
+    assert rates(transcode.plan_ladder(1920, 1080, 20000, PROFILE)) == ["7500k", "4000k", "1600k"]
+
+
+def test_plan_ladder_drops_a_rung_too_close_to_the_one_above():
+    profile = PROFILE._replace(rung_limits_kbps={"1080p": (2000, 5000), "720p": (4000, 4000), "480p": (400, 1600)})
+    assert names(transcode.plan_ladder(1920, 1080, 3000, profile)) == ["1080p", "480p"]
+
+
+def test_plan_encoding_rounds_the_gop_to_whole_frames():
+    encoding = transcode.plan_encoding(fractions.Fraction(30000, 1001), PROFILE)
+    assert (encoding.gop_frames, encoding.segment_frames) == (60, 120)
+    assert encoding.segment_seconds == fractions.Fraction(1001, 250)
+
+
+def test_plan_encoding_at_integer_rates():
+    for rate, gop_frames in ((25, 50), (50, 100), (60, 120)):
+        encoding = transcode.plan_encoding(rate, PROFILE)
+        assert encoding.gop_frames == gop_frames
+        assert encoding.segment_frames == 2 * gop_frames
+        assert encoding.segment_seconds == 4
+
+
+def test_plan_encoding_segments_are_whole_gops():
+    profile = PROFILE._replace(gop_seconds=1.5, segment_seconds=4)
+    encoding = transcode.plan_encoding(fractions.Fraction(24000, 1001), profile)
+    assert encoding.gop_frames == 36
+    assert encoding.segment_frames == 108
+
+
+def test_keyframes_follow_the_gop():
+    encoding = transcode.plan_encoding(fractions.Fraction(30000, 1001), PROFILE)
+    args = transcode.video_encoder_args(LADDER[0], encoding)
+    assert args[args.index("-g") + 1] == args[args.index("-keyint_min") + 1] == "60"
+    assert args[args.index("-sc_threshold") + 1] == "0"
+    assert transcode.hls_time(encoding) == "4.003900"
+
+
+def test_plan_film_ladders_probes_each_uncached_source_once(tmp_path, monkeypatch):
+    probed = []
+
+    def probe_complexity(src, duration, width, height):
+        probed.append(src)
+        if src == "bad.mp4":
+            raise transcode.TranscodeError("complexity probe failed")
+        return 800.0
+
+    monkeypatch.setattr(transcode, "probe_video_size", lambda src: (1920, 1080))
+    monkeypatch.setattr(transcode, "probe_duration", lambda src: 60.0)
+    monkeypatch.setattr(transcode, "probe_complexity", probe_complexity)
+    sources = ["a.mp4", "a-copy.mp4", "b.mp4", "bad.mp4"]
+    source_hashes = {"a.mp4": "aa", "a-copy.mp4": "aa", "b.mp4": "bb", "bad.mp4": "cc"}
+    with fingerprint.FingerprintIndex(str(tmp_path / "index.sqlite3")) as index:
+        index.store_probe("bb", transcode.probe_settings(), 800.0)
+        ladders, failures = transcode.plan_film_ladders(sources, source_hashes, index, PROFILE)
+        assert sorted(probed) == ["a.mp4", "bad.mp4"]
+        assert index.cached_probe("aa", transcode.probe_settings()) == 800.0
+    assert set(ladders) == {"a.mp4", "a-copy.mp4", "b.mp4"}
+    assert rates(ladders["a-copy.mp4"]) == ["4150k", "2250k", "1250k"]
+    assert failures == {"bad.mp4": "complexity probe failed"}
+
+
+def write_posters(output_dir, posters):
+    os.makedirs(os.path.join(output_dir, transcode.THUMBS_DIR), exist_ok=True)
+    for video_id, body in posters.items():
+        with open(os.path.join(output_dir, transcode.THUMBS_DIR, f"{video_id}.jpg"), "wb") as f:
+            f.write(body)
+
+
+def test_card_atlas_grid_is_roughly_square():
+    assert transcode.card_atlas_grid(1) == (1, 1)
+    assert transcode.card_atlas_grid(4) == (2, 2)
+    assert transcode.card_atlas_grid(10) == (4, 3)
+    assert transcode.card_atlas_grid(17) == (5, 4)
+
+
+def test_card_atlas_grid_stays_under_the_image_size_limit():
+    tile_width = transcode.CARD_WIDTHS[-1]
+    tile_height = tile_width * 9 // 16
+    for count in (100, 200, 300):
+        columns, rows = transcode.card_atlas_grid(count)
+        assert columns * rows >= count
+        assert columns * tile_width <= transcode.CARD_ATLAS_MAX_SIDE
+        assert rows * tile_height <= transcode.CARD_ATLAS_MAX_SIDE
+    with pytest.raises(transcode.TranscodeError):
+        transcode.card_atlas_grid(1000)
+
+
+def test_card_atlas_films_are_the_grid_films_with_posters(tmp_path):
+    write_posters(str(tmp_path), {"highlight": b"h", "ceremony": b"c", "toasts": b"t"})
+    config = {"videos": [
+        {"id": "toasts", "order": 3},
+        {"id": "highlight", "order": 1, "featured": True},
+        {"id": "ceremony", "order": 2},
+        {"id": "vows", "order": 4},
+    ]}
+    assert transcode.card_atlas_films(config, str(tmp_path)) == ["ceremony", "toasts"]
+
+
+def test_plan_card_atlas_places_films_in_display_order(tmp_path):
+    video_ids = ["a", "b", "c", "d", "e"]
+    write_posters(str(tmp_path), {video_id: video_id.encode() for video_id in video_ids})
+    atlas = transcode.plan_card_atlas(str(tmp_path), video_ids)
+    assert (atlas["columns"], atlas["rows"]) == (3, 2)
+    assert atlas["offsets"] == {"a": [0, 0], "b": [1, 0], "c": [2, 0], "d": [0, 1], "e": [1, 1]}
+    assert atlas["name"].startswith(transcode.CARD_ATLAS_PREFIX + "-")
+
+
+def test_plan_card_atlas_name_follows_the_films_and_posters(tmp_path):
+    write_posters(str(tmp_path), {"a": b"a", "b": b"b", "c": b"c"})
+    name = transcode.plan_card_atlas(str(tmp_path), ["a", "b"])["name"]
+    assert transcode.plan_card_atlas(str(tmp_path), ["a", "b"])["name"] == name
+    assert transcode.plan_card_atlas(str(tmp_path), ["b", "a"])["name"] != name
+    assert transcode.plan_card_atlas(str(tmp_path), ["a", "b", "c"])["name"] != name
+    write_posters(str(tmp_path), {"b": b"re-cut"})
+    assert transcode.plan_card_atlas(str(tmp_path), ["a", "b"])["name"] != name
+
+
+def test_card_atlas_outputs_cover_every_width_and_format():
+    atlas = {"name": "cards-0123456789ab", "columns": 1, "rows": 1, "offsets": {"a": [0, 0]}}
+    outputs = transcode.card_atlas_outputs(atlas)
+    assert len(outputs) == len(transcode.CARD_WIDTHS) * len(transcode.CARD_FORMATS)
+    assert f"{transcode.THUMBS_DIR}/cards-0123456789ab-{transcode.CARD_WIDTHS[0]}.jpg" in outputs
+
+
+def test_card_atlas_outputs_follow_the_recorded_formats(tmp_path):
+    write_posters(str(tmp_path), {"a": b"a"})
+    atlas = transcode.plan_card_atlas(str(tmp_path), ["a"], formats=("webp", "jpg"))
+    assert atlas["formats"] == ["webp", "jpg"]
+    assert {output.rsplit(".", 1)[1] for output in transcode.card_atlas_outputs(atlas)} == {"webp", "jpg"}
@@ -0,0 +1,156 @@
+"""Tests for transcode_queue.py's SQLite broker: submitting, claim order, leases and retries."""
+
+import os
+
+import pytest
+
+import transcode
+import transcode_queue
+from transcode import Chunk, Job
+
+WORKER = "studio-1:100"
+
+
+def make_job(video_id, kind, index=None, duration=60.0, outputs=None):
+    chunk = None
+    if kind == "chunk":
+        chunk = Chunk(index, 2, index * 30.0, index * 30.0, 900, 0, None, 0.0)
+    elif kind == "hls":
+        chunk = [Chunk(i, 2, i * 30.0, i * 30.0, 900, 0, None, 0.0) for i in range(2)]
+    key = f"{kind}{'' if index is None else index}:{video_id}:digest"
+    return Job(video_id, kind, None, f"{video_id}-{kind}.log", duration, key,
+               outputs if outputs is not None else [f"{video_id}/{key}.out"], chunk)
+
+
+def chunked_film(video_id):
+    """A chunked film's jobs: its audio, two chunks and the stitch (the film's HLS job)."""
+    return [make_job(video_id, "audio"), make_job(video_id, "chunk", 0), make_job(video_id, "chunk", 1),
+            make_job(video_id, "hls", outputs=[f"{video_id}/master.m3u8"])]
+
+
+def write_film_output(output_dir, video_id):
+    os.makedirs(os.path.join(output_dir, video_id, "720p"))
+    with open(os.path.join(output_dir, video_id, "master.m3u8"), "w") as f:
+        f.write("#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=2628000\n720p/playlist.m3u8\n")
+    with open(os.path.join(output_dir, video_id, "720p", "playlist.m3u8"), "w") as f:
+        f.write("#EXTM3U\n#EXT-X-ENDLIST\n")
+
+
+def run_all(broker):
+    """Claim and complete jobs until none is runnable; returns the keys in claim order."""
+    keys = []
+    while True:
+        row = broker.claim(WORKER)
+        if row is None:
+            return keys
+        keys.append(row["key"])
+        assert broker.complete(WORKER, row["id"], {})
+
+
+@pytest.fixture
+def broker(tmp_path):
+    with transcode_queue.Broker(str(tmp_path / "queue.sqlite3")) as broker:
+        broker.register(WORKER)
+        yield broker
+
+
+def test_resubmitting_a_stitched_film_does_not_requeue_its_chunks(broker, tmp_path):
+    output_dir = str(tmp_path)
+    jobs = chunked_film("ceremony")
+    broker.enqueue(jobs, output_dir)
+    run_all(broker)
+    # finish_job removed the chunks after stitching; only the film's output is left
+    write_film_output(output_dir, "ceremony")
+    assert transcode.outputs_complete(jobs[-1], output_dir)
+
+    ids = broker.enqueue(jobs, output_dir)
+    assert [row["kind"] for row in broker.jobs(ids)] == ["hls"]
+    assert {row["state"] for row in broker.jobs()} == {"done"}
+    assert broker.claim(WORKER) is None
+
+
+def test_resubmitting_a_film_whose_output_is_gone_requeues_everything(broker, tmp_path):
+    jobs = chunked_film("ceremony")
+    broker.enqueue(jobs, str(tmp_path))
+    run_all(broker)
+    broker.enqueue(jobs, str(tmp_path))
+    assert {row["state"] for row in broker.jobs()} == {"queued"}
+
+
+def single_film(video_id, duration):
+    """An unchunked film's HLS job."""
+    return make_job(video_id, "hls", duration=duration)._replace(chunk=None)
+
+
+def test_claim_order_follows_rank_duration_and_dependencies(broker, tmp_path):
+    jobs = chunked_film("ceremony") + [
+        single_film("toasts", 120.0), single_film("vows", 30.0),
+        make_job("ceremony", "thumb"), make_job("toasts", "thumb"),
+    ]
+    broker.enqueue(jobs, str(tmp_path))
+    assert run_all(broker) == [
+        "audio:ceremony:digest",
+        "hls:toasts:digest", "chunk0:ceremony:digest", "chunk1:ceremony:digest",
+        "hls:ceremony:digest",
+        "hls:vows:digest",
+        "thumb:ceremony:digest", "thumb:toasts:digest",
+    ]
+
+
+def test_a_stitch_waits_for_every_chunk(broker, tmp_path):
+    broker.enqueue(chunked_film("ceremony"), str(tmp_path))
+    claimed = [broker.claim(WORKER) for _ in range(3)]
+    assert [row["kind"] for row in claimed] == ["audio", "chunk", "chunk"]
+    for row in claimed[:2]:
+        broker.complete(WORKER, row["id"], {})
+    assert broker.claim(WORKER) is None
+    broker.complete(WORKER, claimed[2]["id"], {})
+    assert broker.claim(WORKER)["kind"] == "hls"
+
+
+def test_an_expired_lease_is_requeued(broker, tmp_path):
+    broker.enqueue([single_film("toasts", 60.0)], str(tmp_path), retries=1)
+    first = broker.claim(WORKER, lease=-1)
+    second = broker.claim("studio-2:200")
+    assert second["id"] == first["id"]
+    assert second["worker"] == "studio-2:200"
+    assert second["attempts"] == 2
+    assert second["error"] == f"worker {WORKER} stopped responding"
+
+
+def test_an_expired_lease_fails_the_job_once_out_of_attempts(broker, tmp_path):
+    broker.enqueue([single_film("toasts", 60.0)], str(tmp_path), retries=0)
+    broker.claim(WORKER, lease=-1)
+    assert broker.claim(WORKER) is None
+    [row] = broker.jobs()
+    assert (row["state"], row["error"]) == ("failed", f"worker {WORKER} stopped responding")
+
+
+def test_fail_requeues_until_out_of_attempts(broker, tmp_path):
+    broker.enqueue([single_film("toasts", 60.0)], str(tmp_path), retries=1)
+    broker.fail(WORKER, broker.claim(WORKER)["id"], "ffmpeg exit code 1")
+    assert [row["state"] for row in broker.jobs()] == ["queued"]
+    broker.fail(WORKER, broker.claim(WORKER)["id"], "ffmpeg exit code 1")
+    [row] = broker.jobs()
+    assert (row["state"], row["attempts"], row["error"]) == ("failed", 2, "ffmpeg exit code 1")
+    assert broker.claim(WORKER) is None
+
+
+def test_a_job_whose_dependency_failed_fails_too(broker, tmp_path):
+    broker.enqueue(chunked_film("ceremony"), str(tmp_path), retries=0)
+    audio, chunk, _ = (broker.claim(WORKER) for _ in range(3))
+    broker.complete(WORKER, audio["id"], {})
+    broker.fail(WORKER, chunk["id"], "ffmpeg exit code 1")
+    assert broker.claim(WORKER) is None
+    stitch = [row for row in broker.jobs() if row["kind"] == "hls"][0]
+    assert (stitch["state"], stitch["error"]) == ("failed", "a job it depends on failed")
+
+
+def test_heartbeat_and_complete_after_the_lease_is_lost(broker, tmp_path):
+    broker.enqueue([single_film("toasts", 60.0)], str(tmp_path))
+    row = broker.claim(WORKER)
+    assert broker.heartbeat(WORKER, row["id"], lease=-1)
+    broker.claim("studio-2:200")
+    assert not broker.heartbeat(WORKER, row["id"])
+    assert not broker.complete(WORKER, row["id"], {})
+    assert [row["worker"] for row in broker.jobs()] == ["studio-2:200"]
@@ -0,0 +1,70 @@
+"""Tests for upload_manifest.py's PUT/DELETE delta planning."""
+
+import hashlib
+
+import upload_manifest
+from upload import UploadItem
+
+REMOTE = "https://r2.example/fi-films/couples/amanda-boris"
+
+
+def make_manifest(tmp_path, objects):
+    manifest = upload_manifest.UploadManifest(str(tmp_path / upload_manifest.MANIFEST_NAME), REMOTE)
+    for key, (size, sha256) in objects.items():
+        manifest.record(key, size, sha256)
+    return manifest
+
+
+def make_item(tmp_path, key, body, sha256=None):
+    path = tmp_path / key.replace("/", "_")
+    path.write_bytes(body)
+    return UploadItem(str(path), key, len(body), sha256, upload_manifest.key_category(key))
+
+
+def test_key_category():
+    assert upload_manifest.key_category("couples/amanda-boris/hls/highlight/master.m3u8") == "hls"
+    assert upload_manifest.key_category("couples/amanda-boris/thumbs/highlight.jpg") == "thumbs"
+    assert upload_manifest.key_category("couples/amanda-boris") is None
+
+
+def test_unchanged_new_and_changed_items(tmp_path):
+    same = make_item(tmp_path, "couples/amanda-boris/hls/a/master.m3u8", b"same", "1" * 64)
+    new = make_item(tmp_path, "couples/amanda-boris/hls/b/master.m3u8", b"new", "2" * 64)
+    changed = make_item(tmp_path, "couples/amanda-boris/hls/c/master.m3u8", b"changed", "3" * 64)
+    manifest = make_manifest(tmp_path, {same.key: (same.size, same.sha256),
+                                        changed.key: (changed.size, "4" * 64)})
+    plan = upload_manifest.plan_delta([same, new, changed], manifest)
+    assert plan.unchanged == [same]
+    assert plan.puts == [new, changed]
+    assert plan.deletes == []
+
+
+def test_item_without_checksum_is_hashed_only_if_sizes_match(tmp_path):
+    body = b"poster"
+    item = make_item(tmp_path, "couples/amanda-boris/thumbs/highlight.jpg", body)
+    manifest = make_manifest(tmp_path, {item.key: (len(body), hashlib.sha256(body).hexdigest())})
+    plan = upload_manifest.plan_delta([item], manifest)
+    assert [unchanged.sha256 for unchanged in plan.unchanged] == [hashlib.sha256(body).hexdigest()]
+
+    resized = make_manifest(tmp_path, {item.key: (len(body) + 1, hashlib.sha256(body).hexdigest())})
+    assert upload_manifest.plan_delta([item], resized).puts == [item]
+
+
+def test_deletes_are_limited_to_the_uploaded_categories(tmp_path):
+    kept = make_item(tmp_path, "couples/amanda-boris/hls/a/master.m3u8", b"kept", "1" * 64)
+    manifest = make_manifest(tmp_path, {
+        kept.key: (kept.size, kept.sha256),
+        "couples/amanda-boris/hls/gone/master.m3u8": (1, "2" * 64),
+        "couples/amanda-boris/originals/gone.mp4": (1, "3" * 64),
+    })
+    plan = upload_manifest.plan_delta([kept], manifest)
+    assert plan.deletes == ["couples/amanda-boris/hls/gone/master.m3u8"]
+    plan = upload_manifest.plan_delta([kept], manifest, categories={"hls", "originals"})
+    assert plan.deletes == ["couples/amanda-boris/hls/gone/master.m3u8", "couples/amanda-boris/originals/gone.mp4"]
+
+
+def test_manifest_for_another_remote_is_ignored(tmp_path):
+    manifest = make_manifest(tmp_path, {"couples/amanda-boris/hls/a/master.m3u8": (1, "1" * 64)})
+    manifest.save()
+    assert upload_manifest.UploadManifest(manifest.path, REMOTE).keys() == manifest.keys()
+    assert upload_manifest.UploadManifest(manifest.path, REMOTE + "-test").keys() == []
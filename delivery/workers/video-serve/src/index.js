@@ -2,7 +2,7 @@
 // Serves HLS video from R2 with JWT-gated downloads
 
 export default {
-  async fetch(request, env) {
+  async fetch(request, env, ctx) {
     try {
       if (request.method === 'OPTIONS') {
         return handleOptions(request);
@@ -26,11 +26,12 @@ export default {
       // Route: GET /couples/{slug}/hls/{videoId}/*
       const hlsMatch = path.match(/^\/couples\/([^/]+)\/hls\/(.+)$/);
       if (hlsMatch && request.method === 'GET') {
-        return handleHLS(request, env, hlsMatch[0]);
+        return handleHLS(request, env, ctx, hlsMatch[0]);
       }
 
-      // Route: GET /couples/{slug}/thumbs/{videoId}.jpg
-      const thumbMatch = path.match(/^\/couples\/([^/]+)\/thumbs\/([^/]+\.jpg)$/);
+      // Route: GET /couples/{slug}/thumbs/{videoId}.jpg (poster) and
+      // /couples/{slug}/thumbs/{videoId}/{file} (card thumbnails, sprite sheets, thumbnails.vtt, ...)
+      const thumbMatch = path.match(/^\/couples\/([^/]+)\/thumbs\/((?:[^/]+\/)?[^/]+\.(?:jpg|webp|avif|vtt))$/);
       if (thumbMatch && request.method === 'GET') {
         return handleThumb(request, env, thumbMatch[0]);
       }
@@ -46,31 +47,105 @@ export default {
 // Route handlers
 // ---------------------------------------------------------------------------
 
-async function handleHLS(request, env, matchedPath) {
+async function handleHLS(request, env, ctx, matchedPath) {
   // R2 key is the URL path without the leading slash
   const key = matchedPath.replace(/^\//, '');
-  const object = await env.FI_FILMS.get(key);
-
-  if (!object) {
-    return jsonResponse({ error: 'Not found' }, 404, request);
-  }
-
   const ext = key.split('.').pop().toLowerCase();
   const contentType =
     ext === 'm3u8' ? 'application/vnd.apple.mpegurl' :
     ext === 'ts'   ? 'video/MP2T' :
+    ext === 'm4s'  ? 'video/iso.segment' :
+    ext === 'mp4'  ? 'video/mp4' :
     'application/octet-stream';
 
-  // Playlists get short cache (quality switching); segments get long cache
+  // Playlists get short cache (quality switching); segments and fMP4
+  // init segments get long cache
   const cacheControl =
     ext === 'm3u8'
       ? 'public, max-age=3600'
       : 'public, max-age=31536000';
 
+  // Single-file variants (EXT-X-BYTERANGE playlists) fetch each segment
+  // as a byte range of one stream.ts / stream.m4s object. A malformed
+  // Range header is ignored and the whole object served, as HTTP allows.
+  const rangeHeader = request.headers.get('Range');
+  const range = rangeHeader && ext !== 'm3u8' ? parseRange(rangeHeader) : null;
+  if (range) {
+    return handleRange(request, env, ctx, key, range, rangeHeader, contentType, cacheControl);
+  }
+
+  const object = await env.FI_FILMS.get(key);
+
+  if (!object) {
+    return jsonResponse({ error: 'Not found' }, 404, request);
+  }
+
   return new Response(object.body, {
     headers: {
       'Content-Type': contentType,
       'Cache-Control': cacheControl,
+      'Accept-Ranges': 'bytes',
+      ...cors(request),
+    },
+  });
+}
+
+async function handleRange(request, env, ctx, key, range, rangeHeader, contentType, cacheControl) {
+  // The Cache API refuses 206 responses, so each range is cached as a 200
+  // under its own URL and turned back into a 206 on the way out. The URL
+  // carries the object's etag: a re-encoded film is re-uploaded under the
+  // same stream.ts / stream.m4s name, and its new playlist's byte ranges
+  // must never be served from the old file's cached bytes.
+  const head = await env.FI_FILMS.head(key);
+  if (!head) {
+    return jsonResponse({ error: 'Not found' }, 404, request);
+  }
+  const cache = caches.default;
+  const cacheUrl = new URL(request.url);
+  cacheUrl.search = `?etag=${encodeURIComponent(head.etag)}&range=${encodeURIComponent(rangeHeader)}`;
+  const cacheKey = new Request(cacheUrl.toString(), { method: 'GET' });
+
+  let cached = await cache.match(cacheKey);
+  if (!cached) {
+    let object;
+    try {
+      object = await env.FI_FILMS.get(key, { range });
+    } catch {
+      object = undefined; // R2 rejects ranges that start past the end
+    }
+    if (object === undefined || (object && range.suffix === 0)) {
+      return new Response(null, {
+        status: 416,
+        headers: { 'Content-Range': `bytes */${head.size}`, ...cors(request) },
+      });
+    }
+    if (!object) {
+      return jsonResponse({ error: 'Not found' }, 404, request);
+    }
+    const offset = range.suffix !== undefined ? Math.max(0, object.size - range.suffix) : range.offset;
+
+    const body = await object.arrayBuffer();
+    cached = new Response(body, {
+      headers: {
+        'Content-Type': contentType,
+        'Cache-Control': cacheControl,
+        'Content-Range': `bytes ${offset}-${offset + body.byteLength - 1}/${object.size}`,
+      },
+    });
+    // Only bytes of the object the key names are cached (it may have been
+    // replaced between the head and the get)
+    if (object.etag === head.etag) {
+      ctx.waitUntil(cache.put(cacheKey, cached.clone()));
+    }
+  }
+
+  return new Response(cached.body, {
+    status: 206,
+    headers: {
+      'Content-Type': cached.headers.get('Content-Type'),
+      'Cache-Control': cached.headers.get('Cache-Control'),
+      'Content-Range': cached.headers.get('Content-Range'),
+      'Accept-Ranges': 'bytes',
       ...cors(request),
     },
   });
@@ -78,6 +153,17 @@ async function handleHLS(request, env, matchedPath) {
 
 async function handleThumb(request, env, matchedPath) {
   const key = matchedPath.replace(/^\//, '');
+  const ext = key.split('.').pop().toLowerCase();
+  const contentType =
+    ext === 'vtt'  ? 'text/vtt; charset=utf-8' :
+    ext === 'avif' ? 'image/avif' :
+    ext === 'webp' ? 'image/webp' :
+    'image/jpeg';
+
+  // The thumbnail track gets the playlists' short cache (it is rewritten
+  // when a film is re-cut); images get long cache
+  const cacheControl = ext === 'vtt' ? 'public, max-age=3600' : 'public, max-age=31536000';
+
   const object = await env.FI_FILMS.get(key);
 
   if (!object) {
@@ -86,8 +172,8 @@ async function handleThumb(request, env, matchedPath) {
 
   return new Response(object.body, {
     headers: {
-      'Content-Type': 'image/jpeg',
-      'Cache-Control': 'public, max-age=31536000',
+      'Content-Type': contentType,
+      'Cache-Control': cacheControl,
       ...cors(request),
     },
   });
@@ -250,7 +336,8 @@ function cors(request) {
   return {
     'Access-Control-Allow-Origin': isAllowedOrigin(origin) ? origin : '*',
     'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-    'Access-Control-Allow-Headers': 'Content-Type, Authorization',
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization, Range',
+    'Access-Control-Expose-Headers': 'Content-Range, Content-Length, Accept-Ranges',
   };
 }
 
@@ -268,6 +355,19 @@ function handleOptions(request) {
 // Response helpers
 // ---------------------------------------------------------------------------
 
+// Parse a single "bytes=start-end", "bytes=start-" or "bytes=-suffix" range
+// into the R2 range form; multi-range requests are not supported
+function parseRange(header) {
+  const match = /^bytes=(\d*)-(\d*)$/.exec(header.trim());
+  if (!match || (match[1] === '' && match[2] === '')) return null;
+  if (match[1] === '') return { suffix: Number(match[2]) };
+  const offset = Number(match[1]);
+  if (match[2] === '') return { offset };
+  const end = Number(match[2]);
+  if (end < offset) return null;
+  return { offset, length: end - offset + 1 };
+}
+
 function jsonResponse(data, status = 200, request = null) {
   const headers = { 'Content-Type': 'application/json' };
   if (request) Object.assign(headers, cors(request));